@@ -0,0 +1 @@
+"""Benchmarks for ras_remodeler operations"""
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Benchmark ras_remodeler operations on synthetic plans against local disk and a local S3 stand-in (moto server).
+
+Each operation runs in a new process and records wall time, peak RSS, bytes read/written by the process through file
+system calls and bytes moved over the loopback interface (the traffic to the S3 stand-in). Results are saved as JSON
+and can be compared between versions:
+
+    python -m benchmarks.run_benchmarks run --output before.json
+    python -m benchmarks.run_benchmarks run --output after.json
+    python -m benchmarks.run_benchmarks compare before.json after.json
+
+The profiles command compares the write profiles of hdf_util (file size, write time and read time by access pattern):
+
+    python -m benchmarks.run_benchmarks profiles --output profiles.json
+"""
+from contextlib import ExitStack
+from typing import Callable, Dict, List, Union
+import json
+import random
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import click
+from benchmarks.synthetic import hydrograph_name, make_synthetic_csv, make_synthetic_plan
+
+S3_BUCKET = "ras-remodeler-benchmarks"
+RESULTS_DATASET = "Results/Unsteady/Output/Output Blocks/Base Output/Unsteady Time Series/Flow"
+# files created by the setup of an operation, removed after the operation is measured (see run_case)
+SETUP_FILES = ExitStack()
+
+
+def read_proc_io() -> Dict[str, int]:
+    """Bytes read and written by this process through system calls (files and sockets). Empty if unsupported."""
+    try:
+        with open("/proc/self/io", 'r', encoding='utf-8') as proc_io:
+            fields = dict(line.split(': ') for line in proc_io.read().splitlines())
+        return {'read': int(fields['rchar']), 'written': int(fields['wchar'])}
+    except OSError:
+        return {}
+
+
+def read_loopback_bytes() -> Union[int, None]:
+    """Bytes received on the loopback interface by all processes, which is the traffic to the local S3 stand-in.
+    None if unsupported."""
+    try:
+        with open("/proc/net/dev", 'r', encoding='utf-8') as net_dev:
+            for line in net_dev:
+                interface, _, counters = line.partition(':')
+                if interface.strip() == 'lo':
+                    return int(counters.split()[0])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> None:
+    """Reset the peak RSS of this process so setup is not measured (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", 'w', encoding='utf-8') as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def read_peak_rss_mb() -> float:
+    """Peak RSS of this process in MiB"""
+    try:
+        with open("/proc/self/status", 'r', encoding='utf-8') as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def prepare_get_temp_file(case: Dict[str, str]) -> Callable[[], None]:
+    """Download the plan"""
+    from fs_util import get_temp_file  # pylint: disable=import-outside-toplevel
+    return lambda: os.remove(get_temp_file(case['plan_uri']))
+
+
+def prepare_put_file(case: Dict[str, str]) -> Callable[[], None]:
+    """Upload the plan"""
+    from fs_util import put_file  # pylint: disable=import-outside-toplevel
+    return lambda: put_file(case['local_plan'], case['dst_prefix'] + "put_file.hdf")
+
+
+def prepare_copy_hdf(case: Dict[str, str]) -> Callable[[], None]:
+    """Copy the plan without Results"""
+    from hdf_util import copy_hdf  # pylint: disable=import-outside-toplevel
+    return lambda: copy_hdf(case['plan_uri'], case['dst_prefix'] + "copy_hdf.hdf", ["Results"])
+
+
+def prepare_copy_hdf_range_read(case: Dict[str, str]) -> Callable[[], None]:
+    """Copy the plan without Results reading byte ranges"""
+    from hdf_util import copy_hdf  # pylint: disable=import-outside-toplevel
+    return lambda: copy_hdf(case['plan_uri'], case['dst_prefix'] + "copy_hdf_range_read.hdf", ["Results"],
+                            range_read=True)
+
+
+def prepare_update_hydrographs(case: Dict[str, str]) -> Callable[[], None]:
+    """Overwrite every hydrograph of a local copy of the plan"""
+    from dss_util import read_csv_timeseries  # pylint: disable=import-outside-toplevel
+    from fs_util import temp_file  # pylint: disable=import-outside-toplevel
+    from hdf_util import update_hydrographs  # pylint: disable=import-outside-toplevel
+    plan_filepath = SETUP_FILES.enter_context(temp_file(case['local_plan']))
+    timeseries = read_csv_timeseries(case['local_csv'])
+    hydrographs = {hydrograph_name(i): timeseries for i in range(int(case['num_hydrographs']))}
+    return lambda: update_hydrographs(plan_filepath, hydrographs)
+
+
+def prepare_read_csv_timeseries(case: Dict[str, str]) -> Callable[[], None]:
+    """Read the hydrograph csv"""
+    from dss_util import read_csv_timeseries  # pylint: disable=import-outside-toplevel
+    return lambda: read_csv_timeseries(case['csv_uri'])
+
+
+OPERATIONS: Dict[str, Callable[[Dict[str, str]], Callable[[], None]]] = {
+    'get_temp_file': prepare_get_temp_file,
+    'put_file': prepare_put_file,
+    'copy_hdf': prepare_copy_hdf,
+    'copy_hdf_range_read': prepare_copy_hdf_range_read,
+    'update_hydrographs': prepare_update_hydrographs,
+    'read_csv_timeseries': prepare_read_csv_timeseries,
+}
+# operations that only touch local files are not repeated for remote targets
+LOCAL_ONLY_OPERATIONS = ['update_hydrographs']
+
+
+def run_case(operation: str, case: Dict[str, str], queue: multiprocessing.Queue) -> None:
+    """Run one operation in this process and put its measurements on the queue"""
+    with SETUP_FILES:
+        run = OPERATIONS[operation](case)
+        reset_peak_rss()
+        io_before = read_proc_io()
+        loopback_before = read_loopback_bytes()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        io_after = read_proc_io()
+        loopback_after = read_loopback_bytes()
+    queue.put({
+        'seconds': seconds,
+        'peak_rss_mb': read_peak_rss_mb(),
+        'bytes_read': io_after['read'] - io_before['read'] if io_before else None,
+        'bytes_written': io_after['written'] - io_before['written'] if io_before else None,
+        'network_bytes': loopback_after - loopback_before if loopback_before is not None else None,
+    })
+
+
+def measure(operation: str, case: Dict[str, str]) -> Dict[str, Union[float, int, None]]:
+    """Run one operation in a new process and return its measurements"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(operation, case, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Benchmark {operation} failed with exit code {process.exitcode}")
+    return queue.get()
+
+
+def start_s3_server():
+    """Start a moto S3 server on a free local port, point S3 clients at it and create the benchmark bucket"""
+    from moto.server import ThreadedMotoServer  # pylint: disable=import-outside-toplevel
+    import fsspec  # pylint: disable=import-outside-toplevel
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint_url = f"http://127.0.0.1:{port}"
+    # picked up by fsspec in this process and the benchmark processes
+    os.environ.update({
+        'AWS_ACCESS_KEY_ID': 'benchmark', 'AWS_SECRET_ACCESS_KEY': 'benchmark', 'AWS_DEFAULT_REGION': 'us-east-1',
+        'FSSPEC_S3_ENDPOINT_URL': endpoint_url, 'AWS_ENDPOINT_URL': endpoint_url})
+    fsspec.config.set_conf_env(fsspec.config.conf)
+    fsspec.filesystem('s3', endpoint_url=endpoint_url).mkdir(S3_BUCKET)
+    return server
+
+
+def git_revision() -> Union[str, None]:
+    """Current git revision of the repository or None"""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def main():
+    """Benchmarks for ras_remodeler operations."""
+
+
+@main.command()
+@click.option('--output', default="benchmark_results.json", help="JSON file to save results to.")
+@click.option('--targets', default="local,s3",
+              help="Comma separated storage targets: local, s3. Defaults to 'local,s3'.")
+@click.option('--operations', default=",".join(OPERATIONS), help="Comma separated operations. Defaults to all.")
+@click.option('--results_mb', type=int, default=100, help="Size of the synthetic Results group in MiB.")
+@click.option('--num_hydrographs', type=int, default=20, help="Number of synthetic flow hydrographs.")
+@click.option('--hydrograph_rows', type=int, default=10000, help="Rows per synthetic hydrograph.")
+@click.option('--repeat', type=int, default=1, help="Number of runs per operation.")
+def run(output: str, targets: str, operations: str, results_mb: int, num_hydrographs: int, hydrograph_rows: int,
+        repeat: int) -> None:
+    """Run benchmarks and save results as JSON."""
+    from fs_util import put_file  # pylint: disable=import-outside-toplevel
+    scratch_dir = tempfile.mkdtemp()
+    server = None
+    params = {'results_mb': results_mb, 'num_hydrographs': num_hydrographs, 'hydrograph_rows': hydrograph_rows}
+    results: List[dict] = []
+    try:
+        local_plan = os.path.join(scratch_dir, "synthetic.p01.hdf")
+        local_csv = os.path.join(scratch_dir, "synthetic.csv")
+        make_synthetic_plan(local_plan, results_mb, num_hydrographs, hydrograph_rows)
+        make_synthetic_csv(local_csv, hydrograph_rows)
+        params['plan_bytes'] = os.path.getsize(local_plan)
+        for target in targets.split(','):
+            if target == 'local':
+                prefix = os.path.join(scratch_dir, "out_")
+            elif target == 's3':
+                server = server or start_s3_server()
+                prefix = f"s3://{S3_BUCKET}/"
+                put_file(local_plan, prefix + "synthetic.p01.hdf")
+                put_file(local_csv, prefix + "synthetic.csv")
+            else:
+                raise click.BadParameter(f"Unknown target {target}", param_hint='--targets')
+            case = {
+                'plan_uri': local_plan if target == 'local' else prefix + "synthetic.p01.hdf",
+                'csv_uri': local_csv if target == 'local' else prefix + "synthetic.csv",
+                'local_plan': local_plan, 'local_csv': local_csv, 'dst_prefix': prefix,
+                'num_hydrographs': str(num_hydrographs)}
+            for operation in operations.split(','):
+                if target != 'local' and operation in LOCAL_ONLY_OPERATIONS:
+                    continue
+                for i in range(repeat):
+                    result = {'operation': operation, 'target': target, 'run': i, **measure(operation, case)}
+                    click.echo(json.dumps(result))
+                    results.append(result)
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump({'revision': git_revision(), 'python': platform.python_version(), 'params': params,
+                   'results': results}, output_file, indent=2)
+    click.echo(f"Saved {len(results)} results to {output}")
+
+
+def read_time_steps(filepath: str, count: int) -> None:
+    """Read all cells at random time steps of the Results dataset, like mapping a time step"""
+    import h5py  # pylint: disable=import-outside-toplevel
+    with h5py.File(filepath, 'r') as file:
+        dataset = file[RESULTS_DATASET]
+        for row in random.Random(0).sample(range(dataset.shape[0]), min(count, dataset.shape[0])):
+            _ = dataset[row]
+
+
+def read_cell_series(filepath: str, count: int) -> None:
+    """Read all time steps of random cells of the Results dataset, like plotting the time series at a cell"""
+    import h5py  # pylint: disable=import-outside-toplevel
+    with h5py.File(filepath, 'r') as file:
+        dataset = file[RESULTS_DATASET]
+        for column in random.Random(0).sample(range(dataset.shape[1]), min(count, dataset.shape[1])):
+            _ = dataset[:, column]
+
+
+def read_hydrographs(filepath: str) -> None:
+    """Read every flow hydrograph, like HEC-RAS reading its boundary conditions"""
+    import h5py  # pylint: disable=import-outside-toplevel
+    from hdf_util import FLOW_HYDROGRAPHS_GROUP  # pylint: disable=import-outside-toplevel
+    with h5py.File(filepath, 'r') as file:
+        for dataset in file[FLOW_HYDROGRAPHS_GROUP].values():
+            _ = dataset[()]
+
+
+def timed(run: Callable[[], None]) -> float:
+    """Wall time of a call in seconds"""
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+@main.command()
+@click.option('--output', default="profile_results.json", help="JSON file to save results to.")
+@click.option('--profiles', default=None, help="Comma separated write profiles. Defaults to all.")
+@click.option('--results_mb', type=int, default=100, help="Size of the synthetic Results group in MiB.")
+@click.option('--num_hydrographs', type=int, default=20, help="Number of synthetic flow hydrographs.")
+@click.option('--hydrograph_rows', type=int, default=10000, help="Rows per synthetic hydrograph.")
+@click.option('--reads', type=int, default=20, help="Number of time steps and cells read per access pattern.")
+@click.option('--noise', is_flag=True,
+              help="Fill the Results group with incompressible noise instead of smooth time series.")
+def profiles(output: str, profiles: Union[str, None],  # pylint: disable=redefined-outer-name
+             results_mb: int, num_hydrographs: int, hydrograph_rows: int, reads: int, noise: bool) -> None:
+    """Compare the write profiles of hdf_util by file size, write time and read time by access pattern.
+
+    Each profile repacks a copy of a synthetic plan, then the copy is read by time step (all cells of random time
+    steps), by cell (all time steps of random cells) and by hydrograph (every flow hydrograph). Reads go through the
+    page cache, so read times measure decompression and chunk layout rather than storage.
+    """
+    from hdf_util import WRITE_PROFILES, repack_hdf  # pylint: disable=import-outside-toplevel
+    scratch_dir = tempfile.mkdtemp()
+    params = {'results_mb': results_mb, 'num_hydrographs': num_hydrographs, 'hydrograph_rows': hydrograph_rows,
+              'reads': reads, 'noise': noise}
+    results: List[dict] = []
+    try:
+        local_plan = os.path.join(scratch_dir, "synthetic.p01.hdf")
+        make_synthetic_plan(local_plan, results_mb, num_hydrographs, hydrograph_rows, smooth=not noise)
+        params['plan_bytes'] = os.path.getsize(local_plan)
+        for profile in profiles.split(',') if profiles else WRITE_PROFILES:
+            filepath = os.path.join(scratch_dir, f"{profile}.hdf")
+            shutil.copyfile(local_plan, filepath)
+            # the lambdas are called right away, so they use the filepath and profile of this iteration
+            # pylint: disable=cell-var-from-loop
+            result = {
+                'profile': profile,
+                'write_seconds': timed(lambda: repack_hdf(filepath, profile)),
+                'bytes': os.path.getsize(filepath),
+                'time_step_seconds': timed(lambda: read_time_steps(filepath, reads)),
+                'cell_series_seconds': timed(lambda: read_cell_series(filepath, reads)),
+                'hydrographs_seconds': timed(lambda: read_hydrographs(filepath)),
+            }
+            os.remove(filepath)
+            click.echo(json.dumps(result))
+            results.append(result)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump({'revision': git_revision(), 'python': platform.python_version(), 'params': params,
+                   'results': results}, output_file, indent=2)
+    click.echo(f"{'profile':<22}{'MiB':>10}{'write s':>10}{'time step s':>14}{'cell s':>10}{'hydrographs s':>16}")
+    for result in results:
+        click.echo(f"{result['profile']:<22}{result['bytes'] / 2**20:>10.1f}{result['write_seconds']:>10.3f}"
+                   f"{result['time_step_seconds']:>14.3f}{result['cell_series_seconds']:>10.3f}"
+                   f"{result['hydrographs_seconds']:>16.3f}")
+    click.echo(f"Saved {len(results)} results to {output}")
+
+
+@main.command()
+@click.argument('baseline')
+@click.argument('candidate')
+def compare(baseline: str, candidate: str) -> None:
+    """Compare mean wall time, peak RSS and bytes moved of two result files."""
+    def means(path: str) -> Dict[tuple, Dict[str, float]]:
+        with open(path, 'r', encoding='utf-8') as result_file:
+            results = json.load(result_file)['results']
+        grouped: Dict[tuple, List[dict]] = {}
+        for result in results:
+            grouped.setdefault((result['operation'], result['target']), []).append(result)
+        return {key: {metric: sum(run[metric] or 0 for run in runs) / len(runs)
+                      for metric in ['seconds', 'peak_rss_mb', 'bytes_read', 'bytes_written', 'network_bytes']}
+                for key, runs in grouped.items()}
+
+    baseline_means = means(baseline)
+    candidate_means = means(candidate)
+    click.echo(f"{'operation':<24}{'target':<8}{'seconds':>22}{'peak RSS MiB':>22}{'MiB moved':>22}")
+    for key in sorted(set(baseline_means) & set(candidate_means)):
+        old, new = baseline_means[key], candidate_means[key]
+        old_moved = (old['bytes_read'] + old['bytes_written'] + old['network_bytes']) / 2**20
+        new_moved = (new['bytes_read'] + new['bytes_written'] + new['network_bytes']) / 2**20
+        click.echo(f"{key[0]:<24}{key[1]:<8}"
+                   f"{old['seconds']:>10.3f} ->{new['seconds']:>9.3f}"
+                   f"{old['peak_rss_mb']:>10.1f} ->{new['peak_rss_mb']:>9.1f}"
+                   f"{old_moved:>10.1f} ->{new_moved:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
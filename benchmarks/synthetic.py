@@ -0,0 +1,77 @@
+"""Synthetic HEC-RAS plan HDF files and hydrographs for benchmarks"""
+from datetime import datetime
+import h5py
+import numpy as np
+import pandas as pd
+from hdf_util import FLOW_HYDROGRAPHS_GROUP, format_date_string_hydrograph_attrib
+
+START_DATE = datetime(2000, 1, 1)
+
+
+def hydrograph_name(index: int) -> str:
+    """Name of the synthetic hydrograph at an index"""
+    return f"River: Synthetic  Reach: Reach {index}  RS: {index * 100}"
+
+
+def make_synthetic_plan(filepath: str, results_mb: int = 100, num_hydrographs: int = 20,
+                        hydrograph_rows: int = 1000, smooth: bool = False) -> None:
+    """Create a plan HDF file shaped like a HEC-RAS plan with flow hydrographs and a Results group.
+
+    Args:
+        filepath (str): local filepath to create
+        results_mb (int, optional): size of the incompressible Results data in MiB. Defaults to 100.
+        num_hydrographs (int, optional): number of flow hydrographs. Defaults to 20.
+        hydrograph_rows (int, optional): rows per flow hydrograph (hourly). Defaults to 1000.
+        smooth (bool, optional): If true, the Results data changes gradually in time like model output and compresses
+        like it, otherwise it is incompressible noise. Defaults to False.
+    """
+    rng = np.random.default_rng(0)
+    end_date = pd.Timestamp(START_DATE) + pd.Timedelta(hours=hydrograph_rows - 1)
+    with h5py.File(filepath, 'w') as file:
+        file.attrs['File Type'] = np.bytes_("HEC-RAS Results")
+        for i in range(num_hydrographs):
+            data = np.column_stack((
+                np.arange(hydrograph_rows, dtype=np.float32) / 24,
+                rng.uniform(100, 1000, hydrograph_rows).astype(np.float32)))
+            dataset = file.create_dataset(FLOW_HYDROGRAPHS_GROUP + hydrograph_name(i), data=data,
+                                          maxshape=data.shape, compression='gzip', compression_opts=1)
+            dataset.attrs['Coordinates'] = np.array([0.0, 0.0])
+            dataset.attrs['Data Type'] = np.bytes_("Flow Hydrograph")
+            dataset.attrs['Interval'] = np.bytes_("Days")
+            dataset.attrs['Node Index'] = np.int32(i)
+            dataset.attrs['RS'] = np.bytes_(str(i * 100))
+            dataset.attrs['Reach'] = np.bytes_(f"Reach {i}")
+            dataset.attrs['River'] = np.bytes_("Synthetic")
+            dataset.attrs['Start Date'] = np.bytes_(format_date_string_hydrograph_attrib(START_DATE))
+            dataset.attrs['End Date'] = np.bytes_(format_date_string_hydrograph_attrib(end_date))
+        file.create_dataset("Geometry/Cross Sections/Attributes", data=np.arange(num_hydrographs * 100))
+        plan_information = file.create_group("Plan Data/Plan Information")
+        plan_information.attrs['Simulation Start Time'] = np.bytes_(format_date_string_hydrograph_attrib(START_DATE))
+        plan_information.attrs['Simulation End Time'] = np.bytes_(format_date_string_hydrograph_attrib(end_date))
+        rows = max(1, results_mb * 2**20 // (4 * 1000))
+        results = file.create_dataset("Results/Unsteady/Output/Output Blocks/Base Output/Unsteady Time Series/Flow",
+                                      shape=(rows, 1000), dtype=np.float32, chunks=(min(rows, 256), 1000))
+        level = rng.uniform(100, 1000, 1000)
+        for start in range(0, rows, 256):
+            stop = min(rows, start + 256)
+            if smooth:
+                # random walk of each cell in time, rounded like values written with limited precision
+                steps = np.cumsum(rng.normal(0, 0.05, (stop - start, 1000)), axis=0)
+                results[start:stop] = np.round(level + steps, 2).astype(np.float32)
+                level = level + steps[-1]
+            else:
+                results[start:stop] = rng.random((stop - start, 1000), dtype=np.float32)
+
+
+def make_synthetic_csv(filepath: str, rows: int = 1000) -> None:
+    """Create an hourly hydrograph csv file with 'time' and 'value' columns.
+
+    Args:
+        filepath (str): local filepath to create
+        rows (int, optional): number of rows. Defaults to 1000.
+    """
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        'time': pd.date_range(START_DATE, periods=rows, freq=pd.Timedelta(hours=1)),
+        'value': rng.uniform(100, 1000, rows).astype(np.float32)
+    }).to_csv(filepath, index=False)
@@ -0,0 +1,235 @@
+"""
+Content-addressed local cache for remote files.
+Cached files are keyed by URI and the file's ETag, size and modified time, so a changed remote file is a cache miss.
+The cache is limited to a size budget and the least recently used files are evicted first. Cache state is shared
+between processes on one node through file locks in the cache directory.
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Union
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+DEFAULT_CACHE_MAX_BYTES = 50 * 2**30
+
+
+class FileCache:
+    """On-disk LRU cache of remote files.
+
+    Args:
+        cache_dir (str): local directory to store cached files in. Created if it does not exist.
+        max_bytes (int, optional): size budget of the cache. Defaults to 50 GiB.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.locks_dir = os.path.join(cache_dir, "locks")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    def get_file(self, src_uri: str, dst_filepath: str, download: Callable[[str, str], None]) -> bool:
+        """Copy a remote file to a local filepath through the cache. On a miss the file is downloaded into the cache
+        first with the download function.
+
+        Args:
+            src_uri (str): URI to the source file.
+            dst_filepath (str): local filepath to copy the file to.
+            download (Callable[[str, str], None]): function copying a URI to a local filepath, e.g. fs_util.put_file.
+
+        Returns:
+            bool: True if the file was a cache hit.
+        """
+        key = self.key(src_uri)
+        entry_filepath = os.path.join(self.objects_dir, key)
+        # the key lock stops processes downloading the same file at the same time
+        with self._lock(os.path.join(self.locks_dir, key + ".lock")):
+            if self._copy_entry(entry_filepath, dst_filepath):
+                self._record(hits=1)
+                return True
+            part_filepath = os.path.join(self.objects_dir, f".{key}.{uuid.uuid4()}.part")
+            try:
+                download(src_uri, part_filepath)
+                if os.path.getsize(part_filepath) > self.max_bytes:
+                    # too large to ever fit in the cache
+                    os.replace(part_filepath, dst_filepath)
+                    self._record(misses=1)
+                    return False
+                os.replace(part_filepath, entry_filepath)
+            finally:
+                if os.path.exists(part_filepath):
+                    os.remove(part_filepath)
+            shutil.copyfile(entry_filepath, dst_filepath)
+        self._record(misses=1)
+        self.evict()
+        return False
+
+    def key(self, src_uri: str) -> str:
+        """Get the cache key of a URI (see content_key)."""
+        return content_key(src_uri)
+
+    def read_index(self, src_uri: str, kind: str) -> Any:
+        """Read a JSON index (e.g. a DSS catalog) stored for the current content of a file.
+
+        Args:
+            src_uri (str): URI to the file the index describes.
+            kind (str): name of the kind of index.
+
+        Returns:
+            Any: the index data or None if there is no index for the current content of the file.
+        """
+        index_filepath = os.path.join(self.cache_dir, "indexes", kind, self.key(src_uri) + ".json")
+        try:
+            with open(index_filepath, 'r', encoding='utf-8') as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return None
+
+    def write_index(self, src_uri: str, kind: str, data: Any) -> None:
+        """Store a JSON index (e.g. a DSS catalog) for the current content of a file.
+
+        Args:
+            src_uri (str): URI to the file the index describes.
+            kind (str): name of the kind of index.
+            data (Any): JSON serializable index data.
+        """
+        index_dir = os.path.join(self.cache_dir, "indexes", kind)
+        os.makedirs(index_dir, exist_ok=True)
+        part_filepath = os.path.join(index_dir, f".{uuid.uuid4()}.part")
+        with open(part_filepath, 'w', encoding='utf-8') as index_file:
+            json.dump(data, index_file)
+        os.replace(part_filepath, os.path.join(index_dir, self.key(src_uri) + ".json"))
+
+    def evict(self) -> int:
+        """Remove least recently used files until the cache is within its size budget.
+
+        Returns:
+            int: number of files removed.
+        """
+        with self._lock(os.path.join(self.cache_dir, "cache.lock")):
+            entries = []
+            for entry in os.scandir(self.objects_dir):
+                if not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            evictions = 0
+            # access time is tracked with mtime, which is updated on every hit
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evictions += 1
+        if evictions:
+            self._record(evictions=evictions)
+        return evictions
+
+    def stats(self) -> Dict[str, int]:
+        """Get cumulative cache statistics of all processes using the cache directory.
+
+        Returns:
+            Dict[str, int]: 'hits', 'misses', 'evictions', 'entries' and 'bytes' of the cache.
+        """
+        with self._lock(os.path.join(self.cache_dir, "cache.lock")):
+            stats = self._read_stats()
+        sizes = [entry.stat().st_size for entry in os.scandir(self.objects_dir) if not entry.name.startswith('.')]
+        stats['entries'] = len(sizes)
+        stats['bytes'] = sum(sizes)
+        return stats
+
+    def clear(self) -> None:
+        """Remove all cached files."""
+        with self._lock(os.path.join(self.cache_dir, "cache.lock")):
+            for entry in os.scandir(self.objects_dir):
+                os.remove(entry.path)
+
+    def _copy_entry(self, entry_filepath: str, dst_filepath: str) -> bool:
+        """Copy a cached file to dst_filepath and mark it as recently used. Returns False if it is not cached."""
+        try:
+            with open(entry_filepath, 'rb') as entry_file, open(dst_filepath, 'wb') as dst_file:
+                shutil.copyfileobj(entry_file, dst_file)
+        except FileNotFoundError:
+            return False
+        try:
+            os.utime(entry_filepath)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _read_stats(self) -> Dict[str, int]:
+        stats_filepath = os.path.join(self.cache_dir, "stats.json")
+        if not os.path.exists(stats_filepath):
+            return {'hits': 0, 'misses': 0, 'evictions': 0}
+        with open(stats_filepath, 'r', encoding='utf-8') as stats_file:
+            return json.load(stats_file)
+
+    def _record(self, hits: int = 0, misses: int = 0, evictions: int = 0) -> None:
+        """Add to the cumulative cache statistics"""
+        with self._lock(os.path.join(self.cache_dir, "cache.lock")):
+            stats = self._read_stats()
+            stats['hits'] += hits
+            stats['misses'] += misses
+            stats['evictions'] += evictions
+            with open(os.path.join(self.cache_dir, "stats.json"), 'w', encoding='utf-8') as stats_file:
+                json.dump(stats, stats_file)
+
+    @staticmethod
+    @contextmanager
+    def _lock(lock_filepath: str) -> Iterator[None]:
+        """Hold an exclusive lock on a lock file shared between processes"""
+        with open(lock_filepath, 'a', encoding='utf-8') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def content_key(src_uri: str) -> str:
+    """Get a key identifying the current content of a file from its URI, ETag, size and modified time.
+
+    Args:
+        src_uri (str): URI to the file.
+
+    Returns:
+        str: hex digest identifying the current content of the file.
+    """
+    # imported here since the CLI imports this module on startup
+    import fsspec  # pylint: disable=import-outside-toplevel
+    fs, path = fsspec.core.url_to_fs(src_uri)
+    info = fs.info(path)
+    etag = info.get('ETag', info.get('etag', ''))
+    mtime = info.get('LastModified', info.get('last_modified', info.get('mtime', '')))
+    identity = f"{src_uri}|{etag}|{info.get('size', '')}|{mtime}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+_CACHE: Union[FileCache, None] = None
+
+
+def configure_cache(cache_dir: Union[str, None], max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> Union[FileCache, None]:
+    """Enable the cache used by fs_util.get_temp_file for remote files, or disable it if cache_dir is None.
+
+    Args:
+        cache_dir (Union[str, None]): local directory to store cached files in or None to disable caching.
+        max_bytes (int, optional): size budget of the cache. Defaults to 50 GiB.
+
+    Returns:
+        Union[FileCache, None]: the configured cache.
+    """
+    global _CACHE  # pylint: disable=global-statement
+    _CACHE = FileCache(cache_dir, max_bytes) if cache_dir else None
+    return _CACHE
+
+
+def get_cache() -> Union[FileCache, None]:
+    """Get the configured cache or None if caching is disabled."""
+    return _CACHE
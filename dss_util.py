@@ -1,14 +1,27 @@
 """Utility functions for DSS files"""
+from fnmatch import fnmatchcase
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple, Union
 import os
-from pydsstools.heclib.dss import HecDss
+import threading
 import pandas as pd
 import numpy as np
-from fs_util import get_temp_file
+import fsspec
+from cache_util import get_cache
+from fs_util import temp_file
+from metrics_util import stage
+from timeseries_util import Timeseries
 
+# pydsstools and pyarrow are only imported by the functions that use them so reading one file type doesn't load the
+# libraries for the others.
+# pylint: disable=import-outside-toplevel
 
-def read_dss_timeseries(dss_path: str, irregular: bool = False) -> pd.DataFrame:
-    """Read a path from a dss file pointing to timeseries data into a pandas dataframe. Time column is 'time' and value
-    column is 'value'.
+# the HEC-DSS library is not thread safe, so dss files are downloaded concurrently but opened and read one at a time
+_DSS_LOCK = threading.Lock()
+
+
+def read_dss_timeseries(dss_path: str, irregular: bool = False) -> Timeseries:
+    """Read a path from a dss file pointing to timeseries data into a Timeseries.
 
     Args:
         dss_path (str): DSS file and pathname formated as shown below:
@@ -21,25 +34,196 @@ def read_dss_timeseries(dss_path: str, irregular: bool = False) -> pd.DataFrame:
         irregular (bool, optional): is timeseries data irregular? Defaults to False.
 
     Returns:
-        pd.DataFrame: Dataframe with time column 'time' with datetime entries and value column 'value' with float
-        entries.
+        Timeseries: datetime64 times and float32 values
     """
     uri, pathname = dss_path.rsplit(':', 1)
-    dss_filepath = get_temp_file(uri)
-    timeseries = pd.DataFrame(columns=['time', 'value'])
-    with HecDss.Open(dss_filepath) as fid:
-        dss_ts = fid.read_ts(pathname, regular=not irregular)
-        timeseries['time'] = dss_ts.pytimes
-        timeseries['value'] = dss_ts.values
-    # delete temp file
-    os.remove(dss_filepath)
-    return timeseries
+    return read_dss_timeseries_many(uri, [pathname], irregular=irregular)[pathname]
 
 
-def read_csv_timeseries(csv_uri: str, sep: str = ',') -> pd.DataFrame:
-    """Read a csv file pointing to timeseries data into a pandas dataframe. Time column is 'time' and value
-    column is 'value'. CSV file should have headers and the first column should be datetime format parsable by pandas
-    read_csv function. (e.g. 2018-01-01 01:01:01.000000001 -0500) and the second column should be numeric values.
+def read_dss_timeseries_many(dss_uri: str, pathnames: Union[List[str], str],
+                             irregular: bool = False) -> Dict[str, Timeseries]:
+    """Read many paths pointing to timeseries data from a dss file into Timeseries. The dss file is downloaded and
+    opened once. Pathnames can be patterns with '*' and '?' wildcards, which are matched against the dss catalog with
+    the D (date block) part removed.
+
+    Args:
+        dss_uri (str): URI to the dss file.
+            For local file use:
+             - <filepath>
+            For S3 use:
+             - s3://<bucket_name>/<key_name>
+            For Azure use:
+             - abfs://<container_name>/<key_name>
+        pathnames (Union[List[str], str]): pathname, pathname pattern or list of them (e.g. '/A/*/FLOW//1HOUR/*/').
+        irregular (bool, optional): is timeseries data irregular? Defaults to False.
+
+    Returns:
+        Dict[str, Timeseries]: mapping of pathname to datetime64 times and float32 values
+    """
+    from pydsstools.heclib.dss import HecDss
+    if isinstance(pathnames, str):
+        pathnames = [pathnames]
+    with temp_file(dss_uri) as dss_filepath:
+        with _DSS_LOCK, stage('read_dss', uri=dss_uri) as current, HecDss.Open(dss_filepath) as fid:
+            if any(_is_pathname_pattern(pathname) for pathname in pathnames):
+                catalog = _read_catalog(dss_uri, fid)
+                pathnames = _match_pathnames(catalog, pathnames)
+            result = {}
+            for pathname in pathnames:
+                dss_ts = fid.read_ts(pathname, regular=not irregular)
+                result[pathname] = Timeseries(np.array(dss_ts.pytimes, dtype='datetime64[ns]'), dss_ts.values)
+            current.bytes_read = os.path.getsize(dss_filepath)
+            current.labels['pathnames'] = len(result)
+            current.labels['rows'] = sum(len(timeseries) for timeseries in result.values())
+    return result
+
+
+def read_dss_catalog(dss_uri: str) -> List[str]:
+    """Read the pathnames in a dss file with the D (date block) part removed. If a cache is enabled with
+    cache_util.configure_cache, the catalog is stored in the cache and reused until the dss file changes.
+
+    Args:
+        dss_uri (str): URI to the dss file.
+
+    Returns:
+        List[str]: sorted unique pathnames
+    """
+    cache = get_cache()
+    catalog = cache.read_index(dss_uri, "dss_catalog") if cache is not None else None
+    if catalog is not None:
+        return catalog
+    from pydsstools.heclib.dss import HecDss
+    with temp_file(dss_uri) as dss_filepath:
+        with _DSS_LOCK, HecDss.Open(dss_filepath) as fid:
+            return _read_catalog(dss_uri, fid)
+
+
+def _read_catalog(dss_uri: str, fid: Any) -> List[str]:
+    """Read the condensed catalog of an open dss file, using and updating the cached catalog if a cache is enabled"""
+    cache = get_cache()
+    catalog = cache.read_index(dss_uri, "dss_catalog") if cache is not None else None
+    if catalog is None:
+        catalog = sorted({_remove_date_part(pathname) for pathname in fid.getPathnameList('/*/*/*/*/*/*/')})
+        if cache is not None:
+            cache.write_index(dss_uri, "dss_catalog", catalog)
+    return catalog
+
+
+def _remove_date_part(pathname: str) -> str:
+    """Remove the D (date block) part of a pathname e.g. /A/B/C/01JAN2000/E/F/ -> /A/B/C//E/F/"""
+    parts = pathname.split('/')
+    if len(parts) == 8:
+        parts[4] = ''
+    return '/'.join(parts)
+
+
+def _is_pathname_pattern(pathname: str) -> bool:
+    return '*' in pathname or '?' in pathname
+
+
+def _match_pathnames(catalog: List[str], pathnames: List[str]) -> List[str]:
+    """Expand pathname patterns against a catalog, keeping pathnames without wildcards as they are"""
+    matches = []
+    for pathname in pathnames:
+        if _is_pathname_pattern(pathname):
+            pattern = _remove_date_part(pathname).upper()
+            matches.extend(entry for entry in catalog if fnmatchcase(entry.upper(), pattern))
+        else:
+            matches.append(pathname)
+    # remove duplicates while keeping order
+    return list(dict.fromkeys(matches))
+
+
+def iter_dss_grids(dss_uri: str, pathname_pattern: str,
+                   batch_rows: int = 64) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Read the gridded records (e.g. gridded precipitation) matching a pathname pattern from a dss file in batches
+    of rows, so only one batch of grids is held in memory at a time. Records are ordered by the end time of their
+    interval (E part) and each grid is flattened to a row of cell values. Masked (no data) cells are NaN.
+
+    Args:
+        dss_uri (str): URI to the dss file.
+        pathname_pattern (str): pathname pattern with '*' and '?' wildcards (e.g. '/SHG/BASIN/PRECIP/*/*/*/')
+        batch_rows (int, optional): grids per batch. Defaults to 64.
+
+    Raises:
+        ValueError: if no records match the pattern
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: datetime64 array of times and float32 array of shape (times, cells)
+    """
+    from pydsstools.heclib.dss import HecDss
+    # stages are closed before each batch is yielded, so they are not open while the consumer runs its own stages
+    with temp_file(dss_uri) as dss_filepath:
+        with stage('read_dss_grids', uri=dss_uri) as current:
+            with _DSS_LOCK, HecDss.Open(dss_filepath) as fid:
+                catalog = fid.getPathnameList('/*/*/*/*/*/*/')
+            pattern = pathname_pattern.upper()
+            pathnames = [pathname for pathname in catalog if fnmatchcase(pathname.upper(), pattern)]
+            if not pathnames:
+                raise ValueError(f"No gridded records in {dss_uri} match {pathname_pattern}")
+            pathnames.sort(key=lambda pathname: _parse_dss_grid_time(pathname.split('/')[5]))
+            current.bytes_read = os.path.getsize(dss_filepath)
+            current.labels['rows'] = len(pathnames)
+        for batch_start in range(0, len(pathnames), batch_rows):
+            batch = pathnames[batch_start:batch_start + batch_rows]
+            with stage('read_dss_grids_batch', uri=dss_uri, rows=len(batch)):
+                times = np.array([_parse_dss_grid_time(pathname.split('/')[5]) for pathname in batch],
+                                 dtype='datetime64[ns]')
+                # the lock is released before the batch is yielded, so other threads can read dss files while the
+                # consumer writes the batch
+                with _DSS_LOCK, HecDss.Open(dss_filepath) as fid:
+                    values = np.stack([np.ma.filled(np.ma.asarray(fid.read_grid(pathname).read(), dtype=np.float32),
+                                                    np.nan).ravel() for pathname in batch])
+            yield times, values
+
+
+def _parse_dss_grid_time(text: str) -> datetime:
+    """Parse the time of a gridded record pathname part e.g. 01JAN2000:2400 -> 2000-01-02 00:00"""
+    day, _, time = text.partition(':')
+    time = time or '0000'
+    if time == '2400':
+        return datetime.strptime(day, '%d%b%Y') + timedelta(days=1)
+    return datetime.strptime(f"{day} {time}", '%d%b%Y %H%M')
+
+
+def iter_parquet_grid(parquet_uri: str, batch_rows: int = 64) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Read gridded data from a parquet file with a 'time' column and a column of values per cell in batches of
+    rows, so only one batch is held in memory at a time.
+
+    Args:
+        parquet_uri (str): URI to the parquet file.
+        batch_rows (int, optional): rows per batch. Defaults to 64.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: datetime64 array of times and float32 array of shape (times, cells)
+    """
+    import pyarrow.parquet as pq
+    # stages are closed before each batch is yielded, so they are not open while the consumer runs its own stages
+    with fsspec.open(parquet_uri, 'rb') as parquet_file:
+        with stage('read_parquet_grid', uri=parquet_uri) as current:
+            parquet = pq.ParquetFile(parquet_file)
+            cells = [name for name in parquet.schema_arrow.names if name != 'time']
+            current.labels['rows'] = parquet.metadata.num_rows
+            current.labels['cells'] = len(cells)
+            batches = parquet.iter_batches(batch_size=batch_rows, columns=['time'] + cells)
+        while True:
+            with stage('read_parquet_grid_batch', uri=parquet_uri, rows=0) as current:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                current.labels['rows'] = batch.num_rows
+                current.bytes_read = batch.nbytes
+                times = batch.column('time').to_numpy(zero_copy_only=False).astype('datetime64[ns]')
+                values = np.column_stack([batch.column(cell).to_numpy(zero_copy_only=False).astype(np.float32)
+                                          for cell in cells])
+            yield times, values
+
+
+def read_csv_timeseries(csv_uri: str, sep: str = ',', datetime_format: Union[str, None] = None,
+                        engine: str = 'pyarrow') -> Timeseries:
+    """Read a csv file pointing to timeseries data into a Timeseries. CSV file should have headers and the first column
+    should be datetime format parsable by pandas read_csv function. (e.g. 2018-01-01 01:01:01.000000001 -0500) and the
+    second column should be numeric values. Times with UTC offsets are kept as local times.
 
     Args:
         csv_uri (str): uri to csv.
@@ -50,8 +234,162 @@ def read_csv_timeseries(csv_uri: str, sep: str = ',') -> pd.DataFrame:
             For Azure use:
              - abfs://<container_name>/<key_name>
         sep (str): csv separator. Default is ','.
+        datetime_format (Union[str, None]): strptime format of the time column (e.g. '%Y-%m-%d %H:%M:%S'). Defaults
+        to None, which parses ISO 8601 times.
+        engine (str): 'pyarrow' for the multithreaded pyarrow csv reader or 'pandas'. Defaults to 'pyarrow'. The
+        pandas reader is used if pyarrow can't parse the time column (e.g. times with UTC offsets).
+
+    Returns:
+        Timeseries: datetime64 times and float32 values
+    """
+    with stage('read_csv', uri=csv_uri, engine=engine) as current:
+        timeseries = None
+        if engine == 'pyarrow':
+            import pyarrow as pa
+            from pyarrow import csv as pa_csv
+            convert_options = pa_csv.ConvertOptions(
+                column_types={'time': pa.timestamp('ns'), 'value': pa.float32()},
+                timestamp_parsers=[datetime_format] if datetime_format else None)
+            try:
+                with fsspec.open(csv_uri, 'rb') as csv_file:
+                    table = pa_csv.read_csv(
+                        csv_file,
+                        read_options=pa_csv.ReadOptions(column_names=['time', 'value'], skip_rows=1),
+                        parse_options=pa_csv.ParseOptions(delimiter=sep),
+                        convert_options=convert_options)
+                    current.bytes_read = csv_file.tell()
+                timeseries = Timeseries(table.column('time').to_numpy(), table.column('value').to_numpy())
+            except pa.ArrowInvalid:
+                current.labels['engine'] = 'pandas'
+        if timeseries is None:
+            frame = pd.read_csv(csv_uri, sep=sep, header=0, names=['time', 'value'],
+                                dtype={'value': np.dtype('float32')})
+            frame['time'] = pd.to_datetime(frame['time'], format=datetime_format)
+            timeseries = Timeseries.from_frame(frame)
+        current.labels['rows'] = len(timeseries)
+    return timeseries
+
+
+def read_parquet_timeseries(parquet_path: str, start: Union[datetime, None] = None,
+                            end: Union[datetime, None] = None) -> Timeseries:
+    """Read a parquet file pointing to timeseries data into a Timeseries.
+
+    Args:
+        parquet_path (str): parquet file and optional value column name formated as shown below. If no column is given
+        the 'value' column is read. The time column must be named 'time'.
+            For local file use:
+             - <filepath>[:<column>]
+            For S3 use:
+             - s3://<bucket_name>/<key_name>[:<column>]
+            For Azure use:
+             - abfs://<container_name>/<key_name>[:<column>]
+        start (Union[datetime, None], optional): read only the window from start to end and the samples next to it
+        (see read_parquet_timeseries_many). Defaults to None.
+        end (Union[datetime, None], optional): end of the window. Defaults to None.
+
+    Returns:
+        Timeseries: datetime64 times and float32 values
+    """
+    uri, column = split_parquet_path(parquet_path)
+    return read_parquet_timeseries_many(uri, [column], start=start, end=end, keep_neighbors=True)[column]
+
+
+def read_parquet_timeseries_many(parquet_uri: str, columns: List[str],
+                                 start: Union[datetime, None] = None,
+                                 end: Union[datetime, None] = None,
+                                 keep_neighbors: bool = False) -> Dict[str, Timeseries]:
+    """Read many value columns sharing the 'time' column of a parquet file into Timeseries, which share one array of
+    times. Only the 'time' and requested columns are read, and only row groups overlapping start/end if given.
+
+    Args:
+        parquet_uri (str): URI to the parquet file.
+        columns (List[str]): value columns to read
+        start (Union[datetime, None], optional): earliest time to read. Defaults to None.
+        end (Union[datetime, None], optional): latest time to read. Defaults to None.
+        keep_neighbors (bool, optional): also read the last time before start and the first time after end, which
+        values at start and end are interpolated from when a hydrograph is resampled. Defaults to False.
 
     Returns:
-        pd.DataFrame: _description_
+        Dict[str, Timeseries]: mapping of column to datetime64 times and float32 values
     """
-    return pd.read_csv(csv_uri, sep=sep, parse_dates=['time'], header=0, names=['time', 'value'], dtype={'value': np.dtype('float32')})
+    import pyarrow.parquet as pq
+    unique_columns = list(dict.fromkeys(columns))
+    start = None if start is None else _to_datetime64(start)
+    end = None if end is None else _to_datetime64(end)
+    with stage('read_parquet', uri=parquet_uri, columns=len(unique_columns)) as current:
+        parquet_fs, parquet_path = fsspec.core.url_to_fs(parquet_uri)
+        with parquet_fs.open(parquet_path, 'rb') as parquet_file:
+            parquet = pq.ParquetFile(parquet_file)
+            row_groups = _window_row_groups(parquet.metadata, start, end, keep_neighbors)
+            table = parquet.read_row_groups(row_groups, columns=['time'] + unique_columns)
+        # convert the times once so all the columns share them
+        times = np.asarray(table.column('time').to_numpy(), dtype='datetime64[ns]')
+        rows = _window_rows(times, start, end, keep_neighbors)
+        current.labels['row_groups'] = len(row_groups)
+        current.labels['rows'] = int(rows.sum())
+        times = times[rows]
+        return {column: Timeseries(times, table.column(column).to_numpy()[rows]) for column in unique_columns}
+
+
+def _to_datetime64(value: Any) -> np.datetime64:
+    """Convert a datetime, tz-aware times to UTC, into a datetime64[ns] like the times read from parquet files"""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return timestamp.to_datetime64()
+
+
+def _window_row_groups(metadata: Any, start: Union[np.datetime64, None], end: Union[np.datetime64, None],
+                       keep_neighbors: bool) -> List[int]:
+    """Select the row groups of a parquet file whose 'time' statistics overlap start/end, and the row groups next to
+    them holding the neighbors of the window if keep_neighbors. Row groups without statistics are always read."""
+    time_column = metadata.schema.names.index('time')
+    bounds = []
+    for index in range(metadata.num_row_groups):
+        statistics = metadata.row_group(index).column(time_column).statistics
+        if statistics is None or not statistics.has_min_max:
+            bounds.append((None, None))
+        else:
+            bounds.append((_to_datetime64(statistics.min), _to_datetime64(statistics.max)))
+    selected = set()
+    before = after = None
+    for index, (first, last) in enumerate(bounds):
+        if first is None:
+            selected.add(index)
+        elif start is not None and last < start:
+            if before is None or last > bounds[before][1]:
+                before = index
+        elif end is not None and first > end:
+            if after is None or first < bounds[after][0]:
+                after = index
+        else:
+            selected.add(index)
+    if keep_neighbors:
+        selected.update(index for index in (before, after) if index is not None)
+    return sorted(selected)
+
+
+def _window_rows(times: np.ndarray, start: Union[np.datetime64, None], end: Union[np.datetime64, None],
+                 keep_neighbors: bool) -> np.ndarray:
+    """Mask of the times from start to end, and the last time before start and the first after end if
+    keep_neighbors"""
+    rows = np.ones(len(times), dtype=bool)
+    if start is not None:
+        before = times < start
+        if keep_neighbors and before.any():
+            before &= times != times[before].max()
+        rows &= ~before
+    if end is not None:
+        after = times > end
+        if keep_neighbors and after.any():
+            after &= times != times[after].min()
+        rows &= ~after
+    return rows
+
+
+def split_parquet_path(parquet_path: str) -> Tuple[str, str]:
+    """Split a <URI>[:<column>] parquet path into the URI and value column, which defaults to 'value'"""
+    uri, _, column = parquet_path.rpartition(':')
+    if not uri or '/' in column or '\\' in column:
+        return parquet_path, 'value'
+    return uri, column
@@ -14,14 +14,34 @@ For Azure blob storage the following enviornment variables can be set and picked
  - AZURE_STORAGE_TENANT_ID
 
  String and bytes functions will store the data in memory. The file functions will create temporary files so as to not
- run out of memory.
+ run out of memory. Temporary files are created in the scratch workspace of the process (see workspace_util).
  """
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import BinaryIO
-from typing import Iterator, Union
-import uuid
+from typing import Iterator, List, Tuple, Union
+import errno
+import hashlib
+import json
+import shutil
 import os
 import fsspec
+from fsspec.caching import BlockCache
+from fsspec.implementations.local import LocalFileSystem
+from cache_util import content_key, get_cache
+from metrics_util import stage
+from workspace_util import get_workspace
+
+# files larger than one part are transferred in parts of this many bytes by a pool of threads
+DEFAULT_PART_SIZE = 32 * 2**20
+DEFAULT_MAX_WORKERS = 8
+# extension of the checksum sidecar files used by put_file and put_bytes to skip unchanged uploads
+CHECKSUM_SIDECAR_EXT = ".md5.json"
+# how clone_file creates a file: 'reflink' tries a reflink, then copies. 'hardlink' tries a hardlink, then copies,
+# and the file is then shared with the source.
+LINK_MODES = ['reflink', 'hardlink', 'copy']
+# Linux ioctl that shares the blocks of one file with another (copy on write) on Btrfs, XFS and other filesystems
+FICLONE = 0x40049409
 
 
 def read_in_chunks(file_obj: Union[BinaryIO, fsspec.core.OpenFile], size_in_bytes: int = 10000000) -> Iterator[bytes]:
@@ -59,16 +79,87 @@ def get_bytes(src_uri: str) -> bytes:
         return file.read()
 
 
-def put_bytes(src_bytes: bytes, dst_uri: str) -> None:
-    """Write bytes object to a URI. Can be local filesystem, S3 or Azure blob storage.
+def put_bytes(src_bytes: bytes, dst_uri: str, skip_unchanged: bool = False, part_size: int = DEFAULT_PART_SIZE,
+              max_workers: int = DEFAULT_MAX_WORKERS) -> bool:
+    """Write bytes object to a URI. Can be local filesystem, S3 or Azure blob storage. Large objects are uploaded to
+    S3 in concurrent multipart uploads.
 
     Args:
         src_bytes (bytes): bytes object to write
         dst_uri (str): destination uri to write the file
+        skip_unchanged (bool, optional): If true, do not write the data if the destination already has the same
+        content (see destination_matches). The MD5 is computed while the data is written and stored in a checksum
+        sidecar for the next write. Defaults to False.
+        part_size (int, optional): bytes per part. Defaults to DEFAULT_PART_SIZE.
+        max_workers (int, optional): max number of concurrent part uploads. Defaults to DEFAULT_MAX_WORKERS.
+
+    Returns:
+        bool: True if the data was written, False if the upload was skipped.
+    """
+    dst_fs, dst_path = fsspec.core.url_to_fs(dst_uri)
+    with stage('put_bytes', dst=dst_uri) as current:
+        current.bytes_read = len(src_bytes)
+        content_md5 = None
+        # only a destination of the same size can match, so other uploads are not hashed beforehand
+        if skip_unchanged and _destination_size(dst_uri) == len(src_bytes):
+            checksums = content_checksums(src_bytes, part_size)
+            if destination_matches(dst_uri, checksums):
+                current.labels['skipped'] = True
+                current.bytes_written = 0
+                return False
+            content_md5 = checksums[0]
+        if _has_protocol(dst_fs, 's3') and len(src_bytes) > part_size:
+            _upload_in_parts_s3(dst_fs, src_bytes, dst_path, part_size, max_workers)
+        else:
+            # Data is overwritten with mode='wb' so no need to delete the file beforehand if it exists
+            with fsspec.open(dst_uri, 'wb') as file:
+                if skip_unchanged and content_md5 is None:
+                    content_md5 = _write_parts(src_bytes, file, part_size)
+                else:
+                    file.write(src_bytes)
+        if skip_unchanged and content_md5:
+            _write_checksum_sidecar(dst_uri, content_md5)
+        current.labels['skipped'] = False
+        current.bytes_written = len(src_bytes)
+    return True
+
+
+def get_size(src_uri: str) -> int:
+    """Get the size of the file at a URI in bytes. Can be local filesystem, S3 or Azure blob storage.
+
+    Args:
+        src_uri (str): URI to the file.
+
+    Returns:
+        int: size of the file in bytes
+    """
+    fs, path = fsspec.core.url_to_fs(src_uri)
+    return fs.size(path)
+
+
+def expand_uris(patterns: List[str]) -> List[str]:
+    """Expand URIs with '*', '?' and '[' wildcards to the matching files, keeping URIs without wildcards as they are.
+    Can be local filesystem, S3 or Azure blob storage.
+
+    Args:
+        patterns (List[str]): URIs or URI patterns (e.g. s3://<bucket_name>/models/*/*.p??.hdf)
+
+    Returns:
+        List[str]: sorted matching URIs of each pattern in the order of the patterns, without duplicates
     """
-    # Data is overwritten with mode='wb' so no need to delete the file beforehand if it exists
-    with fsspec.open(dst_uri, 'wb') as file:
-        file.write(src_bytes)
+    uris = []
+    for pattern in patterns:
+        if not any(char in pattern for char in '*?['):
+            uris.append(pattern)
+            continue
+        fs, path = fsspec.core.url_to_fs(pattern)
+        matches = sorted(fs.glob(path))
+        if isinstance(fs, LocalFileSystem):
+            uris.extend(matches)
+        else:
+            uris.extend(fs.unstrip_protocol(match) for match in matches)
+    # remove duplicates while keeping order
+    return list(dict.fromkeys(uris))
 
 
 def get_string(src_uri: str) -> str:
@@ -101,11 +192,14 @@ def put_string(src_str: str, dst_uri: str) -> None:
         file.write(src_str)
 
 
-def get_temp_file(src_uri: Union[str, None] = None, ext: str = "") -> str:
+def get_temp_file(src_uri: Union[str, None] = None, ext: str = "", part_size: int = DEFAULT_PART_SIZE,
+                  max_workers: int = DEFAULT_MAX_WORKERS, size: Union[int, None] = None) -> str:
     """Get a local filepath string copied from a URI. Can be local filesystem, S3 or Azure blob storage. A path to a
-    temporary file will be returned pointing to the created temp file on the local file system. Large files are copied
-    in chunks to avoid running out of memory. If src_uri is None, a temp filepath will be returned, but no file is
-    created. You should delete the temp files when you are done with them.
+    temporary file will be returned pointing to the created temp file in the scratch workspace (see
+    workspace_util.get_workspace). Large files are copied in parts concurrently to avoid running out of memory. If
+    src_uri is None, a temp filepath will be returned, but no file is created. You should delete the temp files when
+    you are done with them (see temp_file), otherwise they are removed with the workspace when the process exits. If
+    the copy fails, the partial temp file is removed.
 
     Args:
         src_uri (Union[str, None]): URI to the source file or None. If None, a temp filepath will be returned (but no
@@ -117,6 +211,10 @@ def get_temp_file(src_uri: Union[str, None] = None, ext: str = "") -> str:
         For local files use the filesystem path.
         ext (str): extension to use (e.g. .hdf). Default is empty string. If empty and src_uri is not None, extension
         will be copied from src_uri
+        part_size (int, optional): bytes per ranged read. Defaults to DEFAULT_PART_SIZE.
+        max_workers (int, optional): max number of concurrent ranged reads. Defaults to DEFAULT_MAX_WORKERS.
+        size (Union[int, None], optional): expected size in bytes of a temp file that is not copied from a URI, used
+        to pick the scratch directory it fits in. Defaults to None (unknown).
 
     Returns:
         str: path to temp file with data from URI
@@ -124,23 +222,439 @@ def get_temp_file(src_uri: Union[str, None] = None, ext: str = "") -> str:
     # some file types require the extension to match
     if src_uri is not None and len(os.path.splitext(src_uri)) == 2 and ext == "":
         ext = os.path.splitext(src_uri)[1]
-    temp_file_path = os.path.join(
-        tempfile.gettempdir(), str(uuid.uuid4())) + ext
-    if src_uri:
-        with fsspec.open(src_uri, 'rb') as src_file, fsspec.open(temp_file_path, 'wb') as temp_file:
-            for chunk in read_in_chunks(src_file):
-                temp_file.write(chunk)
+    workspace = get_workspace()
+    if not src_uri:
+        return workspace.temp_path(ext, size)
+    temp_file_path = workspace.temp_path(ext, get_size(src_uri))
+    try:
+        with stage('get_temp_file', uri=src_uri) as current:
+            cache = get_cache()
+            if cache is not None and not isinstance(fsspec.core.url_to_fs(src_uri)[0], LocalFileSystem):
+                current.labels['cache_hit'] = cache.get_file(src_uri, temp_file_path, lambda uri, filepath: put_file(
+                    uri, filepath, part_size=part_size, max_workers=max_workers))
+            else:
+                put_file(src_uri, temp_file_path, part_size=part_size, max_workers=max_workers)
+            current.bytes_written = os.path.getsize(temp_file_path)
+            current.bytes_read = 0 if current.labels.get('cache_hit') else current.bytes_written
+    except BaseException:
+        workspace.remove(temp_file_path)
+        raise
+    workspace.release(temp_file_path)
     return temp_file_path
 
 
-def put_file(src_uri: str, dst_uri: str) -> None:
-    """Copy data at a URI to another URI. Can be local filesystem, S3 or Azure blob storage.
+@contextmanager
+def temp_file(src_uri: Union[str, None] = None, ext: str = "", size: Union[int, None] = None) -> Iterator[str]:
+    """Get a temp file (see get_temp_file) that is removed when the context exits, with or without an exception.
+
+    Args:
+        src_uri (Union[str, None]): URI to the source file or None for a new temp filepath (no file is created).
+        ext (str): extension to use (e.g. .hdf). Defaults to the extension of src_uri.
+        size (Union[int, None], optional): expected size in bytes of a new temp file. Defaults to None (unknown).
+
+    Yields:
+        Iterator[str]: path to temp file
+    """
+    temp_file_path = get_temp_file(src_uri, ext, size=size)
+    try:
+        yield temp_file_path
+    finally:
+        get_workspace().remove(temp_file_path)
+
+
+def put_file(src_uri: str, dst_uri: str, part_size: int = DEFAULT_PART_SIZE,
+             max_workers: int = DEFAULT_MAX_WORKERS, skip_unchanged: bool = False) -> bool:
+    """Copy data at a URI to another URI. Can be local filesystem, S3 or Azure blob storage. Local to local copies
+    use an OS level copy. Remote to local copies are downloaded in concurrent ranged reads. Local to S3 copies are
+    uploaded in concurrent multipart uploads. Local to Azure copies stage max_workers blocks of the blob at a time.
+    Local to other remote copies use the filesystem's upload.
 
     Args:
         src_uri (str): source uri to read from
         dst_uri (str): destination uri to write the file
+        part_size (int, optional): bytes per part. Defaults to DEFAULT_PART_SIZE.
+        max_workers (int, optional): max number of concurrent part transfers. Defaults to DEFAULT_MAX_WORKERS.
+        skip_unchanged (bool, optional): If true and the source is a local file, do not copy the file if the
+        destination already has the same content (see destination_matches). The source is only hashed beforehand if
+        the destination has the same size. Otherwise the MD5 is computed while the file is written and stored in a
+        checksum sidecar for the next copy. Defaults to False.
+
+    Raises:
+        ValueError: if part_size or max_workers are given for an upload that can't use them (see
+        _check_upload_options)
+
+    Returns:
+        bool: True if the file was copied, False if the copy was skipped.
+    """
+    src_fs, src_path = fsspec.core.url_to_fs(src_uri)
+    dst_fs, dst_path = fsspec.core.url_to_fs(dst_uri)
+    if isinstance(src_fs, LocalFileSystem) and not isinstance(dst_fs, LocalFileSystem):
+        _check_upload_options(dst_fs, part_size, max_workers)
+    with stage('put_file', src=src_uri, dst=dst_uri) as current:
+        skip_unchanged = skip_unchanged and isinstance(src_fs, LocalFileSystem)
+        content_md5 = None
+        # only a destination of the same size can match, so other copies are not hashed beforehand
+        if skip_unchanged and _destination_size(dst_uri) == os.path.getsize(src_path):
+            checksums = content_checksums(src_path, part_size)
+            if destination_matches(dst_uri, checksums):
+                current.labels['skipped'] = True
+                current.bytes_read = checksums[2]
+                current.bytes_written = 0
+                return False
+            content_md5 = checksums[0]
+        # the MD5 of copies without one is computed in the loop that writes the destination
+        hash_while_writing = skip_unchanged and content_md5 is None and not _has_protocol(dst_fs, 's3')
+        if hash_while_writing:
+            with fsspec.open(dst_uri, 'wb') as dst_file:
+                content_md5 = _write_parts(src_path, dst_file, part_size)
+        elif isinstance(src_fs, LocalFileSystem) and isinstance(dst_fs, LocalFileSystem):
+            os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+            shutil.copyfile(src_path, dst_path)
+        elif isinstance(dst_fs, LocalFileSystem):
+            _download_in_parts(src_fs, src_path, dst_path, part_size, max_workers)
+        elif isinstance(src_fs, LocalFileSystem) and _has_protocol(dst_fs, 's3') \
+                and os.path.getsize(src_path) > part_size:
+            _upload_in_parts_s3(dst_fs, src_path, dst_path, part_size, max_workers)
+        elif isinstance(src_fs, LocalFileSystem) and _is_azure(dst_fs):
+            # the Azure SDK stages the blocks of the blob concurrently
+            dst_fs.put_file(src_path, dst_path, max_concurrency=max_workers)
+        elif isinstance(src_fs, LocalFileSystem):
+            dst_fs.put_file(src_path, dst_path)
+        else:
+            # Data is overwritten with mode='wb' so no need to delete the file beforehand if it exists
+            current.bytes_read = 0
+            with fsspec.open(src_uri, 'rb') as src_file, fsspec.open(dst_uri, 'wb') as dst_file:
+                for chunk in read_in_chunks(src_file):
+                    dst_file.write(chunk)
+                    current.bytes_read += len(chunk)
+        if skip_unchanged and content_md5:
+            _write_checksum_sidecar(dst_uri, content_md5)
+        if isinstance(dst_fs, LocalFileSystem):
+            current.bytes_read = os.path.getsize(dst_path)
+        elif isinstance(src_fs, LocalFileSystem):
+            current.bytes_read = os.path.getsize(src_path)
+        current.bytes_written = current.bytes_read
+        current.labels['skipped'] = False
+    return True
+
+
+def clone_file(src_filepath: str, dst_filepath: str, link: str = 'reflink') -> str:
+    """Create a local file with the content of another local file without copying its bytes where the filesystem
+    allows it. A reflink shares the blocks of the source until either file is written, so both files can be changed
+    independently. A hardlink is the same file as the source, so changes to either change both. Files that can't be
+    linked (e.g. on another filesystem) are copied. With 'hardlink', a destination that is already a hardlink of the
+    source is kept. Otherwise the destination is replaced.
+
+    Args:
+        src_filepath (str): local source filepath
+        dst_filepath (str): local destination filepath. Missing directories are created.
+        link (str, optional): one of LINK_MODES. 'reflink' and 'hardlink' try that link, then copy. 'copy' always
+        copies. Defaults to 'reflink', which never shares the file with the source.
+
+    Raises:
+        ValueError: if link is not one of LINK_MODES
+
+    Returns:
+        str: how the file was created: 'reflink', 'hardlink', 'copy' or 'unchanged'
+    """
+    if link not in LINK_MODES:
+        raise ValueError(f"Invalid link mode. Must be one of {LINK_MODES} but found {link}")
+    with stage('clone_file', src=src_filepath, dst=dst_filepath, link=link) as current:
+        if os.path.exists(dst_filepath):
+            if link == 'hardlink' and os.path.samefile(src_filepath, dst_filepath):
+                current.labels['method'] = 'unchanged'
+                return 'unchanged'
+            os.remove(dst_filepath)
+        os.makedirs(os.path.dirname(os.path.abspath(dst_filepath)), exist_ok=True)
+        method = 'copy'
+        if link == 'reflink' and _reflink(src_filepath, dst_filepath):
+            method = 'reflink'
+        elif link == 'hardlink' and _hardlink(src_filepath, dst_filepath):
+            method = 'hardlink'
+        else:
+            shutil.copyfile(src_filepath, dst_filepath)
+            current.bytes_read = current.bytes_written = os.path.getsize(dst_filepath)
+        current.labels['method'] = method
+    return method
+
+
+def _reflink(src_filepath: str, dst_filepath: str) -> bool:
+    """Create dst_filepath as a reflink of src_filepath. Returns False, leaving no file, if the filesystem or
+    platform does not support reflinks."""
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return False
+    with open(src_filepath, 'rb') as src_file, open(dst_filepath, 'wb') as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            return True
+        except OSError as exc:
+            error = exc
+    os.remove(dst_filepath)
+    if error.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM):
+        raise error
+    return False
+
+
+def _hardlink(src_filepath: str, dst_filepath: str) -> bool:
+    """Create dst_filepath as a hardlink of src_filepath. Returns False if the filesystem does not support it or
+    the files are on different filesystems."""
+    try:
+        os.link(src_filepath, dst_filepath)
+        return True
+    except OSError as exc:
+        if exc.errno in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.EMLINK):
+            return False
+        raise
+
+
+def content_checksums(src: Union[str, bytes], part_size: int = DEFAULT_PART_SIZE) -> Tuple[str, str, int]:
+    """Compute the checksums of a local file or bytes object in a single pass over the data. The multipart ETag is
+    the ETag S3 gives an object uploaded in parts of part_size (see put_file).
+
+    Args:
+        src (Union[str, bytes]): local filepath or bytes object
+        part_size (int, optional): bytes per upload part. Defaults to DEFAULT_PART_SIZE.
+
+    Returns:
+        Tuple[str, str, int]: MD5 hex digest, multipart ETag and size in bytes of the data
     """
-    # Data is overwritten with mode='wb' so no need to delete the file beforehand if it exists
-    with fsspec.open(src_uri, 'rb') as src_file, fsspec.open(dst_uri, 'wb') as dst_file:
-        for chunk in read_in_chunks(src_file):
-            dst_file.write(chunk)
+    content_md5 = hashlib.md5()
+    part_digests = []
+    size = 0
+    for part in _iter_parts(src, part_size):
+        content_md5.update(part)
+        part_digests.append(hashlib.md5(part).digest())
+        size += len(part)
+    multipart_etag = f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+    return content_md5.hexdigest(), multipart_etag, size
+
+
+def _iter_parts(src: Union[str, bytes], part_size: int) -> Iterator[Union[bytes, memoryview]]:
+    """Iterate over the parts of a local file or bytes object without copying the bytes object"""
+    if isinstance(src, str):
+        with open(src, 'rb') as src_file:
+            yield from read_in_chunks(src_file, part_size)
+    else:
+        view = memoryview(src)
+        for start in range(0, len(view), part_size):
+            yield view[start:start + part_size]
+
+
+def destination_matches(dst_uri: str, checksums: Tuple[str, str, int]) -> bool:
+    """Check if the file at a URI has the content described by checksums (see content_checksums) by comparing
+    metadata, without reading the destination. S3 objects are compared by ETag, which is the MD5 of objects uploaded
+    in a single part or the multipart ETag of objects uploaded in parts. Other files, including local files, are
+    compared with the checksum sidecar file written by put_file and put_bytes, which is only used if the file has not
+    changed since the sidecar was written. Files without a sidecar never match.
+
+    Args:
+        dst_uri (str): URI to the destination file.
+        checksums (Tuple[str, str, int]): checksums of the source data
+
+    Returns:
+        bool: True if the destination has the same content.
+    """
+    content_md5, multipart_etag, size = checksums
+    dst_fs, dst_path = fsspec.core.url_to_fs(dst_uri)
+    try:
+        info = dst_fs.info(dst_path)
+    except FileNotFoundError:
+        return False
+    if info.get('size') != size:
+        return False
+    if _has_protocol(dst_fs, 's3'):
+        etag = info.get('ETag', info.get('etag', '')).strip('"')
+        return etag in (content_md5, multipart_etag)
+    try:
+        sidecar = json.loads(get_bytes(dst_uri + CHECKSUM_SIDECAR_EXT))
+    except FileNotFoundError:
+        return False
+    return sidecar == {'md5': content_md5, 'content_key': content_key(dst_uri)}
+
+
+def _destination_size(dst_uri: str) -> Union[int, None]:
+    """Get the size of the file at a URI, or None if there is no file"""
+    dst_fs, dst_path = fsspec.core.url_to_fs(dst_uri)
+    try:
+        return dst_fs.info(dst_path).get('size')
+    except FileNotFoundError:
+        return None
+
+
+def _write_parts(src: Union[str, bytes], dst_file: BinaryIO, part_size: int) -> str:
+    """Write a local file or bytes object to an open file and return the MD5 hex digest computed while writing"""
+    content_md5 = hashlib.md5()
+    for part in _iter_parts(src, part_size):
+        content_md5.update(part)
+        dst_file.write(part)
+    return content_md5.hexdigest()
+
+
+def _write_checksum_sidecar(dst_uri: str, content_md5: str) -> None:
+    """Store the MD5 of a file written to a filesystem without MD5 based ETags next to the file"""
+    dst_fs, _ = fsspec.core.url_to_fs(dst_uri)
+    if _has_protocol(dst_fs, 's3'):
+        return
+    # the content key identifies the version of the file the checksum is for
+    sidecar = {'md5': content_md5, 'content_key': content_key(dst_uri)}
+    with fsspec.open(dst_uri + CHECKSUM_SIDECAR_EXT, 'w') as sidecar_file:
+        sidecar_file.write(json.dumps(sidecar))
+
+
+def _check_upload_options(dst_fs: fsspec.AbstractFileSystem, part_size: int, max_workers: int) -> None:
+    """Reject part_size and max_workers for uploads that would ignore them. Only S3 uploads are sent in parts of
+    part_size. Azure uploads stage max_workers blocks at a time, but the Azure SDK chooses the size of the blocks.
+    Uploads to other filesystems use neither."""
+    unused = ['part_size'] if part_size != DEFAULT_PART_SIZE else []
+    if max_workers != DEFAULT_MAX_WORKERS and not _is_azure(dst_fs):
+        unused.append('max_workers')
+    if unused and not _has_protocol(dst_fs, 's3'):
+        raise ValueError(f"Uploads to {dst_fs.protocol} do not support the {' and '.join(unused)} options")
+
+
+def _is_azure(fs: fsspec.AbstractFileSystem) -> bool:
+    """Check if a filesystem is Azure blob storage"""
+    return _has_protocol(fs, 'abfs') or _has_protocol(fs, 'az')
+
+
+def _has_protocol(fs: fsspec.AbstractFileSystem, protocol: str) -> bool:
+    """Check if a filesystem handles the given protocol"""
+    protocols = (fs.protocol,) if isinstance(fs.protocol, str) else fs.protocol
+    return protocol in protocols
+
+
+def _download_in_parts(src_fs: fsspec.AbstractFileSystem, src_path: str, dst_filepath: str, part_size: int,
+                       max_workers: int) -> None:
+    """Download a remote file to a local filepath with concurrent ranged reads written in place. Missing directories
+    are created."""
+    os.makedirs(os.path.dirname(os.path.abspath(dst_filepath)), exist_ok=True)
+    size = src_fs.size(src_path)
+    if size <= part_size:
+        src_fs.get_file(src_path, dst_filepath)
+        return
+    with open(dst_filepath, 'wb') as dst_file:
+        dst_file.truncate(size)
+
+    def download_part(start: int) -> None:
+        data = src_fs.cat_file(src_path, start=start, end=min(start + part_size, size))
+        with open(dst_filepath, 'r+b') as dst_file:
+            dst_file.seek(start)
+            dst_file.write(data)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # consume results so exceptions in worker threads are raised
+        list(executor.map(download_part, range(0, size, part_size)))
+
+
+def _upload_in_parts_s3(dst_fs: fsspec.AbstractFileSystem, src: Union[str, bytes], dst_path: str, part_size: int,
+                        max_workers: int) -> None:
+    """Upload a local file or bytes object to S3 with a concurrent multipart upload. The upload is aborted on
+    failure."""
+    bucket, key, _ = dst_fs.split_path(dst_path)
+    upload_id = dst_fs.call_s3('create_multipart_upload', Bucket=bucket, Key=key)['UploadId']
+    size = os.path.getsize(src) if isinstance(src, str) else len(src)
+
+    def upload_part(part: tuple) -> dict:
+        part_number, start = part
+        if isinstance(src, str):
+            with open(src, 'rb') as src_file:
+                src_file.seek(start)
+                body = src_file.read(part_size)
+        else:
+            body = bytes(memoryview(src)[start:start + part_size])
+        response = dst_fs.call_s3('upload_part', Bucket=bucket, Key=key, UploadId=upload_id,
+                                  PartNumber=part_number, Body=body)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(upload_part, enumerate(
+                range(0, size, part_size), start=1)))
+        dst_fs.call_s3('complete_multipart_upload', Bucket=bucket, Key=key, UploadId=upload_id,
+                       MultipartUpload={'Parts': parts})
+    except Exception:
+        dst_fs.call_s3('abort_multipart_upload', Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    dst_fs.invalidate_cache(dst_path)
+
+
+class RangeReader:
+    """Read-only, seekable file object for a URI that fetches byte ranges on demand instead of downloading the whole
+    file. Can be local filesystem, S3 or Azure blob storage. Ranges are fetched in blocks and kept in an LRU block
+    cache. The number of bytes fetched from the source is counted in bytes_transferred. Can be passed to h5py.File.
+
+    Args:
+        src_uri (str): URI to the source file.
+        block_size (int, optional): number of bytes fetched per request. Defaults to 4 MiB.
+        max_blocks (int, optional): max number of blocks held in the cache. Defaults to 64.
+    """
+
+    def __init__(self, src_uri: str, block_size: int = 2**22, max_blocks: int = 64):
+        self.fs, self.path = fsspec.core.url_to_fs(src_uri)
+        self.size = self.fs.size(self.path)
+        self.bytes_transferred = 0
+        self.loc = 0
+        self.closed = False
+        self.cache = BlockCache(block_size, self._fetch_range, self.size, maxblocks=max_blocks)
+
+    def _fetch_range(self, start: int, end: int) -> bytes:
+        data = self.fs.cat_file(self.path, start=start, end=end)
+        self.bytes_transferred += len(data)
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes from the current position. Reads to the end of the file if size is negative."""
+        end = self.size if size is None or size < 0 else min(self.size, self.loc + size)
+        if self.loc >= end:
+            return b""
+        data = self.cache._fetch(self.loc, end)  # pylint: disable=protected-access
+        self.loc += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into a pre-allocated writable buffer and return the number of bytes read."""
+        view = memoryview(buffer).cast('B')
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """Move to a new file position and return it."""
+        if whence == os.SEEK_SET:
+            self.loc = offset
+        elif whence == os.SEEK_CUR:
+            self.loc += offset
+        elif whence == os.SEEK_END:
+            self.loc = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        return self.loc
+
+    def tell(self) -> int:
+        """Return the current file position."""
+        return self.loc
+
+    def readable(self) -> bool:
+        """RangeReader is always readable."""
+        return True
+
+    def seekable(self) -> bool:
+        """RangeReader is always seekable."""
+        return True
+
+    def writable(self) -> bool:
+        """RangeReader is read-only."""
+        return False
+
+    def close(self) -> None:
+        """Close the file and drop cached blocks."""
+        self.closed = True
+        self.cache = None
+
+    def __enter__(self) -> 'RangeReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -1,64 +1,554 @@
 """Utility functions for HDF5 files"""
-from typing import List, Union, Any
+from contextlib import contextmanager, nullcontext
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple, Union, Any
+import json
 import os
-from datetime import timedelta, datetime
+import shutil
+import uuid
+from datetime import datetime, timedelta
 import h5py
-import pandas as pd
 import numpy as np
-from fs_util import get_temp_file, put_file
+from cache_util import content_key, get_cache
+from fs_util import (RangeReader, get_bytes, get_size, get_string, get_temp_file, put_bytes, put_file, put_string,
+                     temp_file)
+from workspace_util import get_workspace
+from metrics_util import stage
+from timeseries_util import Timeseries, as_timeseries
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def copy_hdf(src_hdf_uri: str, dst_hdf_uri: str, remove_groups: Union[List[str], None] = None) -> None:
-    """Copy an HDF file and optionally remove some groups.
+FLOW_HYDROGRAPHS_GROUP = "/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/"
+STAGE_HYDROGRAPHS_GROUP = "/Event Conditions/Unsteady/Boundary Conditions/Stage Hydrographs/"
+LATERAL_INFLOW_HYDROGRAPHS_GROUP = "/Event Conditions/Unsteady/Boundary Conditions/Lateral Inflow Hydrographs/"
+# hydrograph groups by boundary type
+HYDROGRAPH_GROUPS = {
+    'FLOW': FLOW_HYDROGRAPHS_GROUP,
+    'STAGE': STAGE_HYDROGRAPHS_GROUP,
+    'LATERAL': LATERAL_INFLOW_HYDROGRAPHS_GROUP,
+}
+GRIDDED_PRECIPITATION_GROUP = "/Event Conditions/Meteorology/Precipitation/Imported Raster Data/"
+PLAN_INFORMATION_GROUP = "/Plan Data/Plan Information"
+# rows per chunk of streamed gridded datasets
+DEFAULT_CHUNK_ROWS = 64
+# extension of the index sidecar files written next to HDF files by read_hdf_index
+INDEX_SIDECAR_EXT = ".index.json"
+# attributes with more values than this are left out of HDF indexes
+INDEX_MAX_ATTRIB_SIZE = 16
+RESULTS_GROUP = "/Results"
+# name of the dataset of times of each group of Results time series
+TIME_DATE_STAMP = "Time Date Stamp"
+# month abbreviations of HEC-RAS date strings (e.g. 13APR2019 00:00:00)
+RAS_MONTHS = np.array([b'JAN', b'FEB', b'MAR', b'APR', b'MAY', b'JUN', b'JUL', b'AUG', b'SEP', b'OCT', b'NOV', b'DEC'])
+# max bytes of a dataset read at a time when extracting Results
+DEFAULT_BLOCK_BYTES = 64 * 2**20
+# filters and chunk shape of the datasets written with each profile. 'chunk_bytes' is the target size of a chunk of
+# datasets whose chunk shape is not set by the caller (None lets h5py pick the chunk shape). 'chunk_layout' is 'rows'
+# for chunks of whole rows (fast reads of a time step of a Results dataset) or 'tiles' for chunks split across rows and
+# columns (reads of a time step or of the time series of one cell touch a similar number of chunks).
+WRITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    'none': {'compression': None, 'compression_opts': None, 'shuffle': False, 'chunk_bytes': 2**20,
+             'chunk_layout': 'rows'},
+    'lzf': {'compression': 'lzf', 'compression_opts': None, 'shuffle': False, 'chunk_bytes': 2**20,
+            'chunk_layout': 'rows'},
+    'lzf-shuffle': {'compression': 'lzf', 'compression_opts': None, 'shuffle': True, 'chunk_bytes': 2**20,
+                    'chunk_layout': 'rows'},
+    'gzip1': {'compression': 'gzip', 'compression_opts': 1, 'shuffle': False, 'chunk_bytes': None,
+              'chunk_layout': 'rows'},
+    'gzip1-shuffle': {'compression': 'gzip', 'compression_opts': 1, 'shuffle': True, 'chunk_bytes': 2**20,
+                      'chunk_layout': 'rows'},
+    'gzip4-shuffle': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'chunk_bytes': 2**20,
+                      'chunk_layout': 'rows'},
+    'gzip9-shuffle': {'compression': 'gzip', 'compression_opts': 9, 'shuffle': True, 'chunk_bytes': 2**20,
+                      'chunk_layout': 'rows'},
+    'gzip1-shuffle-tiles': {'compression': 'gzip', 'compression_opts': 1, 'shuffle': True, 'chunk_bytes': 2**20,
+                            'chunk_layout': 'tiles'},
+}
+# profile of new hydrograph and gridded datasets, the gzip level 1 compression they have always been written with
+DEFAULT_WRITE_PROFILE = 'gzip1'
+# datasets smaller than this are copied as they are when recompressing, since chunking them costs more than
+# compressing them saves
+RECOMPRESS_MIN_BYTES = 4096
+# nanoseconds per hydrograph 'Interval' unit
+HYDROGRAPH_INTERVAL_UNITS = {
+    'Days': 86400 * 10**9,
+    'Hours': 3600 * 10**9,
+    'Mins': 60 * 10**9,
+    'Minutes': 60 * 10**9,
+    'Seconds': 10**9,
+    'Secs': 10**9,
+}
+
+
+def copy_hdf(src_hdf_uri: str, dst_hdf_uri: str, remove_groups: Union[List[str], None] = None,
+             range_read: bool = False, in_memory_max_bytes: int = 0, skip_unchanged: bool = False,
+             profile: Union[str, None] = None) -> int:
+    """Copy an HDF file and optionally remove some groups. Datasets are copied as they are, or rewritten with the
+    filters and chunks of a write profile if one is given.
 
     Args:
         src_hdf_uri (str): URI of the source HDF file.
         dst_hdf_uri (str): URI to save the resulting HDF file.
         remove_groups (List[str] | None, optional): list of group names to
         remove. Defaults to None.
+        range_read (bool, optional): If true, read the source HDF file in byte ranges through a block cache instead of
+        downloading it, so removed groups are never transferred. Defaults to False.
+        in_memory_max_bytes (int, optional): If the source HDF file is at most this many bytes, copy it in memory
+        instead of through temp files. Defaults to 0 (always use temp files).
+        skip_unchanged (bool, optional): If true, do not upload the resulting HDF file if dst_hdf_uri already has the
+        same content (see fs_util.destination_matches). Defaults to False.
+        profile (Union[str, None], optional): one of WRITE_PROFILES to recompress the datasets with. Defaults to None
+        (copy datasets as they are).
+
+    Returns:
+        int: number of bytes read from the source HDF file.
     """
-    # copy data to local temp files and remove group(s)
-    src_filepath = get_temp_file(src_hdf_uri)
-    temp_filepath = get_temp_file(ext=".hdf")
-    with h5py.File(src_filepath, 'r') as src, h5py.File(temp_filepath, 'w') as temp:
-        for attr in src.attrs.keys():
-            temp.attrs[attr] = src.attrs.get(attr)
-        for group in src.keys():
-            if remove_groups and group not in remove_groups:
-                src.copy(group, temp)
-            elif remove_groups is None:
-                src.copy(group, temp)
-    # copy result file to URI
-    put_file(temp_filepath, dst_hdf_uri)
-    # delete temp files
-    os.remove(src_filepath)
-    os.remove(temp_filepath)
+    if profile is not None:
+        _check_profile(profile)
+    if not range_read and in_memory_max_bytes and get_size(src_hdf_uri) <= in_memory_max_bytes:
+        with stage('copy_hdf', src=src_hdf_uri, dst=dst_hdf_uri, range_read=False, in_memory=True) as current:
+            src_image = get_bytes(src_hdf_uri)
+            with open_hdf_image(src_image) as src, create_hdf_image() as dst:
+                _copy_into(src, dst, remove_groups, profile)
+                dst_image = get_hdf_image(dst)
+            put_bytes(dst_image, dst_hdf_uri, skip_unchanged=skip_unchanged)
+            current.bytes_read = len(src_image)
+            current.bytes_written = len(dst_image)
+        return len(src_image)
+    # the copy is at most the size of the source file
+    with temp_file(ext=".hdf", size=get_size(src_hdf_uri)) as temp_filepath:
+        with stage('copy_hdf', src=src_hdf_uri, dst=dst_hdf_uri, range_read=range_read, in_memory=False) as current:
+            if range_read:
+                with RangeReader(src_hdf_uri) as src_file:
+                    with h5py.File(src_file, 'r') as src:
+                        _copy_groups(src, temp_filepath, remove_groups, profile)
+                    bytes_read = src_file.bytes_transferred
+            else:
+                # copy data to local temp files and remove group(s)
+                with temp_file(src_hdf_uri) as src_filepath:
+                    with h5py.File(src_filepath, 'r') as src:
+                        _copy_groups(src, temp_filepath, remove_groups, profile)
+                    bytes_read = os.path.getsize(src_filepath)
+            current.bytes_read = bytes_read
+            current.bytes_written = os.path.getsize(temp_filepath)
+        # copy result file to URI
+        put_file(temp_filepath, dst_hdf_uri, skip_unchanged=skip_unchanged)
+    return bytes_read
+
+
+def _copy_groups(src: h5py.File, dst_filepath: str, remove_groups: Union[List[str], None],
+                 profile: Union[str, None] = None) -> None:
+    """Copy root attributes and all groups not in remove_groups from an open HDF file to a new HDF file"""
+    with h5py.File(dst_filepath, 'w') as temp:
+        _copy_into(src, temp, remove_groups, profile)
+
+
+def _copy_into(src: h5py.File, dst: h5py.File, remove_groups: Union[List[str], None],
+               profile: Union[str, None] = None) -> None:
+    """Copy root attributes and all groups not in remove_groups from an open HDF file to another open HDF file.
+    Datasets are rewritten with the filters and chunks of profile if it is not None."""
+    for attr in src.attrs.keys():
+        dst.attrs[attr] = src.attrs.get(attr)
+    for group in src.keys():
+        if remove_groups and group not in remove_groups:
+            _copy_item(src, dst, group, profile)
+        elif remove_groups is None:
+            _copy_item(src, dst, group, profile)
+
+
+def _copy_item(src: h5py.File, dst: h5py.File, name: str, profile: Union[str, None]) -> None:
+    """Copy a group or dataset as it is, or rewritten with the filters and chunks of profile if it is not None"""
+    if profile is None:
+        src.copy(name, dst)
+    else:
+        _recompress_into(src, dst, name, profile)
+
+
+def _recompress_into(src: h5py.File, dst: h5py.File, name: str, profile: str) -> None:
+    """Copy a group or dataset and everything below it, rewriting the datasets with the filters and chunks of a
+    write profile"""
+    item = src[name]
+    if isinstance(item, h5py.Dataset):
+        _copy_dataset_rows(src, dst, item.name, None, DEFAULT_BLOCK_BYTES, profile)
+        return
+    paths: List[str] = [item.name]
+    item.visit(lambda sub_name: paths.append(f"{item.name}/{sub_name}"))
+    for path in paths:
+        if isinstance(src[path], h5py.Dataset):
+            _copy_dataset_rows(src, dst, path, None, DEFAULT_BLOCK_BYTES, profile)
+        elif path not in dst:
+            # groups are created with their attributes before the datasets in them, so empty groups are kept too
+            group = dst.create_group(path)
+            for attrib, value in src[path].attrs.items():
+                group.attrs[attrib] = value
 
 
-def create_hydrograph_times(datetime_column: pd.DataFrame, units: str) -> 'np.ndarray[np.float32]':
-    """create an array of times starting at zero in the given units from a datetime column of a pandas dataframe
+def dataset_options(profile: str, shape: tuple, dtype: Any) -> Dict[str, Any]:
+    """Get the h5py create_dataset options (chunks and filters) of a write profile for a dataset.
 
     Args:
-        datetime_column (pd.DataFrame): datetime column of pandas dataframe
-        units (str): Interval of time series. Must be one of ['Days']
+        profile (str): one of WRITE_PROFILES
+        shape (tuple): shape of the dataset
+        dtype (Any): dtype of the dataset
+
+    Raises:
+        ValueError: if the profile is unknown
 
     Returns:
-        np.ndarray[np.float32]: array of times in specified units offset to start at 0.
+        Dict[str, Any]: 'chunks', 'compression', 'compression_opts' and 'shuffle' options
+    """
+    _check_profile(profile)
+    settings = WRITE_PROFILES[profile]
+    options = {key: settings[key] for key in ('compression', 'compression_opts', 'shuffle')}
+    if settings['chunk_bytes'] is None or not shape:
+        options['chunks'] = True
+    else:
+        options['chunks'] = _profile_chunks(shape, np.dtype(dtype).itemsize, settings['chunk_bytes'],
+                                            settings['chunk_layout'])
+    return options
+
+
+def _profile_chunks(shape: tuple, itemsize: int, chunk_bytes: int, layout: str) -> tuple:
+    """Chunk shape of about chunk_bytes. 'rows' chunks hold whole rows if a row fits in chunk_bytes. 'tiles'
+    chunks split the first two dimensions evenly. Chunks are never larger than the dataset."""
+    extent = [max(1, size) for size in shape]
+    items = max(1, chunk_bytes // itemsize)
+    inner = int(np.prod(extent[2:])) if len(extent) > 2 else 1
+    if len(extent) == 1:
+        return (min(extent[0], items),)
+    if layout == 'tiles':
+        side = max(1, int((items // inner) ** 0.5))
+        rows = min(extent[0], side)
+        return (rows, min(extent[1], max(1, items // (rows * inner)))) + tuple(extent[2:])
+    row_items = extent[1] * inner
+    if row_items <= items:
+        return (min(extent[0], items // row_items),) + tuple(extent[1:])
+    # a row does not fit, split it
+    return (1, min(extent[1], max(1, items // inner))) + tuple(extent[2:])
+
+
+def _has_profile_filters(dataset: h5py.Dataset, options: Dict[str, Any]) -> bool:
+    """Check if a dataset has the filters of dataset options"""
+    return dataset.compression == options['compression'] and \
+        dataset.compression_opts == options['compression_opts'] and dataset.shuffle == options['shuffle']
+
+
+def _check_profile(profile: str) -> None:
+    """Raise a ValueError if profile is not one of WRITE_PROFILES"""
+    if profile not in WRITE_PROFILES:
+        raise ValueError(f"Invalid write profile. Must be one of {list(WRITE_PROFILES)} but found {profile}")
+
+
+def extract_results(src_hdf_uri: str, dst_hdf_uri: str, datasets: List[str],
+                    start: Union[datetime, None] = None, end: Union[datetime, None] = None, step: int = 1,
+                    range_read: bool = False, block_bytes: int = DEFAULT_BLOCK_BYTES,
+                    skip_unchanged: bool = False, profile: Union[str, None] = None) -> int:
+    """Copy an HDF file with only some Results datasets, sliced to a time window and decimated in time. Groups other
+    than Results are copied whole. A Results dataset is a time series if it is in a group with a 'Time Date Stamp'
+    dataset (or a subgroup of one) and has a row per time. Time series and their 'Time Date Stamp' and 'Time'
+    datasets keep the rows in the window, then every step-th row. Other selected datasets are copied whole.
+    Datasets are read and written in blocks aligned to their chunks of at most block_bytes, so memory use does not
+    depend on the size of the datasets.
+
+    Args:
+        src_hdf_uri (str): URI of the source HDF file.
+        dst_hdf_uri (str): URI to save the resulting HDF file.
+        datasets (List[str]): patterns with '*' and '?' wildcards of the Results dataset paths to keep (e.g.
+        '*/2D Flow Areas/Perimeter 1/Water Surface'). '*' also matches '/'.
+        start (Union[datetime, None], optional): earliest time to keep. Defaults to None.
+        end (Union[datetime, None], optional): latest time to keep. Defaults to None.
+        step (int, optional): keep every step-th time in the window. Defaults to 1.
+        range_read (bool, optional): If true, read the source HDF file in byte ranges instead of downloading it, so
+        Results datasets that are not kept are never transferred. Defaults to False.
+        block_bytes (int, optional): max bytes of a dataset read at a time. Defaults to DEFAULT_BLOCK_BYTES.
+        skip_unchanged (bool, optional): If true, do not upload the resulting HDF file if dst_hdf_uri already has the
+        same content (see fs_util.destination_matches). Defaults to False.
+        profile (Union[str, None], optional): one of WRITE_PROFILES to write the extracted Results datasets with.
+        Defaults to None (keep the filters and chunks of the source datasets).
+
+    Raises:
+        ValueError: if step is less than 1, no Results datasets match or the profile is unknown
+
+    Returns:
+        int: number of Results datasets extracted
+    """
+    if step < 1:
+        raise ValueError(f"Time step must be at least 1 but found {step}")
+    if profile is not None:
+        _check_profile(profile)
+    with temp_file(ext=".hdf") as temp_filepath:
+        with stage('extract_results', src=src_hdf_uri, dst=dst_hdf_uri, range_read=range_read) as current:
+            if range_read:
+                with RangeReader(src_hdf_uri) as src_file:
+                    with h5py.File(src_file, 'r') as src, h5py.File(temp_filepath, 'w') as dst:
+                        count = _extract_into(src, dst, datasets, start, end, step, block_bytes, profile)
+                    current.bytes_read = src_file.bytes_transferred
+            else:
+                with temp_file(src_hdf_uri) as src_filepath:
+                    with h5py.File(src_filepath, 'r') as src, h5py.File(temp_filepath, 'w') as dst:
+                        count = _extract_into(src, dst, datasets, start, end, step, block_bytes, profile)
+                    current.bytes_read = os.path.getsize(src_filepath)
+            current.bytes_written = os.path.getsize(temp_filepath)
+            current.labels['datasets'] = count
+        put_file(temp_filepath, dst_hdf_uri, skip_unchanged=skip_unchanged)
+    return count
+
+
+def _extract_into(src: h5py.File, dst: h5py.File, patterns: List[str], start: Union[datetime, None],
+                  end: Union[datetime, None], step: int, block_bytes: int, profile: Union[str, None] = None) -> int:
+    """Copy the groups other than Results and the Results datasets matching patterns from an open HDF file to another
+    open HDF file"""
+    _copy_into(src, dst, [RESULTS_GROUP.strip('/')])
+    selected = []
+    if RESULTS_GROUP in src:
+        src[RESULTS_GROUP].visititems(lambda name, item: selected.append(f"{RESULTS_GROUP}/{name}") if isinstance(
+            item, h5py.Dataset) and any(fnmatchcase(f"{RESULTS_GROUP}/{name}", pattern) for pattern in patterns)
+            else None)
+    if not selected:
+        raise ValueError(f"No Results datasets match {patterns}")
+    # rows kept of each group of time series
+    time_rows: Dict[str, slice] = {}
+    copied = set()
+    for path in selected:
+        time_group = _find_time_group(src, path)
+        rows = None
+        if time_group is not None:
+            if time_group not in time_rows:
+                time_rows[time_group] = _time_rows(src[time_group + "/" + TIME_DATE_STAMP], start, end, step)
+                for time_path in (time_group + "/" + TIME_DATE_STAMP, time_group + "/Time"):
+                    if time_path in src and time_path not in copied:
+                        _copy_dataset_rows(src, dst, time_path, time_rows[time_group], block_bytes, profile)
+                        copied.add(time_path)
+            if src[path].ndim and src[path].shape[0] == src[time_group + "/" + TIME_DATE_STAMP].shape[0]:
+                rows = time_rows[time_group]
+        if path not in copied:
+            _copy_dataset_rows(src, dst, path, rows, block_bytes, profile)
+            copied.add(path)
+    return len(selected)
+
+
+def _find_time_group(src: h5py.File, path: str) -> Union[str, None]:
+    """Find the closest group above a dataset with a 'Time Date Stamp' dataset"""
+    group = path.rsplit('/', 1)[0]
+    while group.startswith(RESULTS_GROUP):
+        if isinstance(src.get(group + "/" + TIME_DATE_STAMP), h5py.Dataset):
+            return group
+        group = group.rsplit('/', 1)[0]
+    return None
+
+
+def _time_rows(time_date_stamps: h5py.Dataset, start: Union[datetime, None], end: Union[datetime, None],
+               step: int) -> slice:
+    """Get the slice of rows of a group of time series within start and end, keeping every step-th row. The times
+    of the rows increase, so the bounds are found by binary search."""
+    times = parse_ras_datetimes(time_date_stamps[...])
+    first = int(np.searchsorted(times, np.datetime64(start), side='left')) if start is not None else 0
+    stop = int(np.searchsorted(times, np.datetime64(end), side='right')) if end is not None else len(times)
+    return slice(first, max(first, stop), step)
+
+
+def _copy_dataset_rows(src: h5py.File, dst: h5py.File, path: str, rows: Union[slice, None], block_bytes: int,
+                       profile: Union[str, None] = None) -> None:
+    """Copy a dataset, or some rows of it, in blocks of rows aligned to its chunks. Groups above the dataset are
+    created with their attributes. The copy keeps the filters and chunks of the dataset, or gets those of profile if
+    it is not None and the dataset is large enough to compress (see RECOMPRESS_MIN_BYTES)."""
+    dataset = src[path]
+    group = dst
+    for name in path.strip('/').split('/')[:-1]:
+        if name not in group:
+            group.create_group(name)
+            for attrib, value in src[group.name.rstrip('/') + '/' + name].attrs.items():
+                group[name].attrs[attrib] = value
+        group = group[name]
+    if not dataset.ndim:
+        src.copy(dataset, group)
+        return
+    first, stop, step = rows.indices(dataset.shape[0]) if rows is not None else (0, dataset.shape[0], 1)
+    num_rows = len(range(first, stop, step))
+    options: Dict[str, Any] = {}
+    if profile is not None and num_rows and dataset.nbytes >= RECOMPRESS_MIN_BYTES and dataset.dtype.kind != 'O':
+        options = dataset_options(profile, (num_rows,) + dataset.shape[1:], dataset.dtype)
+    elif dataset.chunks and num_rows:
+        options = {'chunks': (min(dataset.chunks[0], num_rows),) + dataset.chunks[1:],
+                   'compression': dataset.compression, 'compression_opts': dataset.compression_opts,
+                   'shuffle': dataset.shuffle, 'fletcher32': dataset.fletcher32}
+    dst_dataset = group.create_dataset(path.rsplit('/', 1)[1], shape=(num_rows,) + dataset.shape[1:],
+                                       dtype=dataset.dtype, **options)
+    for attrib, value in dataset.attrs.items():
+        dst_dataset.attrs[attrib] = value
+    row_bytes = max(1, dataset.dtype.itemsize * int(np.prod(dataset.shape[1:])))
+    block_rows = max(1, block_bytes // row_bytes)
+    if dataset.chunks:
+        block_rows = max(dataset.chunks[0], block_rows - block_rows % dataset.chunks[0])
+    block_start = first
+    while block_start < stop:
+        block_stop = min(stop, (block_start // block_rows + 1) * block_rows)
+        # first kept row in the block
+        row = block_start + (first - block_start) % step
+        if row < block_stop:
+            dst_dataset[(row - first) // step:(row - first) // step + len(range(row, block_stop, step))] = \
+                dataset[row:block_stop:step]
+        block_start = block_stop
+
+
+def open_hdf_image(image: bytes, mode: str = 'r') -> h5py.File:
+    """Open an HDF file from an in-memory file image with the core driver. Changes are not written to disk.
+
+    Args:
+        image (bytes): contents of an HDF file
+        mode (str, optional): 'r' for read only or 'r+' for read/write. Defaults to 'r'.
+
+    Returns:
+        h5py.File: the open HDF file. Use get_hdf_image to get its contents after changes.
+    """
+    if mode not in ('r', 'r+'):
+        raise ValueError(f"Invalid mode '{mode}'. Must be one of ['r', 'r+']")
+    fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+    fapl.set_fapl_core(backing_store=False)
+    fapl.set_file_image(image)
+    flags = h5py.h5f.ACC_RDONLY if mode == 'r' else h5py.h5f.ACC_RDWR
+    # the name only identifies the file in HDF5 since nothing is read from or written to disk
+    return h5py.File(h5py.h5f.open(str(uuid.uuid4()).encode(), flags, fapl=fapl))
+
+
+def create_hdf_image() -> h5py.File:
+    """Create an empty in-memory HDF file with the core driver. Changes are not written to disk.
+
+    Returns:
+        h5py.File: the open HDF file. Use get_hdf_image to get its contents.
+    """
+    return h5py.File(str(uuid.uuid4()), 'w', driver='core', backing_store=False)
+
+
+def get_hdf_image(file: h5py.File) -> bytes:
+    """Get the contents of an open HDF file (e.g. from open_hdf_image or create_hdf_image) as a file image.
+
+    Args:
+        file (h5py.File): open HDF file
+
+    Returns:
+        bytes: contents of the HDF file
+    """
+    file.flush()
+    return file.id.get_file_image()
+
+
+class HdfEdit:
+    """A working copy of an HDF file opened by edit_hdf. The open file is in memory or in a local temp file.
+
+    Args:
+        file (h5py.File): the open working copy
+        temp_filepath (Union[str, None]): local filepath of the working copy or None if it is in memory
+    """
+    __slots__ = ['file', 'temp_filepath']
+
+    def __init__(self, file: h5py.File, temp_filepath: Union[str, None]):
+        self.file = file
+        self.temp_filepath = temp_filepath
+
+    @property
+    def in_memory(self) -> bool:
+        """True if the working copy is in memory"""
+        return self.temp_filepath is None
+
+    def repack(self, profile: Union[str, None] = None) -> Tuple[int, int]:
+        """Rewrite the working copy to reclaim the unused space left by deleted or replaced datasets (see
+        repack_hdf).
+
+        Args:
+            profile (Union[str, None], optional): one of WRITE_PROFILES to recompress the datasets with. Defaults to
+            None (keep the filters and chunks of the datasets).
+
+        Returns:
+            Tuple[int, int]: file size in bytes before and after repacking
+        """
+        if not self.in_memory:
+            self.file.close()
+            try:
+                return repack_hdf(self.temp_filepath, profile)
+            finally:
+                self.file = h5py.File(self.temp_filepath, 'r+')
+        with stage('repack_hdf', hdf_filepath=None, in_memory=True) as current:
+            size_before = len(get_hdf_image(self.file))
+            with create_hdf_image() as dst:
+                _copy_into(self.file, dst, None, profile)
+                image = get_hdf_image(dst)
+            self.file.close()
+            self.file = open_hdf_image(image, 'r+')
+            current.bytes_read = size_before
+            current.bytes_written = len(image)
+        return size_before, len(image)
+
+
+@contextmanager
+def edit_hdf(hdf_uri: str, dst_hdf_uri: Union[str, None] = None, in_memory_max_bytes: int = 0,
+             skip_unchanged: bool = False) -> Iterator[HdfEdit]:
+    """Open a working copy of an HDF file for editing and save it when the context exits without an exception. The
+    working copy is kept in memory if the file is at most in_memory_max_bytes and is a local temp file otherwise.
+
+    Args:
+        hdf_uri (str): URI of the HDF file to edit.
+        dst_hdf_uri (Union[str, None], optional): URI to save the edited HDF file. Defaults to None (overwrite
+        hdf_uri).
+        in_memory_max_bytes (int, optional): max size in bytes of a file edited in memory. Defaults to 0 (always use
+        a temp file).
+        skip_unchanged (bool, optional): If true, do not upload the edited HDF file if dst_hdf_uri already has the
+        same content (see fs_util.destination_matches). Defaults to False.
+
+    Yields:
+        Iterator[HdfEdit]: the working copy. Pass edit.file to update_hydrographs.
     """
-    if units == 'Days':
-        result = np.ndarray(dtype=np.float32, shape=(
-            len(datetime_column.index)))
-        time = 0.0
-        result[0] = time
-        # get time as fractions of a day using 32 bit floats
-        for i in range(1, len(datetime_column.index)):
-            time += (datetime_column[i] -
-                     datetime_column[i-1]) / timedelta(days=1)
-            result[i] = time
+    dst_hdf_uri = dst_hdf_uri or hdf_uri
+    if in_memory_max_bytes and get_size(hdf_uri) <= in_memory_max_bytes:
+        with stage('get_hdf_image', uri=hdf_uri) as current:
+            image = get_bytes(hdf_uri)
+            current.bytes_read = len(image)
+        edit = HdfEdit(open_hdf_image(image, 'r+'), None)
+        del image
     else:
+        temp_filepath = get_temp_file(hdf_uri)
+        try:
+            edit = HdfEdit(h5py.File(temp_filepath, 'r+'), temp_filepath)
+        except BaseException:
+            get_workspace().remove(temp_filepath)
+            raise
+    try:
+        yield edit
+        if edit.in_memory:
+            image = get_hdf_image(edit.file)
+            edit.file.close()
+            put_bytes(image, dst_hdf_uri, skip_unchanged=skip_unchanged)
+        else:
+            edit.file.close()
+            put_file(edit.temp_filepath, dst_hdf_uri, skip_unchanged=skip_unchanged)
+    finally:
+        edit.file.close()
+        if not edit.in_memory:
+            get_workspace().remove(edit.temp_filepath)
+
+
+def create_hydrograph_times(datetime_column: Union['np.ndarray', 'pd.Series'], units: str) -> 'np.ndarray[np.float32]':
+    """create an array of times starting at zero in the given units from an array of times (e.g. Timeseries.time)
+
+    Args:
+        datetime_column (Union[np.ndarray, pd.Series]): datetime64 array or datetime column of pandas dataframe
+        units (str): Interval of time series. Must be one of the keys of HYDROGRAPH_INTERVAL_UNITS
+        (e.g. 'Days', 'Hours', 'Mins', 'Seconds')
+
+    Returns:
+        np.ndarray[np.float32]: array of times in specified units offset to start at 0.
+    """
+    if units not in HYDROGRAPH_INTERVAL_UNITS:
         raise ValueError(
-            f"Timeseries has unknown interval units. Must be 'Days' but found {units}")
-    return result
+            f"Timeseries has unknown interval units. Must be one of {list(HYDROGRAPH_INTERVAL_UNITS)} "
+            f"but found {units}")
+    times = np.asarray(datetime_column, dtype='datetime64[ns]')
+    if len(times) == 0:
+        return np.empty(0, dtype=np.float32)
+    # offsets from the first time are exact int64 nanoseconds, so convert once instead of accumulating 32 bit floats
+    offsets = (times - times[0]).astype(np.int64)
+    return (offsets / HYDROGRAPH_INTERVAL_UNITS[units]).astype(np.float32)
 
 
 def format_date_string_hydrograph_attrib(raw_datetime: datetime) -> str:
@@ -73,6 +563,101 @@ def format_date_string_hydrograph_attrib(raw_datetime: datetime) -> str:
     return raw_datetime.strftime("%d%b%Y %H%M")
 
 
+def parse_ras_datetime(text: str) -> datetime:
+    """Parse a HEC-RAS date string (e.g. '13Apr2019 0000', '13APR2019 00:00' or '13APR2019 24:00:00'). An hour of 24
+    is midnight at the end of the day.
+
+    Args:
+        text (str): HEC-RAS date string
+
+    Raises:
+        ValueError
+
+    Returns:
+        datetime: the parsed datetime
+    """
+    date_part, _, time_part = text.strip().partition(' ')
+    time_part = time_part.strip().replace(':', '')
+    end_of_day = time_part.startswith('24')
+    if end_of_day:
+        time_part = '00' + time_part[2:]
+    time_format = {4: '%H%M', 6: '%H%M%S'}.get(len(time_part))
+    if time_format is None:
+        raise ValueError(f"Invalid HEC-RAS date '{text}'")
+    parsed = datetime.strptime(f"{date_part} {time_part}", f"%d%b%Y {time_format}")
+    return parsed + timedelta(days=1) if end_of_day else parsed
+
+
+def parse_ras_datetimes(texts: np.ndarray) -> np.ndarray:
+    """Parse an array of HEC-RAS date strings (see parse_ras_datetime) with vectorized string operations instead of
+    one strptime call per string, e.g. the 'Time Date Stamp' dataset of Results.
+
+    Args:
+        texts (np.ndarray): 1D array of HEC-RAS date strings as bytes or str
+
+    Raises:
+        ValueError
+
+    Returns:
+        np.ndarray: datetime64[s] array of the parsed datetimes
+    """
+    texts = np.char.upper(np.char.strip(np.asarray(texts).astype(np.bytes_)))
+    if not texts.size:
+        return np.array([], dtype='datetime64[s]')
+    dates, _, times = np.char.partition(texts, b' ').T
+    times = np.char.replace(np.char.strip(times), b':', b'')
+    if (np.char.str_len(dates) != 9).any() or (~np.isin(np.char.str_len(times), (4, 6))).any():
+        raise ValueError(f"Invalid HEC-RAS dates in {texts}")
+    date_chars = dates.astype('S9').view('S1').reshape(-1, 9)
+    time_chars = np.char.ljust(times, 6, b'0').astype('S6').view('S1').reshape(-1, 6)
+
+    def field(chars: np.ndarray, start: int, stop: int) -> np.ndarray:
+        return chars[:, start:stop].copy().view(f"S{stop - start}").ravel()
+
+    is_month = field(date_chars, 2, 5)[:, None] == RAS_MONTHS
+    if not is_month.any(axis=1).all():
+        raise ValueError(f"Invalid HEC-RAS dates in {texts}")
+    months = np.array([f"{month:02d}".encode() for month in range(1, 13)])[is_month.argmax(axis=1)]
+    iso_dates = np.char.add(np.char.add(np.char.add(np.char.add(field(date_chars, 5, 9), b'-'), months), b'-'),
+                            field(date_chars, 0, 2))
+    # an hour of 24 is midnight at the end of the day
+    seconds = (field(time_chars, 0, 2).astype(np.int64) * 3600 + field(time_chars, 2, 4).astype(np.int64) * 60
+               + field(time_chars, 4, 6).astype(np.int64))
+    return iso_dates.astype('datetime64[D]').astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def read_simulation_window(file: h5py.File) -> Tuple[datetime, datetime]:
+    """Read the simulation start and end times of an open plan HDF file.
+
+    Args:
+        file (h5py.File): open plan HDF file
+
+    Returns:
+        Tuple[datetime, datetime]: simulation start and end times
+    """
+    attrs = file[PLAN_INFORMATION_GROUP].attrs
+    return (parse_ras_datetime(attrs['Simulation Start Time'].decode()),
+            parse_ras_datetime(attrs['Simulation End Time'].decode()))
+
+
+def read_plan_simulation_window(plan_hdf_uri: str) -> Tuple[datetime, datetime]:
+    """Read the simulation start and end times of a plan HDF file without downloading it (see
+    read_simulation_window). Only the metadata of the file is read in byte ranges.
+
+    Args:
+        plan_hdf_uri (str): URI of the plan HDF file
+
+    Returns:
+        Tuple[datetime, datetime]: simulation start and end times
+    """
+    with stage('read_simulation_window', hdf_uri=plan_hdf_uri) as current:
+        with RangeReader(plan_hdf_uri) as hdf_file:
+            with h5py.File(hdf_file, 'r') as file:
+                window = read_simulation_window(file)
+            current.bytes_read = hdf_file.bytes_transferred
+    return window
+
+
 def copy_attrib(src_dataset: h5py.Dataset, dst_dataset: h5py.Dataset, attrib: str, value: Any = None):
     """Copy an attribute from one HDF5 dataset to another and optionally update the value
 
@@ -90,49 +675,409 @@ def copy_attrib(src_dataset: h5py.Dataset, dst_dataset: h5py.Dataset, attrib: st
         src_dataset.attrs[attrib].dtype)
 
 
-def update_hydrograph(hdf_filepath: str,
+def update_hydrograph(hdf_filepath: Union[str, h5py.File],
                       hydrograph_name: str,
-                      timeseries: pd.DataFrame,
-                      keep_dates: bool = False) -> None:
-    """Update the hydrograph data from a pandas dataframe containing timeseries data
+                      timeseries: Union[Timeseries, 'pd.DataFrame'],
+                      keep_dates: bool = False,
+                      group: str = FLOW_HYDROGRAPHS_GROUP,
+                      profile: Union[str, None] = None) -> None:
+    """Update the hydrograph data from a Timeseries or a pandas dataframe with 'time' and 'value' columns
 
     Args:
-        hdf_filepath (str): local filepath to HDF file to update
-        hydrograph_name (str): name of the hydrograph to update. This dataset should be in the
-        '/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/' group of the HDF file.
+        hdf_filepath (Union[str, h5py.File]): local filepath to HDF file to update or an HDF file open for writing
+        hydrograph_name (str): name of the hydrograph to update. This dataset should be in the group of the HDF file.
         keep_dates (bool): If true, do not modify 'StartDate' and 'EndDate' in HDF hydrograph attributes based on
         hydrograph start/end datetimes
+        group (str, optional): group of the hydrograph (see HYDROGRAPH_GROUPS). Defaults to FLOW_HYDROGRAPHS_GROUP
+        ('/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/').
+        profile (Union[str, None], optional): one of WRITE_PROFILES to write the hydrograph datasets with. Existing
+        chunked datasets with room for the rows are updated in place unless a profile with other filters is given.
+        Defaults to None (DEFAULT_WRITE_PROFILE for new datasets).
     """
-    hydrograph_dataset_path = "/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + hydrograph_name
-    temp_hydrograph_dataset_path = "/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/temp"
-    with h5py.File(hdf_filepath, 'r+') as file:
-        # maxsize of dataset is set on creation so we can't just update the data in place.
-        # create a new dataset since the existing may have been created with a max size that is too small.
-        num_rows = len(timeseries.index)
-        ex_dataset = file[hydrograph_dataset_path]
-        units = ex_dataset.attrs['Interval'].decode()
-        data = np.column_stack((
-            create_hydrograph_times(timeseries['time'], units),
-            timeseries['value'].to_numpy(dtype=np.float32)
-        ))
-        new_dataset = file.create_dataset(name=temp_hydrograph_dataset_path, shape=(
-            num_rows, 2), dtype='f', data=data, maxshape=(num_rows, 2), compression='gzip', compression_opts=1)
-        # copy attributes
-        copy_attrib(ex_dataset, new_dataset, "Coordinates")
-        copy_attrib(ex_dataset, new_dataset, "Data Type")
-        copy_attrib(ex_dataset, new_dataset, "Interval")
-        copy_attrib(ex_dataset, new_dataset, "Node Index")
-        copy_attrib(ex_dataset, new_dataset, "RS")
-        copy_attrib(ex_dataset, new_dataset, "Reach")
-        copy_attrib(ex_dataset, new_dataset, "River")
-        if not keep_dates:
-            copy_attrib(ex_dataset, new_dataset, 'Start Date', format_date_string_hydrograph_attrib(
-                min(timeseries['time'])))
-            copy_attrib(ex_dataset, new_dataset, 'End Date', format_date_string_hydrograph_attrib(
-                max(timeseries['time'])))
-        else:
-            copy_attrib(ex_dataset, new_dataset, "Start Date")
-            copy_attrib(ex_dataset, new_dataset, "End Date")
+    update_hydrographs(hdf_filepath, {hydrograph_name: timeseries}, keep_dates=keep_dates, group=group,
+                       profile=profile)
+
+
+def update_hydrographs(hdf_filepath: Union[str, h5py.File],
+                       hydrographs: Dict[str, Union[Timeseries, 'pd.DataFrame']],
+                       keep_dates: bool = False,
+                       group: str = FLOW_HYDROGRAPHS_GROUP,
+                       profile: Union[str, None] = None) -> None:
+    """Update many hydrographs from Timeseries or pandas dataframes with 'time' and 'value' columns. The HDF file is
+    opened once for all updates.
+
+    Args:
+        hdf_filepath (Union[str, h5py.File]): local filepath to HDF file to update or an HDF file open for writing
+        (e.g. HdfEdit.file)
+        hydrographs (Dict[str, Union[Timeseries, pd.DataFrame]]): mapping of hydrograph name to timeseries data. Each
+        hydrograph should be in the group of the HDF file.
+        keep_dates (bool): If true, do not modify 'StartDate' and 'EndDate' in HDF hydrograph attributes based on
+        hydrograph start/end datetimes
+        group (str, optional): group of the hydrographs (see HYDROGRAPH_GROUPS). Defaults to FLOW_HYDROGRAPHS_GROUP
+        ('/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/').
+        profile (Union[str, None], optional): one of WRITE_PROFILES to write the hydrograph datasets with. Existing
+        chunked datasets with room for the rows are updated in place unless a profile with other filters is given.
+        Defaults to None (DEFAULT_WRITE_PROFILE for new datasets).
+    """
+    if profile is not None:
+        _check_profile(profile)
+    is_open = isinstance(hdf_filepath, h5py.File)
+    with stage('update_hydrographs', hdf_filepath=hdf_filepath.filename if is_open else hdf_filepath,
+               hydrographs=len(hydrographs), group=group) as current:
+        current.bytes_written = 0
+        with nullcontext(hdf_filepath) if is_open else h5py.File(hdf_filepath, 'r+') as file:
+            for hydrograph_name, timeseries in hydrographs.items():
+                _write_hydrograph(file, group + hydrograph_name, as_timeseries(timeseries), keep_dates, profile)
+                # uncompressed size of the time and value columns
+                current.bytes_written += len(timeseries) * 2 * np.dtype(np.float32).itemsize
+
+
+def _write_hydrograph(file: h5py.File, hydrograph_dataset_path: str, timeseries: Timeseries,
+                      keep_dates: bool, profile: Union[str, None] = None) -> None:
+    """Overwrite a hydrograph dataset in an open HDF file with new timeseries data"""
+    temp_hydrograph_dataset_path = hydrograph_dataset_path.rsplit('/', 1)[0] + "/temp"
+    num_rows = len(timeseries)
+    ex_dataset = file[hydrograph_dataset_path]
+    units = ex_dataset.attrs['Interval'].decode()
+    # fill the rows of the dataset directly instead of stacking copies of the columns
+    data = np.empty((num_rows, 2), dtype=np.float32)
+    data[:, 0] = create_hydrograph_times(timeseries.time, units)
+    data[:, 1] = timeseries.value
+    options = dataset_options(profile or DEFAULT_WRITE_PROFILE, data.shape, data.dtype)
+    if _can_resize(ex_dataset, num_rows) and (profile is None or _has_profile_filters(ex_dataset, options)):
+        # update in place so the space of the old data is not left unused in the file
+        ex_dataset.resize(num_rows, axis=0)
+        ex_dataset[...] = data
+        dataset = ex_dataset
+    else:
+        # maxsize of dataset is set on creation so it can't be updated in place if the max size is too small.
+        # create a new chunked dataset with unlimited rows so future updates can be done in place.
+        dataset = file.create_dataset(name=temp_hydrograph_dataset_path, shape=(
+            num_rows, 2), dtype='f', data=data, maxshape=(None, 2), **options)
+        for attrib in ex_dataset.attrs.keys():
+            copy_attrib(ex_dataset, dataset, attrib)
+    if not keep_dates and 'Start Date' in ex_dataset.attrs:
+        copy_attrib(ex_dataset, dataset, 'Start Date', format_date_string_hydrograph_attrib(
+            timeseries.time.min().astype('datetime64[us]').item()))
+        copy_attrib(ex_dataset, dataset, 'End Date', format_date_string_hydrograph_attrib(
+            timeseries.time.max().astype('datetime64[us]').item()))
+    if dataset is not ex_dataset:
         # delete existing dataset and move new dataset
         del file[hydrograph_dataset_path]
         file.move(temp_hydrograph_dataset_path, hydrograph_dataset_path)
+
+
+def read_hydrographs(file: h5py.File, groups: Union[Dict[str, str], None] = None) -> List[Dict[str, Any]]:
+    """Read the boundary hydrographs of an open plan HDF file with their attributes, the reverse of update_hydrographs.
+    Times are the 'Start Date' attribute (or the simulation start if there is none) plus the offsets in the first
+    column in 'Interval' units, rounded to the nearest second.
+
+    Args:
+        file (h5py.File): open plan HDF file
+        groups (Union[Dict[str, str], None], optional): mapping of boundary type to hydrograph group. Defaults to None,
+        which reads all HYDROGRAPH_GROUPS.
+
+    Raises:
+        ValueError
+
+    Returns:
+        List[Dict[str, Any]]: hydrographs with keys 'boundary_type', 'name', 'river', 'reach', 'rs', 'start_date',
+        'interval', 'time' (datetime64 array) and 'value' (float32 array)
+    """
+    simulation_start = read_simulation_window(file)[0] if PLAN_INFORMATION_GROUP in file else None
+    hydrographs = []
+    for boundary_type, group in (groups or HYDROGRAPH_GROUPS).items():
+        if group not in file:
+            continue
+        for name, dataset in file[group].items():
+            if not isinstance(dataset, h5py.Dataset) or dataset.shape[1:] != (2,):
+                continue
+            units = _attr_text(dataset, 'Interval')
+            if units not in HYDROGRAPH_INTERVAL_UNITS:
+                raise ValueError(f"Hydrograph '{group}{name}' has unknown interval units. Must be one of "
+                                 f"{list(HYDROGRAPH_INTERVAL_UNITS)} but found {units}")
+            start_text = _attr_text(dataset, 'Start Date')
+            start = parse_ras_datetime(start_text) if start_text else simulation_start
+            if start is None:
+                raise ValueError(f"Hydrograph '{group}{name}' has no 'Start Date' and the plan has no simulation start")
+            data = dataset[...]
+            seconds = np.rint(data[:, 0].astype(np.float64) * (HYDROGRAPH_INTERVAL_UNITS[units] / 10**9))
+            hydrographs.append({
+                'boundary_type': boundary_type,
+                'name': name,
+                'river': _attr_text(dataset, 'River'),
+                'reach': _attr_text(dataset, 'Reach'),
+                'rs': _attr_text(dataset, 'RS'),
+                'start_date': start,
+                'interval': units,
+                'time': np.datetime64(start, 'ns') + seconds.astype('timedelta64[s]'),
+                'value': data[:, 1].astype(np.float32),
+            })
+    return hydrographs
+
+
+def _attr_text(dataset: h5py.Dataset, attrib: str) -> str:
+    """Get a string attribute of a dataset, or an empty string if it doesn't exist"""
+    value = dataset.attrs.get(attrib)
+    if value is None:
+        return ''
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _can_resize(dataset: h5py.Dataset, num_rows: int) -> bool:
+    """Check if a 2 column dataset can be resized to num_rows in place"""
+    return dataset.chunks is not None and dataset.shape[1:] == (2,) and \
+        (dataset.maxshape[0] is None or dataset.maxshape[0] >= num_rows)
+
+
+def repack_hdf(hdf_filepath: str, profile: Union[str, None] = None) -> Tuple[int, int]:
+    """Rewrite an HDF file to reclaim the unused space left by deleted or replaced datasets.
+
+    Args:
+        hdf_filepath (str): local filepath to HDF file to repack
+        profile (Union[str, None], optional): one of WRITE_PROFILES to recompress the datasets with. Defaults to None
+        (keep the filters and chunks of the datasets).
+
+    Returns:
+        Tuple[int, int]: file size in bytes before and after repacking
+    """
+    if profile is not None:
+        _check_profile(profile)
+    with stage('repack_hdf', hdf_filepath=hdf_filepath, profile=profile) as current:
+        size_before = os.path.getsize(hdf_filepath)
+        with temp_file(ext=".hdf", size=size_before) as temp_filepath:
+            with h5py.File(hdf_filepath, 'r') as src:
+                _copy_groups(src, temp_filepath, None, profile)
+            shutil.move(temp_filepath, hdf_filepath)
+        size_after = os.path.getsize(hdf_filepath)
+        current.bytes_read = size_before
+        current.bytes_written = size_after
+    return size_before, size_after
+
+
+def write_gridded_boundary(hdf_filepath: Union[str, h5py.File],
+                           chunks: Iterable[Tuple['np.ndarray', 'np.ndarray']],
+                           group: str = GRIDDED_PRECIPITATION_GROUP,
+                           chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                           profile: str = DEFAULT_WRITE_PROFILE) -> int:
+    """Replace a gridded boundary (e.g. gridded precipitation) with data streamed in chunks of rows, so only one chunk
+    is held in memory at a time. The group gets a 'Values' dataset with a row of cell values per time and a
+    'Timestamp' dataset with the time of each row in HEC-RAS date format. Both are chunked by chunk_rows rows and
+    compressed with the filters of a write profile. Attributes of existing datasets are kept.
+
+    Args:
+        hdf_filepath (Union[str, h5py.File]): local filepath to HDF file to update or an HDF file open for writing
+        chunks (Iterable[Tuple[np.ndarray, np.ndarray]]): chunks of (times, values), where times is a datetime64
+        array of length n and values is an array of shape (n, cells). Every chunk must have the same number of cells.
+        group (str, optional): group of the boundary. Defaults to GRIDDED_PRECIPITATION_GROUP.
+        chunk_rows (int, optional): rows per HDF chunk. Defaults to DEFAULT_CHUNK_ROWS.
+        profile (str, optional): one of WRITE_PROFILES. Defaults to DEFAULT_WRITE_PROFILE.
+
+    Raises:
+        ValueError
+
+    Returns:
+        int: number of rows written
+    """
+    _check_profile(profile)
+    is_open = isinstance(hdf_filepath, h5py.File)
+    with stage('write_gridded_boundary', hdf_filepath=hdf_filepath.filename if is_open else hdf_filepath,
+               group=group) as current:
+        current.bytes_written = 0
+        rows = 0
+        with nullcontext(hdf_filepath) if is_open else h5py.File(hdf_filepath, 'r+') as file:
+            grid_group = file.require_group(group)
+            values_dataset = timestamp_dataset = None
+            for times, values in chunks:
+                values = np.asarray(values, dtype=np.float32)
+                if values.ndim != 2 or values.shape[0] != len(times):
+                    raise ValueError(f"Gridded boundary chunks must have a row of values per time but found "
+                                     f"{len(times)} times and values of shape {values.shape}")
+                if values_dataset is None:
+                    values_dataset = _replace_dataset(grid_group, "Values", (0, values.shape[1]), np.float32,
+                                                      (chunk_rows, values.shape[1]), profile)
+                    timestamp_dataset = _replace_dataset(grid_group, "Timestamp", (0,), 'S18', (chunk_rows,),
+                                                         profile)
+                elif values.shape[1] != values_dataset.shape[1]:
+                    raise ValueError(f"Gridded boundary chunks must have {values_dataset.shape[1]} cells but found "
+                                     f"{values.shape[1]}")
+                values_dataset.resize(rows + len(times), axis=0)
+                values_dataset[rows:] = values
+                timestamp_dataset.resize(rows + len(times), axis=0)
+                timestamp_dataset[rows:] = format_ras_timestamps(times)
+                rows += len(times)
+                current.bytes_written += values.nbytes
+            if values_dataset is None:
+                raise ValueError("Gridded boundary has no data")
+            current.labels['cells'] = values_dataset.shape[1]
+        current.labels['rows'] = rows
+    return rows
+
+
+def _replace_dataset(group: h5py.Group, name: str, shape: tuple, dtype: Any, chunks: tuple,
+                     profile: str) -> h5py.Dataset:
+    """Replace a dataset with an empty chunked dataset with the filters of a write profile, unlimited rows and the
+    same attributes"""
+    attrs = dict(group[name].attrs) if name in group else {}
+    if name in group:
+        del group[name]
+    options = dataset_options(profile, shape, dtype)
+    options['chunks'] = chunks
+    dataset = group.create_dataset(name, shape=shape, dtype=dtype, maxshape=(None,) + shape[1:], **options)
+    for attrib, value in attrs.items():
+        dataset.attrs[attrib] = value
+    return dataset
+
+
+def format_ras_timestamps(times: 'np.ndarray') -> 'np.ndarray':
+    """Format times in the HEC-RAS timestamp format of gridded data
+
+    Args:
+        times (np.ndarray): datetime64 array of times
+
+    Returns:
+        np.ndarray: array of 'DDMMMYYYY HH:MM:SS' byte strings
+    """
+    return np.array([time.strftime("%d%b%Y %H:%M:%S")
+                     for time in np.asarray(times, dtype='datetime64[s]').astype(datetime)], dtype='S18')
+
+
+def build_hdf_index(file: h5py.File) -> Dict[str, Any]:
+    """Build a compact index of the structure of an open HDF file: every group and dataset with the shape, dtype,
+    chunks, compression and storage size of datasets and the small attributes (e.g. 'Start Date' and 'Interval') of
+    both. Only metadata is read, so building the index of a file opened with a RangeReader transfers little data.
+
+    Args:
+        file (h5py.File): open HDF file
+
+    Returns:
+        Dict[str, Any]: JSON serializable index with 'attrs' (root attributes), 'groups' (mapping of group path to
+        {'attrs'}) and 'datasets' (mapping of dataset path to {'shape', 'dtype', 'chunks', 'compression',
+        'storage_bytes', 'attrs'})
+    """
+    index: Dict[str, Any] = {'attrs': _index_attrs(file.attrs), 'groups': {}, 'datasets': {}}
+
+    def visit(name: str, item: Union[h5py.Group, h5py.Dataset]) -> None:
+        if isinstance(item, h5py.Dataset):
+            index['datasets']['/' + name] = {
+                'shape': list(item.shape),
+                'dtype': str(item.dtype),
+                'chunks': list(item.chunks) if item.chunks else None,
+                'compression': item.compression,
+                'storage_bytes': item.id.get_storage_size(),
+                'attrs': _index_attrs(item.attrs),
+            }
+        elif isinstance(item, h5py.Group):
+            index['groups']['/' + name] = {'attrs': _index_attrs(item.attrs)}
+
+    with stage('build_hdf_index', hdf_filepath=file.filename) as current:
+        file.visititems(visit)
+        current.labels['groups'] = len(index['groups'])
+        current.labels['datasets'] = len(index['datasets'])
+    return index
+
+
+def _index_attrs(attrs: h5py.AttributeManager) -> Dict[str, Any]:
+    """Get the attributes with at most INDEX_MAX_ATTRIB_SIZE values as JSON serializable values"""
+    result = {}
+    for name in attrs.keys():
+        try:
+            value = attrs[name]
+        except (OSError, TypeError):
+            # attributes with types h5py can't read
+            continue
+        if isinstance(value, np.ndarray):
+            if value.size > INDEX_MAX_ATTRIB_SIZE or value.dtype.names is not None:
+                continue
+            value = value.tolist()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, bytes):
+            value = value.decode(errors='replace')
+        elif isinstance(value, list):
+            value = [item.decode(errors='replace') if isinstance(item, bytes) else item for item in value]
+        result[name] = value
+    return result
+
+
+def read_hdf_index(hdf_uri: str, sidecar: bool = False) -> Dict[str, Any]:
+    """Get the index of an HDF file (see build_hdf_index) without downloading it. The index is stored for the
+    current content of the file (see cache_util.content_key) in the cache if one is configured and, if sidecar is
+    true, in a sidecar file next to the HDF file (<hdf_uri>.index.json). A stored index is reused until the file
+    changes. Otherwise the index is built by reading only the metadata of the file in byte ranges.
+
+    Args:
+        hdf_uri (str): URI of the HDF file
+        sidecar (bool, optional): read and write the index sidecar file next to the HDF file. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: the index
+    """
+    key = content_key(hdf_uri)
+    cache = get_cache()
+    index = cache.read_index(hdf_uri, "hdf_index") if cache is not None else None
+    if index is None and sidecar:
+        index = _read_index_sidecar(hdf_uri + INDEX_SIDECAR_EXT, key)
+    if index is not None:
+        return index
+    with stage('read_hdf_index', hdf_uri=hdf_uri) as current:
+        with RangeReader(hdf_uri) as hdf_file:
+            with h5py.File(hdf_file, 'r') as file:
+                index = build_hdf_index(file)
+            current.bytes_read = hdf_file.bytes_transferred
+    if cache is not None:
+        cache.write_index(hdf_uri, "hdf_index", index)
+    if sidecar:
+        put_string(json.dumps({'content_key': key, 'index': index}), hdf_uri + INDEX_SIDECAR_EXT)
+    return index
+
+
+def _read_index_sidecar(sidecar_uri: str, key: str) -> Union[Dict[str, Any], None]:
+    """Read an index sidecar file if it exists and was written for the content with the given key"""
+    try:
+        sidecar = json.loads(get_string(sidecar_uri))
+    except (FileNotFoundError, ValueError):
+        return None
+    return sidecar.get('index') if sidecar.get('content_key') == key else None
+
+
+def index_hydrographs(index: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """List the boundary hydrographs in an HDF index (see build_hdf_index).
+
+    Args:
+        index (Dict[str, Any]): HDF index
+
+    Returns:
+        List[Dict[str, Any]]: hydrographs with keys 'boundary_type', 'name', 'rows', 'start_date' and 'interval'
+    """
+    hydrographs = []
+    for boundary_type, group in HYDROGRAPH_GROUPS.items():
+        for path, dataset in index['datasets'].items():
+            if path.startswith(group) and '/' not in path[len(group):]:
+                hydrographs.append({
+                    'boundary_type': boundary_type,
+                    'name': path[len(group):],
+                    'rows': dataset['shape'][0],
+                    'start_date': dataset['attrs'].get('Start Date'),
+                    'interval': dataset['attrs'].get('Interval'),
+                })
+    return hydrographs
+
+
+def index_group_sizes(index: Dict[str, Any], depth: int = 1) -> Dict[str, int]:
+    """Sum the storage size of the datasets in each group of an HDF index (see build_hdf_index) down to a depth, e.g.
+    to decide which groups to remove with copy_hdf.
+
+    Args:
+        index (Dict[str, Any]): HDF index
+        depth (int, optional): depth of the groups, 1 for the top level groups. Defaults to 1.
+
+    Returns:
+        Dict[str, int]: mapping of group path to storage size in bytes, largest first
+    """
+    sizes: Dict[str, int] = {}
+    for path, dataset in index['datasets'].items():
+        group = '/'.join(path.split('/')[:depth + 1])
+        if group != path:
+            sizes[group] = sizes.get(group, 0) + dataset['storage_bytes']
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
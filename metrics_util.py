@@ -0,0 +1,185 @@
+"""
+Per-stage metrics for downloads, hydrograph reads, HDF rewrites and uploads.
+Instrumented code wraps each stage in `stage()`, which measures the duration and peak memory of the stage and lets the
+stage report the bytes it read and wrote. Finished stages are passed to hooks registered with `add_hook` (e.g. to
+forward them to a monitoring system) and are kept in memory between `start_recording` and `stop_recording`.
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Union
+import threading
+import time
+
+MetricsHook = Callable[[Dict[str, Any]], None]
+
+_HOOKS: List[MetricsHook] = []
+_RECORDS: Union[List[Dict[str, Any]], None] = None
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+# stages running in any thread, whose peak RSS is raised to the peak of the process since the last reset
+_RUNNING: List['Stage'] = []
+# whether the peak RSS of the process can be reset (Linux only)
+_CAN_RESET_PEAK = True
+
+
+class Stage:
+    """Measurements of a running stage. Instrumented code adds to bytes_read and bytes_written."""
+    __slots__ = ['name', 'labels', 'bytes_read', 'bytes_written', 'peak_rss_mb']
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.bytes_read: Union[int, None] = None
+        self.bytes_written: Union[int, None] = None
+        self.peak_rss_mb: Union[float, None] = None
+
+
+@contextmanager
+def stage(name: str, **labels: Any) -> Iterator[Stage]:
+    """Measure a stage of work. The record of the stage has the keys 'stage', 'parent' (name of the enclosing stage
+    in this thread or None), 'start' (epoch seconds), 'seconds', 'bytes_read', 'bytes_written', 'peak_rss_mb' (peak
+    RSS of the process while the stage ran, which includes memory used by stages running at the same time in other
+    threads, or None where the peak can't be reset), 'error' (exception type if the stage failed or None) and the
+    labels.
+
+    Args:
+        name (str): stage name (e.g. 'get_temp_file')
+        **labels (Any): JSON serializable values describing the stage (e.g. uri='s3://bucket/key')
+
+    Yields:
+        Iterator[Stage]: the running stage
+    """
+    stack = _stack()
+    parent = stack[-1].name if stack else None
+    current = Stage(name, labels)
+    stack.append(current)
+    with _LOCK:
+        _update_peaks()
+        _RUNNING.append(current)
+    start = time.time()
+    start_counter = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        # stages of generators are not always closed in the order they were opened
+        stack.remove(current)
+        with _LOCK:
+            _update_peaks()
+            _RUNNING.remove(current)
+        record = {
+            'stage': name,
+            'parent': parent,
+            'start': start,
+            'seconds': time.perf_counter() - start_counter,
+            'bytes_read': current.bytes_read,
+            'bytes_written': current.bytes_written,
+            'peak_rss_mb': current.peak_rss_mb,
+            'error': error,
+            **labels
+        }
+        emit(record)
+
+
+def emit(record: Dict[str, Any]) -> None:
+    """Pass a finished stage record to the hooks and keep it if recording. Also used to add records measured in
+    other processes.
+
+    Args:
+        record (Dict[str, Any]): stage record
+    """
+    with _LOCK:
+        if _RECORDS is not None:
+            _RECORDS.append(record)
+        hooks = list(_HOOKS)
+    for hook in hooks:
+        hook(record)
+
+
+def add_hook(hook: MetricsHook) -> None:
+    """Call a function with the record of every finished stage.
+
+    Args:
+        hook (MetricsHook): function taking a stage record (see stage)
+    """
+    with _LOCK:
+        _HOOKS.append(hook)
+
+
+def remove_hook(hook: MetricsHook) -> None:
+    """Stop calling a function added with add_hook.
+
+    Args:
+        hook (MetricsHook): function added with add_hook
+    """
+    with _LOCK:
+        _HOOKS.remove(hook)
+
+
+def start_recording() -> None:
+    """Keep the records of finished stages in memory until stop_recording is called."""
+    global _RECORDS  # pylint: disable=global-statement
+    with _LOCK:
+        _RECORDS = []
+
+
+def stop_recording() -> List[Dict[str, Any]]:
+    """Stop keeping records of finished stages.
+
+    Returns:
+        List[Dict[str, Any]]: records of stages finished since start_recording was called
+    """
+    global _RECORDS  # pylint: disable=global-statement
+    with _LOCK:
+        records = _RECORDS or []
+        _RECORDS = None
+    return records
+
+
+def reset_for_worker() -> None:
+    """Remove hooks and start recording in a worker process. The worker returns stop_recording() to the parent
+    process, which passes the records to emit so hooks are only called in the parent."""
+    global _RECORDS  # pylint: disable=global-statement
+    with _LOCK:
+        _HOOKS.clear()
+        _RECORDS = []
+
+
+def _update_peaks() -> None:
+    """Raise the peak RSS of the running stages to the peak RSS of the process since the last reset, then reset the
+    peak of the process to its current RSS. Must be called with _LOCK held."""
+    global _CAN_RESET_PEAK  # pylint: disable=global-statement
+    if not _CAN_RESET_PEAK:
+        return
+    peak = _read_peak_rss_mb()
+    try:
+        # writing 5 resets the peak RSS (VmHWM) of the process to its current RSS
+        with open("/proc/self/clear_refs", 'w', encoding='utf-8') as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        _CAN_RESET_PEAK = False
+        return
+    for running in _RUNNING:
+        if peak is not None:
+            running.peak_rss_mb = max(running.peak_rss_mb or 0.0, peak)
+
+
+def _read_peak_rss_mb() -> Union[float, None]:
+    """Peak RSS of the process in MiB since the last reset, or None if unknown"""
+    try:
+        with open("/proc/self/status", 'r', encoding='utf-8') as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def _stack() -> List[Stage]:
+    """Stages running in this thread"""
+    if not hasattr(_LOCAL, 'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
@@ -0,0 +1,185 @@
+"""
+Utility functions for HEC-RAS project files.
+A plan run needs the plan HDF file with its Results removed (*.p**.tmp.hdf) and the text files of the plan, its
+geometry and its flow. The files are found from the project (*.prj) and plan (*.p**) text files and staged to run
+directories by stage_plan_run.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, List, Tuple, Union
+import os
+import re
+import fsspec
+from fsspec.implementations.local import LocalFileSystem
+from fs_util import DEFAULT_MAX_WORKERS, clone_file, expand_uris, get_string, get_temp_file, put_file, temp_file
+from hdf_util import copy_hdf
+from metrics_util import stage
+from workspace_util import get_workspace
+
+# <project>.p<plan>, <project>.p<plan>.hdf or <project>.p<plan>.tmp.hdf
+PLAN_URI_PATTERN = re.compile(r"^(?P<project>.+)\.p(?P<plan>\d{2})(\.tmp)?(\.hdf)?$")
+# extensions of the files of a plan run that are named after the plan number
+PLAN_RUN_EXTS = [".p{plan}", ".b{plan}", ".c{plan}", ".x{plan}"]
+# extensions of the files named after the geometry (g**) and flow (u**, f** or q**) files of a plan
+PLAN_INPUT_EXTS = ["", ".hdf"]
+PROJECT_EXTS = [".prj", ".rasmap"]
+
+
+def parse_plan_uri(src_uri: str, plan: Union[str, None] = None) -> Tuple[str, str, str]:
+    """Get the directory, project name and plan number of a project or plan URI.
+
+    Args:
+        src_uri (str): URI of a project file (*.prj) or of a plan file (*.p**, *.p**.hdf or *.p**.tmp.hdf)
+        plan (Union[str, None], optional): plan of a project file (e.g. 'p04' or '04'). Defaults to None, which
+        uses the plan of a plan URI or the 'Current Plan' of a project file.
+
+    Raises:
+        ValueError: if the URI is not a project or plan file, or a project file has no current plan
+
+    Returns:
+        Tuple[str, str, str]: directory URI, project name and two digit plan number
+    """
+    directory, _, filename = src_uri.rstrip('/').rpartition('/')
+    directory = directory or "."
+    match = PLAN_URI_PATTERN.match(filename)
+    if filename.endswith(".prj"):
+        project = filename[:-len(".prj")]
+        if plan is None:
+            plan = read_key_values(get_string(src_uri)).get('Current Plan')
+            if not plan:
+                raise ValueError(f"Project {src_uri} has no 'Current Plan'. Give the plan to stage.")
+    elif match:
+        project = match.group('project')
+        plan = plan or match.group('plan')
+    else:
+        raise ValueError(f"Invalid project or plan URI. Must be a *.prj or *.p** file but found {src_uri}")
+    number = plan.lower().lstrip('p')
+    if not re.fullmatch(r"\d{2}", number):
+        raise ValueError(f"Invalid plan. Must be like p04 or 04 but found {plan}")
+    return directory, project, number
+
+
+def read_key_values(text: str) -> Dict[str, str]:
+    """Read the Key=Value lines of a HEC-RAS text file, keeping the first value of each key"""
+    values: Dict[str, str] = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition('=')
+        if sep and key.strip() not in values:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def find_plan_files(src_uri: str, plan: Union[str, None] = None,
+                    include: Union[List[str], None] = None) -> Tuple[str, Dict[str, str]]:
+    """Find the files a plan run needs in the directory of a project or plan file: the plan HDF file, the project
+    file, the plan files (*.p**, *.b**, *.c** and *.x**) and the geometry and flow files named in the 'Geom File'
+    and 'Flow File' lines of the plan file (e.g. *.g01, *.g01.hdf, *.u01 and *.u01.hdf). Files that do not exist are
+    left out.
+
+    Args:
+        src_uri (str): URI of a project file (*.prj) or of a plan file (*.p**, *.p**.hdf or *.p**.tmp.hdf)
+        plan (Union[str, None], optional): plan of a project file (see parse_plan_uri). Defaults to None.
+        include (Union[List[str], None], optional): patterns with '*', '?' and '[' wildcards of extra files relative
+        to the project directory (e.g. 'Terrain/*'). Defaults to None.
+
+    Raises:
+        FileNotFoundError: if the plan has no plan HDF file
+
+    Returns:
+        Tuple[str, Dict[str, str]]: URI of the plan HDF file and a mapping of the path relative to the run directory
+        to the URI of each other file
+    """
+    directory, project, number = parse_plan_uri(src_uri, plan)
+    fs, path = fsspec.core.url_to_fs(directory)
+    existing = {os.path.basename(entry.rstrip('/')) for entry in fs.ls(path, detail=False)}
+    plan_hdf = next((f"{project}.p{number}{ext}" for ext in (".hdf", ".tmp.hdf")
+                     if f"{project}.p{number}{ext}" in existing), None)
+    if plan_hdf is None:
+        raise FileNotFoundError(f"No plan HDF file {project}.p{number}.hdf in {directory}")
+    names = [project + ext for ext in PROJECT_EXTS]
+    names += [project + ext.format(plan=number) for ext in PLAN_RUN_EXTS]
+    plan_text = f"{project}.p{number}"
+    if plan_text in existing:
+        references = read_key_values(get_string(_join(directory, plan_text)))
+        for key in ('Geom File', 'Flow File'):
+            if references.get(key):
+                names += [f"{project}.{references[key]}{ext}" for ext in PLAN_INPUT_EXTS]
+    files = {name: _join(directory, name) for name in names if name in existing}
+    if include:
+        prefix = directory.rstrip('/') + '/'
+        for uri in expand_uris([prefix + pattern for pattern in include]):
+            if fs.isfile(fsspec.core.url_to_fs(uri)[1]):
+                files.setdefault(uri[len(prefix):] if uri.startswith(prefix) else os.path.relpath(uri, directory), uri)
+    return _join(directory, plan_hdf), files
+
+
+def stage_plan_run(src_uri: str, run_dirs: List[str], plan: Union[str, None] = None,
+                   include: Union[List[str], None] = None, link: str = 'reflink',
+                   max_workers: int = DEFAULT_MAX_WORKERS, range_read: bool = False,
+                   in_memory_max_bytes: int = 0) -> Dict[str, int]:
+    """Stage the files a plan run needs (see find_plan_files) to one or more run directories. The plan HDF file is
+    copied once with its Results removed and saved as *.p**.tmp.hdf in each run directory. Remote files are
+    downloaded once. Files are created in local run directories with clone_file, so local files are reflinked instead
+    of copied where the filesystem allows it. Inputs are only hardlinked with link='hardlink', which shares them with
+    the source and every other run directory, so a run that rewrites an input (e.g. the geometry preprocessor
+    rewriting *.c** and *.x**) changes them all. The plan HDF file is never hardlinked. Files are downloaded, cloned
+    and uploaded concurrently.
+
+    Args:
+        src_uri (str): URI of a project file (*.prj) or of a plan file (*.p**, *.p**.hdf or *.p**.tmp.hdf)
+        run_dirs (List[str]): URIs of the run directories
+        plan (Union[str, None], optional): plan of a project file (see parse_plan_uri). Defaults to None.
+        include (Union[List[str], None], optional): patterns of extra files relative to the project directory.
+        Defaults to None.
+        link (str, optional): one of fs_util.LINK_MODES. Defaults to 'reflink'.
+        max_workers (int, optional): max number of files staged at the same time. Defaults to DEFAULT_MAX_WORKERS.
+        range_read (bool, optional): read only the needed byte ranges of the plan HDF file. Defaults to False.
+        in_memory_max_bytes (int, optional): copy plan HDF files up to this size in memory (see
+        hdf_util.copy_hdf). Defaults to 0.
+
+    Returns:
+        Dict[str, int]: number of files staged by each method ('reflink', 'hardlink', 'copy' or 'unchanged')
+    """
+    plan_hdf_uri, files = find_plan_files(src_uri, plan, include)
+    _, project, number = parse_plan_uri(plan_hdf_uri)
+    plan_hdf_name = f"{project}.p{number}.tmp.hdf"
+    counts = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'unchanged': 0}
+    with stage('stage_plan_run', src=src_uri, plan=number, run_dirs=len(run_dirs)) as current, ExitStack() as stack:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            plan_filepath = stack.enter_context(temp_file(ext=".hdf"))
+            plan_copy = executor.submit(copy_hdf, plan_hdf_uri, plan_filepath, ["Results"], range_read=range_read,
+                                        in_memory_max_bytes=in_memory_max_bytes)
+            downloads = {name: executor.submit(get_temp_file, uri) for name, uri in files.items()
+                         if not _is_local(uri)}
+            local = {name: uri for name, uri in files.items() if _is_local(uri)}
+            for name, download in downloads.items():
+                local[name] = download.result()
+                stack.callback(get_workspace().remove, local[name])
+            plan_copy.result()
+            local[plan_hdf_name] = plan_filepath
+            stagings = [executor.submit(_stage_file, filepath, run_dir, name,
+                                        ('copy' if link == 'copy' else 'reflink') if name == plan_hdf_name else link)
+                        for run_dir in run_dirs for name, filepath in local.items()]
+            for staging in stagings:
+                counts[staging.result()] += 1
+        current.labels.update(counts)
+    return counts
+
+
+def _stage_file(filepath: str, run_dir: str, name: str, link: str) -> str:
+    """Clone a local file into a local run directory or upload it to a remote run directory"""
+    dst_uri = _join(run_dir, name)
+    if _is_local(dst_uri):
+        return clone_file(filepath, fsspec.core.url_to_fs(dst_uri)[1], link)
+    put_file(filepath, dst_uri)
+    return 'copy'
+
+
+def _join(directory: str, name: str) -> str:
+    """Join a directory URI and a relative path"""
+    return f"{directory.rstrip('/')}/{name}"
+
+
+def _is_local(uri: str) -> bool:
+    """Check if a URI is on the local filesystem"""
+    return isinstance(fsspec.core.url_to_fs(uri)[0], LocalFileSystem)
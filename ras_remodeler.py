@@ -1,15 +1,61 @@
 #!/usr/bin/env python3
 """CLI tools for reshaping HEC-RAS model data."""
-from typing import Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Union
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import sys
+import threading
+import time
 import click
-from fs_util import get_temp_file, put_file
-from dss_util import read_csv_timeseries, read_dss_timeseries
-from hdf_util import copy_hdf, update_hydrograph
+from cache_util import DEFAULT_CACHE_MAX_BYTES, configure_cache, get_cache
+import metrics_util
+from workspace_util import configure_workspace
+
+if TYPE_CHECKING:
+    from datetime import datetime
+    from hdf_util import HdfEdit
+    from timeseries_util import Timeseries
+
+# fs_util, dss_util and hdf_util import fsspec, pandas, pyarrow, pydsstools and h5py, so they are imported by the
+# commands that use them to keep startup fast (see tests/test_startup.py).
+# pylint: disable=import-outside-toplevel
+
+INPUT_TYPES = ['DSS', 'CSV', 'PARQUET']
+# boundary condition types of hydrographs (see hdf_util.HYDROGRAPH_GROUPS)
+BOUNDARY_TYPES = ['FLOW', 'STAGE', 'LATERAL']
+GRID_INPUT_TYPES = ['DSS', 'PARQUET']
+INDEX_VIEWS = ['INDEX', 'HYDROGRAPHS', 'GROUPS']
+# plan HDF files up to this size are edited in memory instead of through temp files (set with --in_memory_max_bytes)
+_IN_MEMORY_MAX_BYTES = 0
+# max number of hydrograph files read at the same time
+MAX_READ_WORKERS = 8
+# skip uploads of plan HDF files the destination already has (set with --skip_unchanged)
+_SKIP_UNCHANGED = False
+# options of main that worker processes are configured with (see _process_pool)
+_WORKER_OPTIONS: Dict[str, Any] = {}
 
 
 @click.group()
-def main():
+@click.option('--cache_dir', envvar='RAS_REMODELER_CACHE_DIR', default=None, help="Local directory to cache remote input files in. Caching is disabled if not set. Can also be set with the RAS_REMODELER_CACHE_DIR environment variable.")
+@click.option('--cache_max_bytes', envvar='RAS_REMODELER_CACHE_MAX_BYTES', type=int, default=DEFAULT_CACHE_MAX_BYTES, help="Size budget of the cache in bytes. Least recently used files are evicted first. Defaults to 50 GiB.")
+@click.option('--metrics', default=None, help="URI to write duration, bytes read/written and peak memory of each stage of the command to as JSON.")
+@click.option('--in_memory_max_bytes', envvar='RAS_REMODELER_IN_MEMORY_MAX_BYTES', type=int, default=0, help="Copy and edit plan HDF files up to this many bytes in memory instead of through temp files. Larger files use temp files. Defaults to 0 (always use temp files).")
+@click.option('--scratch_dir', envvar='RAS_REMODELER_SCRATCH_DIR', default=None, help="Local directory for temp files, e.g. /dev/shm. Temp files that do not fit in --scratch_max_bytes or the free space of the directory are created in --scratch_fallback_dir. Defaults to the system temp directory.")
+@click.option('--scratch_max_bytes', envvar='RAS_REMODELER_SCRATCH_MAX_BYTES', type=int, default=None, help="Size budget of the temp files in --scratch_dir in bytes. Defaults to no budget (limited by the free space of the directory).")
+@click.option('--scratch_fallback_dir', envvar='RAS_REMODELER_SCRATCH_FALLBACK_DIR', default=None, help="Local directory for temp files that do not fit in --scratch_dir. Defaults to the system temp directory.")
+@click.option('--skip_unchanged', envvar='RAS_REMODELER_SKIP_UNCHANGED', is_flag=True, help="Do not upload plan HDF files that are identical to the existing destination file, compared by checksum. Skipped uploads are reported.")
+@click.pass_context
+def main(ctx: click.Context, cache_dir: Union[str, None] = None, cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+         metrics: Union[str, None] = None, in_memory_max_bytes: int = 0, scratch_dir: Union[str, None] = None,
+         scratch_max_bytes: Union[int, None] = None, scratch_fallback_dir: Union[str, None] = None,
+         skip_unchanged: bool = False):
     """ras_remodeler -- tools for reshaping HEC-RAS model data.
 
     Supported filesystems are local, S3, and Azure.
@@ -36,6 +82,176 @@ def main():
      - For S3 use: `s3://<bucket_name>/<key_name>`
      - For Azure use: `abfs://<container_name>/<key_name>`
     """
+    global _WORKER_OPTIONS  # pylint: disable=global-statement
+    _WORKER_OPTIONS = {'cache_dir': cache_dir, 'cache_max_bytes': cache_max_bytes,
+                       'in_memory_max_bytes': in_memory_max_bytes, 'scratch_dir': scratch_dir,
+                       'scratch_max_bytes': scratch_max_bytes, 'scratch_fallback_dir': scratch_fallback_dir,
+                       'skip_unchanged': skip_unchanged}
+    _configure(**_WORKER_OPTIONS)
+    if skip_unchanged:
+        metrics_util.add_hook(report_skipped_upload)
+        ctx.call_on_close(lambda: metrics_util.remove_hook(report_skipped_upload))
+    if metrics:
+        metrics_util.start_recording()
+        ctx.call_on_close(lambda: write_metrics(metrics))
+
+
+def _configure(cache_dir: Union[str, None], cache_max_bytes: int, in_memory_max_bytes: int,
+               scratch_dir: Union[str, None], scratch_max_bytes: Union[int, None],
+               scratch_fallback_dir: Union[str, None], skip_unchanged: bool) -> None:
+    """Configure the cache, the workspace and the options of main in this process (see main)"""
+    global _IN_MEMORY_MAX_BYTES, _SKIP_UNCHANGED  # pylint: disable=global-statement
+    configure_cache(cache_dir, cache_max_bytes)
+    configure_workspace(scratch_dir, scratch_max_bytes, scratch_fallback_dir)
+    _IN_MEMORY_MAX_BYTES = in_memory_max_bytes
+    _SKIP_UNCHANGED = skip_unchanged
+
+
+def prepare_options(command: Callable) -> Callable:
+    """Add the hydrograph preparation options (see prepare_plan_hydrographs) to a command"""
+    options = [
+        click.option('--resample', default=None, help="Resample hydrographs to this interval (e.g. '1h' or '15min') before writing them."),
+        click.option('--fill', type=click.Choice(['interpolate', 'ffill', 'error']), default='interpolate', help="How values in gaps are filled when preparing hydrographs: linear interpolation, last value before the gap or raise an error. Defaults to 'interpolate'."),
+        click.option('--max_gap', default=None, help="Longest time between two hydrograph values (e.g. '6h') that is not a gap. Defaults to the larger of --resample and the median time between values."),
+        click.option('--clip', is_flag=True, help="Clip hydrographs to the simulation window of the plan."),
+        click.option('--validate', is_flag=True, help="Fail if hydrograph times are not increasing, or if flow or lateral inflow values are negative. Stage hydrographs can be negative."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+class LazyChoice(click.Choice):
+    """A click.Choice with choices loaded when they are first used, so the module that defines them is only imported
+    by commands that use the option (see tests/test_startup.py)"""
+
+    def __init__(self, load_choices: Callable[[], List[str]], case_sensitive: bool = True):
+        super().__init__([], case_sensitive)
+        self._load_choices = load_choices
+        self._loaded_choices: Union[tuple, None] = None
+
+    @property
+    def choices(self) -> tuple:  # type: ignore[override]
+        """The loaded choices"""
+        if self._loaded_choices is None:
+            self._loaded_choices = tuple(self._load_choices())
+        return self._loaded_choices
+
+    @choices.setter
+    def choices(self, choices: Any) -> None:
+        # set by click.Choice.__init__ before the choices are loaded
+        self._loaded_choices = tuple(choices) or None
+
+
+def _write_profile_names() -> List[str]:
+    """Get the names of hdf_util.WRITE_PROFILES"""
+    from hdf_util import WRITE_PROFILES
+    return list(WRITE_PROFILES)
+
+
+def _link_modes() -> List[str]:
+    """Get fs_util.LINK_MODES"""
+    from fs_util import LINK_MODES
+    return LINK_MODES
+
+
+def write_profile_option(help_text: str, default: Union[str, None] = None) -> Callable:
+    """Add the --write_profile option (see hdf_util.WRITE_PROFILES) to a command"""
+    return click.option('--write_profile', type=LazyChoice(_write_profile_names), default=default,
+                        help=f"{help_text} See the README for the write profiles.")
+
+
+def prepare_plan_hydrographs(file: Any, hydrographs: Dict[str, 'Timeseries'], resample: Union[str, None] = None,
+                             fill: str = 'interpolate', max_gap: Union[str, None] = None, clip: bool = False,
+                             validate: bool = False,
+                             boundary_types: Union[Dict[str, str], None] = None) -> Dict[str, 'Timeseries']:
+    """Resample, gap fill, clip and validate hydrographs before they are written to a plan. Hydrographs are returned
+    unchanged if resample, clip and validate are not set.
+
+    Args:
+        file (h5py.File): open plan HDF file the hydrographs are written to
+        hydrographs (Dict[str, Timeseries]): mapping of hydrograph name to timeseries data
+        resample (Union[str, None], optional): interval to resample to (e.g. '1h'). Defaults to None.
+        fill (str, optional): one of ['interpolate', 'ffill', 'error']. Defaults to 'interpolate'.
+        max_gap (Union[str, None], optional): longest time between two values that is not a gap. Defaults to None.
+        clip (bool, optional): clip hydrographs to the simulation window of the plan. Defaults to False.
+        validate (bool, optional): fail if times are not increasing, or if flow or lateral inflow values are
+        negative. Defaults to False.
+        boundary_types (Union[Dict[str, str], None], optional): mapping of hydrograph name to boundary type.
+        Hydrographs without one are 'FLOW'. Defaults to None.
+
+    Raises:
+        ValueError
+
+    Returns:
+        Dict[str, Timeseries]: mapping of hydrograph name to prepared timeseries data
+    """
+    if not (resample or clip or validate):
+        return hydrographs
+    from hdf_util import read_simulation_window
+    from timeseries_util import prepare_hydrographs
+    start, end = read_simulation_window(file) if clip else (None, None)
+    return prepare_hydrographs(hydrographs, boundary_types, interval=resample, fill=fill, max_gap=max_gap,
+                               start=start, end=end, validate=validate)
+
+
+def entry_boundary_types(entries: List[Dict[str, str]]) -> Dict[str, str]:
+    """Get the boundary type of each hydrograph of manifest entries ('FLOW' for entries without one)"""
+    return {entry['name']: entry.get('boundary_type', 'FLOW') for entry in entries}
+
+
+def report_skipped_upload(record: Dict[str, Any]) -> None:
+    """Metrics hook reporting uploads skipped because the destination is unchanged"""
+    if record['stage'] in ('put_file', 'put_bytes') and record.get('skipped'):
+        click.echo(f"Skipped upload to {record['dst']} (unchanged)")
+
+
+def write_metrics(dst_uri: str) -> None:
+    """Stop recording metrics and write the stage records to a URI as JSON.
+
+    Args:
+        dst_uri (str): URI to write the JSON to
+    """
+    from fs_util import put_string
+    put_string(json.dumps({'stages': metrics_util.stop_recording()}, indent=2), dst_uri)
+
+
+@main.command(short_help="List pathnames in a DSS file.", help="""
+List the pathnames in a DSS file with the D (date block) part removed. If a
+cache is set with --cache_dir, the catalog is stored in the cache and reused
+until the DSS file changes.
+
+DSS_FILE    Existing DSS file.
+
+\b
+PATTERN     Optional pathname pattern with '*' and '?' wildcards
+            (e.g. '/*/*/FLOW//1HOUR/*/').
+""")
+@click.argument('dss_file')
+@click.argument('pattern', default=None, required=False)
+def list_dss_pathnames(dss_file: str, pattern: Union[str, None] = None) -> None:
+    """Print the pathnames in a DSS file, one per line.
+
+    Args:
+        dss_file (str): URI of DSS file
+        pattern (Union[str, None], optional): pathname pattern to filter by. Defaults to None.
+    """
+    from dss_util import read_dss_catalog
+    for pathname in read_dss_catalog(dss_file):
+        if pattern is None or fnmatchcase(pathname.upper(), pattern.upper()):
+            click.echo(pathname)
+
+
+@main.command(short_help="Show cache statistics.", help="""
+Show cumulative hit/miss/eviction statistics and the size of the remote file
+cache set with --cache_dir.
+""")
+def cache_info() -> None:
+    """Print cache statistics as JSON."""
+    cache = get_cache()
+    if cache is None:
+        raise click.UsageError("No cache configured. Set --cache_dir or RAS_REMODELER_CACHE_DIR.")
+    click.echo(json.dumps(cache.stats()))
 
 
 @main.command(short_help="Create a *.p**.tmp.hdf file.", help="""
@@ -50,20 +266,113 @@ DST_DIR       Destination directory to save the new plan *.tmp.hdf file
 """)
 @click.argument('src_plan_hdf')
 @click.argument('dst_dir', default=None, required=False)
-def create_plan_tmp_hdf(src_plan_hdf: str, dst_dir: Union[str, None]) -> None:
+@click.option('--range_read', is_flag=True, help="Read only the needed byte ranges of the source plan HDF instead of downloading the whole file and report the number of bytes read.")
+@write_profile_option("Recompress the datasets with this write profile while copying. Defaults to copying them as they are.")
+def create_plan_tmp_hdf(src_plan_hdf: str, dst_dir: Union[str, None], range_read: bool = False,
+                        write_profile: Union[str, None] = None) -> None:
     """Create a .tmp.hdf plan file from a source plan hdf file with the Results group removed.
 
     Args:
         src_plan_hdf (str): Source plan HDF URI (should have name *.p**.hdf).
         dst_dir (Union[str, None]): Directory to save resulting plan temp HDF file with Results group removed.
         (saved as *.p**.tmp.hdf). If None, file will be created in the same directory as source HDF file.
+        range_read (bool, optional): read only the needed byte ranges of the source plan HDF. Defaults to False.
+        write_profile (Union[str, None], optional): write profile to recompress the datasets with. Defaults to None.
     """
+    from hdf_util import copy_hdf
     if dst_dir:
         dst_plan_hdf = os.path.join(dst_dir, os.path.splitext(
             os.path.basename(src_plan_hdf))[0])
     else:
         dst_plan_hdf = os.path.splitext(src_plan_hdf)[0] + ".tmp.hdf"
-    copy_hdf(src_plan_hdf, dst_plan_hdf, ["Results"])
+    bytes_read = copy_hdf(src_plan_hdf, dst_plan_hdf, ["Results"], range_read=range_read,
+                          in_memory_max_bytes=_IN_MEMORY_MAX_BYTES, skip_unchanged=_SKIP_UNCHANGED,
+                          profile=write_profile)
+    if range_read:
+        click.echo(f"Read {bytes_read} bytes from {src_plan_hdf}")
+
+
+@main.command(short_help="Stage the files of a plan run to run directories.", help="""
+Stage the files a plan run needs to one or more run directories: the plan
+HDF file with the "Results" group removed (saved as *.p**.tmp.hdf), the
+project file, the plan files (*.p**, *.b**, *.c** and *.x**) and the
+geometry and flow files of the plan. Files are staged concurrently and local
+files are reflinked instead of copied where the filesystem allows it.
+
+SRC           Project file (*.prj) or plan file (*.p** or *.p**.hdf).
+
+RUN_DIRS      One or more run directories.
+""")
+@click.argument('src')
+@click.argument('run_dirs', nargs=-1, required=True)
+@click.option('--plan', default=None, help="Plan of the project to stage, e.g. 'p04'. Defaults to the plan of a plan file or the current plan of a project file.")
+@click.option('--include', multiple=True, help="Pattern with '*', '?' and '[' wildcards of extra files relative to the project directory to stage, e.g. 'Terrain/*'. Can be given many times.")
+@click.option('--link', type=LazyChoice(_link_modes), default='reflink', help="How local files are staged. 'reflink' tries a reflink, then copies. 'hardlink' tries a hardlink, then copies. WARNING: hardlinked files are shared with the source project and every other run directory, so a run that rewrites an input (e.g. the geometry preprocessor rewriting *.c** and *.x**) changes them all. The plan HDF file is never hardlinked. Defaults to 'reflink'.")
+@click.option('--workers', type=int, default=8, help="Number of files staged at the same time. Defaults to 8.")
+@click.option('--range_read', is_flag=True, help="Read only the needed byte ranges of the source plan HDF instead of downloading the whole file.")
+def stage_plan_run(src: str, run_dirs: List[str], plan: Union[str, None] = None, include: List[str] = (),
+                   link: str = 'reflink', workers: int = 8, range_read: bool = False) -> None:
+    """Stage the files a plan run needs to run directories.
+
+    Args:
+        src (str): URI of a project file (*.prj) or of a plan file (*.p** or *.p**.hdf)
+        run_dirs (List[str]): URIs of the run directories
+        plan (Union[str, None], optional): plan of the project to stage. Defaults to None.
+        include (List[str], optional): patterns of extra files relative to the project directory. Defaults to ().
+        link (str, optional): one of ['reflink', 'hardlink', 'copy']. Defaults to 'reflink'.
+        workers (int, optional): number of files staged at the same time. Defaults to 8.
+        range_read (bool, optional): read only the needed byte ranges of the source plan HDF. Defaults to False.
+    """
+    from project_util import stage_plan_run as stage_run
+    start = time.perf_counter()
+    counts = stage_run(src, list(run_dirs), plan=plan, include=list(include), link=link, max_workers=workers,
+                       range_read=range_read, in_memory_max_bytes=_IN_MEMORY_MAX_BYTES)
+    click.echo(f"Staged {sum(counts.values())} files to {len(run_dirs)} run directories in "
+               f"{time.perf_counter() - start:.2f} s ({', '.join(f'{method}: {count}' for method, count in counts.items())})")
+
+
+@main.command(short_help="Extract a time window of Results datasets.", help="""
+Copy a HEC-RAS plan HDF file with only the selected Results datasets, sliced
+to a time window and decimated in time, for post-processing. Groups other
+than "Results" are copied whole. Datasets are copied in blocks aligned to
+their chunks, so memory use stays flat however large the Results are.
+
+SRC_PLAN_HDF    Existing plan HDF file.
+
+DST_HDF         Destination HDF file.
+""")
+@click.argument('src_plan_hdf')
+@click.argument('dst_hdf')
+@click.option('--dataset', 'datasets', multiple=True, required=True, help="Pattern with '*' and '?' wildcards of the Results dataset paths to keep, e.g. '*/2D Flow Areas/Perimeter 1/Water Surface'. '*' also matches '/'. Can be given many times.")
+@click.option('--start', type=click.DateTime(), default=None, help="Earliest time to keep. Defaults to the start of the Results.")
+@click.option('--end', type=click.DateTime(), default=None, help="Latest time to keep. Defaults to the end of the Results.")
+@click.option('--step', type=int, default=1, help="Keep every step-th time in the window. Defaults to 1.")
+@click.option('--range_read', is_flag=True, help="Read only the needed byte ranges of the source plan HDF instead of downloading the whole file.")
+@click.option('--block_bytes', type=int, default=64 * 2**20, help="Max bytes of a dataset read at a time. Defaults to 64 MiB.")
+@write_profile_option("Write the extracted Results datasets with this write profile. Defaults to the filters and chunks of the source datasets.")
+def extract_results(src_plan_hdf: str, dst_hdf: str, datasets: List[str], start: Union['datetime', None] = None,
+                    end: Union['datetime', None] = None, step: int = 1, range_read: bool = False,
+                    block_bytes: int = 64 * 2**20, write_profile: Union[str, None] = None) -> None:
+    """Copy a plan HDF file with only some Results datasets, sliced to a time window and decimated in time.
+
+    Args:
+        src_plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        dst_hdf (str): URI to save the resulting HDF file
+        datasets (List[str]): patterns of the Results dataset paths to keep
+        start (Union[datetime, None], optional): earliest time to keep. Defaults to None.
+        end (Union[datetime, None], optional): latest time to keep. Defaults to None.
+        step (int, optional): keep every step-th time. Defaults to 1.
+        range_read (bool, optional): read only the needed byte ranges of the source plan HDF. Defaults to False.
+        block_bytes (int, optional): max bytes of a dataset read at a time. Defaults to 64 MiB.
+        write_profile (Union[str, None], optional): write profile of the extracted datasets. Defaults to None.
+
+    Raises:
+        ValueError
+    """
+    from hdf_util import extract_results as extract
+    count = extract(src_plan_hdf, dst_hdf, list(datasets), start=start, end=end, step=step, range_read=range_read,
+                    block_bytes=block_bytes, skip_unchanged=_SKIP_UNCHANGED, profile=write_profile)
+    click.echo(f"Extracted {count} Results datasets to {dst_hdf}")
 
 
 @main.command(short_help="Overwrite a hydrograph in an HDF file.", help="""
@@ -80,10 +389,16 @@ SRC_HYDROGRAPH              Hydrograph file used to overwrite the data.
 @click.argument('plan_hdf')
 @click.argument('plan_hdf_hydrograph_name')
 @click.argument('src_hydrograph')
-@click.option('--input_type', type=click.Choice(['DSS', 'CSV']), default='DSS', help="Hydrograph file type. Defaults to 'DSS'. DSS file should be in <URI>:<pathname> format.")
+@click.option('--input_type', type=click.Choice(INPUT_TYPES), default='DSS', help="Hydrograph file type. Defaults to 'DSS'. DSS file should be in <URI>:<pathname> format. PARQUET file should be in <URI>[:<column>] format.")
 @click.option('--keep_dates', is_flag=True, help="Do not modify 'Start Date' and 'End Date' in HDF hydrograph attributes based on hydrograph start/end datetimes")
+@click.option('--repack', is_flag=True, help="Rewrite the plan HDF file after the update to reclaim unused space and report the file size before and after.")
+@click.option('--boundary_type', type=click.Choice(BOUNDARY_TYPES), default='FLOW', help="Boundary condition type of the hydrograph: flow, stage or lateral inflow hydrograph. Defaults to 'FLOW'.")
+@write_profile_option("Write replaced hydrograph datasets, and the whole file with --repack, with this write profile. Defaults to updating hydrographs in place where possible and gzip1 for new datasets.")
+@prepare_options
 def set_plan_hdf_hydrograph(plan_hdf: str, plan_hdf_hydrograph_name: str, src_hydrograph: str,
-                            input_type: str = 'DSS', keep_dates: bool = False) -> None:
+                            input_type: str = 'DSS', keep_dates: bool = False, repack: bool = False,
+                            boundary_type: str = 'FLOW', write_profile: Union[str, None] = None,
+                            **prepare: Any) -> None:
     """Overwrite a hydrograph in a HEC-RAS plan HDF file.
 
     Args:
@@ -91,25 +406,710 @@ def set_plan_hdf_hydrograph(plan_hdf: str, plan_hdf_hydrograph_name: str, src_hy
         plan_hdf_hydrograph_name (str): name of the hydrograph in the HDF file to overwrite
         (e.g. 'River: White  Reach: Muncie  RS: 15696.24').
         src_hydrograph (str): URI of hydrograph to overwrite the data
-        input_type (str, optional): one of ['DSS', 'CSV']. Defaults to 'DSS'. DSS file should be in <URI>:<pathname>
-        format.
+        input_type (str, optional): one of ['DSS', 'CSV', 'PARQUET']. Defaults to 'DSS'. DSS file should be in
+        <URI>:<pathname> format. PARQUET file should be in <URI>[:<column>] format.
+        keep_dates (bool, optional): Defaults to False.
+        repack (bool, optional): rewrite the plan HDF file to reclaim unused space. Defaults to False.
+        boundary_type (str, optional): one of ['FLOW', 'STAGE', 'LATERAL']. Defaults to 'FLOW'.
+        write_profile (Union[str, None], optional): write profile of the hydrograph datasets. Defaults to None.
+        **prepare (Any): hydrograph preparation options (see prepare_plan_hydrographs)
+
+    Raises:
+        ValueError
+    """
+    from hdf_util import HYDROGRAPH_GROUPS, edit_hdf, update_hydrograph
+    start, end = _read_window(plan_hdf, [input_type], prepare)
+    # read the hydrograph while the plan HDF file is downloaded
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        timeseries = executor.submit(read_timeseries, src_hydrograph, input_type, start, end)
+        # overwrite existing file with new data
+        with edit_hdf(plan_hdf, in_memory_max_bytes=_IN_MEMORY_MAX_BYTES, skip_unchanged=_SKIP_UNCHANGED) as edit:
+            hydrographs = prepare_plan_hydrographs(
+                edit.file, {plan_hdf_hydrograph_name: timeseries.result()},
+                boundary_types={plan_hdf_hydrograph_name: boundary_type}, **prepare)
+            update_hydrograph(edit.file, plan_hdf_hydrograph_name, hydrographs[plan_hdf_hydrograph_name],
+                              keep_dates=keep_dates, group=HYDROGRAPH_GROUPS[boundary_type], profile=write_profile)
+            if repack:
+                _repack(edit, plan_hdf, write_profile)
+
+
+@main.command(short_help="Overwrite many hydrographs in an HDF file.", help="""
+Overwrite many hydrographs in a HEC-RAS plan HDF file. The plan HDF file is
+downloaded, opened and uploaded once for all hydrographs.
+
+PLAN_HDF    Existing plan HDF file.
+
+\b
+MANIFEST    JSON or CSV file listing the hydrographs to overwrite. Each entry
+            has a 'name' (hydrograph name in the HDF file), a 'src'
+            (hydrograph file used to overwrite the data), an optional
+            'input_type' (defaults to --input_type) and an optional
+            'boundary_type' (defaults to --boundary_type).
+""")
+@click.argument('plan_hdf')
+@click.argument('manifest')
+@click.option('--input_type', type=click.Choice(INPUT_TYPES), default='DSS', help="Default hydrograph file type for manifest entries without an 'input_type'. Defaults to 'DSS'.")
+@click.option('--keep_dates', is_flag=True, help="Do not modify 'Start Date' and 'End Date' in HDF hydrograph attributes based on hydrograph start/end datetimes")
+@click.option('--repack', is_flag=True, help="Rewrite the plan HDF file after the update to reclaim unused space and report the file size before and after.")
+@click.option('--boundary_type', type=click.Choice(BOUNDARY_TYPES), default='FLOW', help="Default boundary condition type for manifest entries without a 'boundary_type'. Defaults to 'FLOW'.")
+@write_profile_option("Write replaced hydrograph datasets, and the whole file with --repack, with this write profile. Defaults to updating hydrographs in place where possible and gzip1 for new datasets.")
+@prepare_options
+def set_plan_hdf_hydrographs(plan_hdf: str, manifest: str, input_type: str = 'DSS', keep_dates: bool = False,
+                             repack: bool = False, boundary_type: str = 'FLOW', write_profile: Union[str, None] = None,
+                             **prepare: Any) -> None:
+    """Overwrite many hydrographs in a HEC-RAS plan HDF file with a single download/upload of the plan file.
+
+    Args:
+        plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        manifest (str): URI of a JSON or CSV manifest of hydrographs to overwrite (see read_hydrograph_manifest)
+        input_type (str, optional): default input type for manifest entries without one. Defaults to 'DSS'.
         keep_dates (bool, optional): Defaults to False.
+        repack (bool, optional): rewrite the plan HDF file to reclaim unused space. Defaults to False.
+        boundary_type (str, optional): default boundary type for manifest entries without one. Defaults to 'FLOW'.
+        write_profile (Union[str, None], optional): write profile of the hydrograph datasets. Defaults to None.
+        **prepare (Any): hydrograph preparation options (see prepare_plan_hydrographs)
 
     Raises:
         ValueError
     """
-    temp_hdf_filepath = get_temp_file(plan_hdf)
+    from hdf_util import edit_hdf
+    entries = read_hydrograph_manifest(manifest, default_input_type=input_type,
+                                       default_boundary_type=boundary_type)
+    start, end = _read_window(plan_hdf, [entry['input_type'] for entry in entries], prepare)
+    # read the hydrographs while the plan HDF file is downloaded
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        hydrographs = executor.submit(read_manifest_timeseries, entries, start=start, end=end)
+        # overwrite existing file with new data
+        with edit_hdf(plan_hdf, in_memory_max_bytes=_IN_MEMORY_MAX_BYTES, skip_unchanged=_SKIP_UNCHANGED) as edit:
+            update_plan_hydrographs(edit.file, entries,
+                                    prepare_plan_hydrographs(edit.file, hydrographs.result(),
+                                                             boundary_types=entry_boundary_types(entries), **prepare),
+                                    keep_dates=keep_dates, profile=write_profile)
+            if repack:
+                _repack(edit, plan_hdf, write_profile)
+
+
+@main.command(short_help="Reclaim unused space in an HDF file.", help="""
+Rewrite a HEC-RAS plan HDF file to reclaim the space left unused by deleted
+or replaced datasets (e.g. after many hydrograph updates) and report the file
+size before and after.
+
+PLAN_HDF    Existing plan HDF file.
+""")
+@click.argument('plan_hdf')
+@write_profile_option("Recompress the datasets with this write profile. Defaults to keeping their filters and chunks.")
+def repack_hdf(plan_hdf: str, write_profile: Union[str, None] = None) -> None:
+    """Rewrite a plan HDF file to reclaim unused space.
+
+    Args:
+        plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        write_profile (Union[str, None], optional): write profile to recompress the datasets with. Defaults to None.
+    """
+    from hdf_util import edit_hdf
+    with edit_hdf(plan_hdf, in_memory_max_bytes=_IN_MEMORY_MAX_BYTES, skip_unchanged=_SKIP_UNCHANGED) as edit:
+        _repack(edit, plan_hdf, write_profile)
+
+
+@main.command(short_help="Show the structure of an HDF file.", help="""
+Show the structure of a HEC-RAS plan HDF file from an index of its groups,
+datasets (shape, dtype, chunks, compression and storage size) and small
+attributes. The index is built by reading only the metadata of the file and
+is stored in the cache (see --cache_dir) and, with --sidecar, next to the
+file, so it is reused until the file changes.
+
+PLAN_HDF    Existing plan HDF file.
+""")
+@click.argument('plan_hdf')
+@click.option('--view', type=click.Choice(INDEX_VIEWS), default='INDEX', help="INDEX prints the index as JSON, HYDROGRAPHS lists the boundary hydrographs and GROUPS lists the storage size of each group. Defaults to 'INDEX'.")
+@click.option('--depth', type=int, default=1, help="Depth of the groups listed by the GROUPS view. Defaults to 1 (top level groups).")
+@click.option('--sidecar', is_flag=True, help="Read and write the index in a sidecar file next to the plan HDF file (<plan_hdf>.index.json).")
+def index_hdf(plan_hdf: str, view: str = 'INDEX', depth: int = 1, sidecar: bool = False) -> None:
+    """Print the index of a plan HDF file, its boundary hydrographs or the storage size of its groups.
+
+    Args:
+        plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        view (str, optional): one of ['INDEX', 'HYDROGRAPHS', 'GROUPS']. Defaults to 'INDEX'.
+        depth (int, optional): depth of the groups of the GROUPS view. Defaults to 1.
+        sidecar (bool, optional): read and write the index sidecar file. Defaults to False.
+    """
+    from hdf_util import index_group_sizes, index_hydrographs, read_hdf_index
+    index = read_hdf_index(plan_hdf, sidecar=sidecar)
+    if view == 'HYDROGRAPHS':
+        for hydrograph in index_hydrographs(index):
+            click.echo(json.dumps(hydrograph))
+    elif view == 'GROUPS':
+        for group, size in index_group_sizes(index, depth=depth).items():
+            click.echo(f"{size}\t{group}")
+    else:
+        click.echo(json.dumps(index))
+
+
+def _repack(edit: 'HdfEdit', plan_hdf: str, profile: Union[str, None] = None) -> None:
+    """Repack the working copy of plan_hdf, optionally recompressing it, and report the file size before and after"""
+    size_before, size_after = edit.repack(profile)
+    click.echo(f"Repacked {plan_hdf} from {size_before} to {size_after} bytes")
+
+
+@main.command(short_help="Create many plan HDF variants from a base plan.", help="""
+Create many variants of a HEC-RAS plan HDF file, each with its own
+hydrographs, using a pool of processes. The "Results" group is removed from
+the base plan once and the stripped plan is reused for every variant.
+
+BASE_PLAN_HDF    Existing plan HDF file.
+
+\b
+REALIZATIONS     JSON or CSV file in the same format as the
+                 set-plan-hdf-hydrographs manifest with an extra 'output'
+                 key on every entry naming the variant plan HDF file the
+                 hydrograph is written to.
+
+\b
+DST_DIR          Directory the outputs are relative to. If none, outputs are
+                 used as given.
+""")
+@click.argument('base_plan_hdf')
+@click.argument('realizations')
+@click.argument('dst_dir', default=None, required=False)
+@click.option('--input_type', type=click.Choice(INPUT_TYPES), default='DSS', help="Default hydrograph file type for entries without an 'input_type'. Defaults to 'DSS'.")
+@click.option('--keep_dates', is_flag=True, help="Do not modify 'Start Date' and 'End Date' in HDF hydrograph attributes based on hydrograph start/end datetimes")
+@click.option('--workers', type=int, default=os.cpu_count(), help="Number of worker processes. Defaults to the number of CPUs.")
+@write_profile_option("Recompress the base plan once with this write profile and write the hydrograph datasets with it. Defaults to copying the base plan as it is.")
+@prepare_options
+def create_plan_ensemble(base_plan_hdf: str, realizations: str, dst_dir: Union[str, None] = None,
+                         input_type: str = 'DSS', keep_dates: bool = False, workers: Union[int, None] = None,
+                         write_profile: Union[str, None] = None, **prepare: Any) -> None:
+    """Create plan HDF variants from a base plan HDF file with the Results group removed and hydrographs overwritten.
+
+    Args:
+        base_plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        realizations (str): URI of a JSON or CSV manifest of hydrographs with an 'output' for every entry
+        dst_dir (Union[str, None], optional): directory outputs are relative to. Defaults to None.
+        input_type (str, optional): default input type for entries without one. Defaults to 'DSS'.
+        keep_dates (bool, optional): Defaults to False.
+        workers (Union[int, None], optional): number of worker processes. Defaults to the number of CPUs.
+        write_profile (Union[str, None], optional): write profile of the base plan and the hydrograph datasets.
+        Defaults to None.
+        **prepare (Any): hydrograph preparation options (see prepare_plan_hydrographs)
+
+    Raises:
+        ValueError
+    """
+    from fs_util import temp_file
+    from hdf_util import copy_hdf
+    variants: Dict[str, List[Dict[str, str]]] = {}
+    for entry in read_hydrograph_manifest(realizations, default_input_type=input_type):
+        if 'output' not in entry:
+            raise ValueError(f"Realization entries must have an 'output' but found {entry}")
+        output = os.path.join(dst_dir, entry['output']) if dst_dir else entry['output']
+        variants.setdefault(output, []).append(entry)
+    start = time.perf_counter()
+    with temp_file(ext=".hdf") as base_filepath:
+        copy_hdf(base_plan_hdf, base_filepath, ["Results"], in_memory_max_bytes=_IN_MEMORY_MAX_BYTES,
+                 profile=write_profile)
+        with _process_pool(workers) as executor:
+            futures = [executor.submit(_create_plan_variant_in_worker, base_filepath, output, entries, keep_dates,
+                                       _IN_MEMORY_MAX_BYTES, _SKIP_UNCHANGED, prepare, write_profile)
+                       for output, entries in variants.items()]
+            for future in futures:
+                output, records = future.result()
+                for record in records:
+                    metrics_util.emit(record)
+                click.echo(f"Created {output}")
+    elapsed = time.perf_counter() - start
+    click.echo(f"Created {len(variants)} plan variants in {elapsed:.2f} s "
+               f"({len(variants) / elapsed:.2f} variants/sec)")
+
+
+def create_plan_variant(base_filepath: str, dst_plan_hdf: str, entries: List[Dict[str, str]],
+                        keep_dates: bool = False, in_memory_max_bytes: int = 0, skip_unchanged: bool = False,
+                        prepare: Union[Dict[str, Any], None] = None, profile: Union[str, None] = None) -> str:
+    """Copy a local plan HDF file, overwrite its hydrographs and save it to a URI.
+
+    Args:
+        base_filepath (str): local filepath of plan HDF file to copy
+        dst_plan_hdf (str): URI to save the resulting plan HDF file
+        entries (List[Dict[str, str]]): hydrographs to overwrite (see read_hydrograph_manifest)
+        keep_dates (bool, optional): Defaults to False.
+        in_memory_max_bytes (int, optional): max size in bytes of a plan edited in memory instead of in a temp file.
+        Defaults to 0 (always use a temp file).
+        skip_unchanged (bool, optional): do not upload the plan if dst_plan_hdf has the same content. Defaults to
+        False.
+        prepare (Union[Dict[str, Any], None], optional): hydrograph preparation options (see
+        prepare_plan_hydrographs). Defaults to None.
+        profile (Union[str, None], optional): write profile of the hydrograph datasets (see
+        hdf_util.WRITE_PROFILES). Defaults to None.
+
+    Returns:
+        str: dst_plan_hdf
+    """
+    from hdf_util import edit_hdf
+    start, end = _read_window(base_filepath, [entry['input_type'] for entry in entries], prepare or {})
+    # read the hydrographs while the base plan is copied
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        hydrographs = executor.submit(read_manifest_timeseries, entries, start=start, end=end)
+        with edit_hdf(base_filepath, dst_plan_hdf, in_memory_max_bytes=in_memory_max_bytes,
+                      skip_unchanged=skip_unchanged) as edit:
+            update_plan_hydrographs(edit.file, entries,
+                                    prepare_plan_hydrographs(edit.file, hydrographs.result(),
+                                                             boundary_types=entry_boundary_types(entries),
+                                                             **(prepare or {})),
+                                    keep_dates=keep_dates, profile=profile)
+    return dst_plan_hdf
+
+
+def update_plan_hydrographs(file: Any, entries: List[Dict[str, str]], hydrographs: Dict[str, 'Timeseries'],
+                            keep_dates: bool = False, profile: Union[str, None] = None) -> None:
+    """Overwrite the hydrographs of manifest entries in an open plan HDF file, each in the group of its boundary type.
+
+    Args:
+        file (h5py.File): plan HDF file open for writing
+        entries (List[Dict[str, str]]): manifest entries (see read_hydrograph_manifest)
+        hydrographs (Dict[str, Timeseries]): mapping of hydrograph name to timeseries data
+        keep_dates (bool, optional): Defaults to False.
+        profile (Union[str, None], optional): write profile of the hydrograph datasets (see
+        hdf_util.WRITE_PROFILES). Defaults to None.
+    """
+    from hdf_util import HYDROGRAPH_GROUPS, update_hydrographs
+    names_by_type: Dict[str, List[str]] = {}
+    for entry in entries:
+        names_by_type.setdefault(entry.get('boundary_type', 'FLOW'), []).append(entry['name'])
+    for boundary_type, names in names_by_type.items():
+        update_hydrographs(file, {name: hydrographs[name] for name in dict.fromkeys(names)}, keep_dates=keep_dates,
+                           group=HYDROGRAPH_GROUPS[boundary_type], profile=profile)
+
+
+@main.command(short_help="Overwrite gridded precipitation in an HDF file.", help="""
+Overwrite the gridded precipitation of a HEC-RAS plan HDF file with grids
+streamed from a source file in chunks of rows, so memory use stays bounded
+however long the event is.
+
+PLAN_HDF    Existing plan HDF file.
+
+\b
+SRC_GRID    Gridded data used to overwrite the precipitation. DSS file
+            should be in <URI>:<pathname pattern> format and its grids must
+            have one value per cell of the plan precipitation grid. PARQUET
+            file should have a 'time' column and a column per cell.
+""")
+@click.argument('plan_hdf')
+@click.argument('src_grid')
+@click.option('--input_type', type=click.Choice(GRID_INPUT_TYPES), default='DSS', help="Gridded data file type. Defaults to 'DSS'.")
+@click.option('--chunk_rows', type=int, default=64, help="Number of grids read and written at a time. Also the chunk size of the HDF datasets. Defaults to 64.")
+@write_profile_option("Compress the precipitation datasets with the filters of this write profile. Defaults to 'gzip1'.", default='gzip1')
+def set_plan_hdf_gridded_precipitation(plan_hdf: str, src_grid: str, input_type: str = 'DSS',
+                                       chunk_rows: int = 64, write_profile: str = 'gzip1') -> None:
+    """Overwrite the gridded precipitation of a HEC-RAS plan HDF file with grids streamed in chunks of rows.
+
+    Args:
+        plan_hdf (str): URI of existing HEC-RAS HDF plan file
+        src_grid (str): URI of gridded data. DSS file should be in <URI>:<pathname pattern> format.
+        input_type (str, optional): one of ['DSS', 'PARQUET']. Defaults to 'DSS'.
+        chunk_rows (int, optional): grids read and written at a time. Defaults to 64.
+        write_profile (str, optional): write profile of the precipitation datasets. Defaults to 'gzip1'.
+
+    Raises:
+        ValueError
+    """
+    from dss_util import iter_dss_grids, iter_parquet_grid
+    from hdf_util import edit_hdf, write_gridded_boundary
     if input_type == 'DSS':
-        timeseries = read_dss_timeseries(src_hydrograph)
-    elif input_type == 'CSV':
-        timeseries = read_csv_timeseries(src_hydrograph)
+        uri, pattern = src_grid.rsplit(':', 1)
+        chunks = iter_dss_grids(uri, pattern, batch_rows=chunk_rows)
+    elif input_type == 'PARQUET':
+        chunks = iter_parquet_grid(src_grid, batch_rows=chunk_rows)
+    else:
+        raise ValueError(f"Invalid input_type option. Must be one of {GRID_INPUT_TYPES}")
+    with edit_hdf(plan_hdf, in_memory_max_bytes=_IN_MEMORY_MAX_BYTES, skip_unchanged=_SKIP_UNCHANGED) as edit:
+        rows = write_gridded_boundary(edit.file, chunks, chunk_rows=chunk_rows, profile=write_profile)
+    click.echo(f"Wrote {rows} precipitation grids to {plan_hdf}")
+
+
+@main.command(short_help="Export hydrographs of many plan HDFs to Parquet.", help="""
+Export the boundary hydrographs of many HEC-RAS plan HDF files, with their
+River, Reach, RS, Start Date and Interval attributes, to a Parquet dataset
+partitioned by plan, using a pool of processes. Only the boundary condition
+groups of each plan are read, so the Results are never downloaded.
+
+\b
+PLAN_HDFS    Plan HDF files or patterns with '*', '?' and '[' wildcards
+             (e.g. "s3://<bucket_name>/models/*/*.p??.hdf").
+
+\b
+DST_DIR      Directory of the Parquet dataset. Each plan is written to
+             <DST_DIR>/plan=<plan name>/hydrographs.parquet.
+""")
+@click.argument('plan_hdfs', nargs=-1, required=True)
+@click.argument('dst_dir')
+@click.option('--workers', type=int, default=os.cpu_count(), help="Number of worker processes. Defaults to the number of CPUs.")
+def export_plan_hydrographs(plan_hdfs: List[str], dst_dir: str, workers: Union[int, None] = None) -> None:
+    """Export the boundary hydrographs of many plan HDF files to a Parquet dataset partitioned by plan.
+
+    Args:
+        plan_hdfs (List[str]): URIs or URI patterns of HEC-RAS HDF plan files
+        dst_dir (str): URI of the directory of the Parquet dataset
+        workers (Union[int, None], optional): number of worker processes. Defaults to the number of CPUs.
+
+    Raises:
+        click.ClickException: if any plan could not be exported
+    """
+    from fs_util import expand_uris
+    plan_uris = expand_uris(list(plan_hdfs))
+    if not plan_uris:
+        raise click.UsageError(f"No plan HDF files match {list(plan_hdfs)}")
+    start = time.perf_counter()
+    failed = 0
+    rows = 0
+    with _process_pool(workers) as executor:
+        futures = {executor.submit(_export_plan_hydrographs_in_worker, plan_uri,
+                                   f"{dst_dir.rstrip('/')}/plan={partition}/hydrographs.parquet"): plan_uri
+                   for plan_uri, partition in zip(plan_uris, plan_partitions(plan_uris))}
+        for future, plan_uri in futures.items():
+            try:
+                plan_rows, records = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                failed += 1
+                click.echo(f"Failed to export {plan_uri}: {type(exc).__name__}: {exc}", err=True)
+                continue
+            for record in records:
+                metrics_util.emit(record)
+            rows += plan_rows
+    elapsed = time.perf_counter() - start
+    click.echo(f"Exported {rows} hydrograph rows from {len(plan_uris) - failed} plans in {elapsed:.2f} s "
+               f"({(len(plan_uris) - failed) / elapsed:.2f} plans/sec)")
+    if failed:
+        raise click.ClickException(f"{failed} of {len(plan_uris)} plans could not be exported")
+
+
+def plan_partitions(plan_uris: List[str]) -> List[str]:
+    """Get the partition name of each plan, which is its filename without the .hdf extension. Plans with the same
+    filename in different directories get a short hash of their URI appended so partitions are unique.
+
+    Args:
+        plan_uris (List[str]): plan HDF URIs
+
+    Returns:
+        List[str]: partition name of each plan
+    """
+    names = [os.path.splitext(uri.rstrip('/').rsplit('/', 1)[-1])[0] for uri in plan_uris]
+    counts: Dict[str, int] = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    return [name if counts[name] == 1 else f"{name}-{hashlib.md5(uri.encode()).hexdigest()[:8]}"
+            for name, uri in zip(names, plan_uris)]
+
+
+def export_plan_hydrograph_table(plan_hdf: str, dst_parquet: str) -> int:
+    """Read the boundary hydrographs of a plan HDF file in byte ranges and write them to a Parquet file with one row
+    per hydrograph time.
+
+    Args:
+        plan_hdf (str): URI of HEC-RAS HDF plan file
+        dst_parquet (str): URI of the Parquet file to write. Nothing is written if the plan has no hydrographs.
+
+    Returns:
+        int: number of rows written
+    """
+    import fsspec
+    import h5py
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from fs_util import RangeReader
+    from hdf_util import read_hydrographs
+    with metrics_util.stage('export_plan_hydrographs', plan_hdf=plan_hdf) as current:
+        with RangeReader(plan_hdf) as src_file:
+            with h5py.File(src_file, 'r') as src:
+                hydrographs = read_hydrographs(src)
+            current.bytes_read = src_file.bytes_transferred
+        lengths = [len(hydrograph['time']) for hydrograph in hydrographs]
+        current.labels['hydrographs'] = len(hydrographs)
+        current.labels['rows'] = sum(lengths)
+        if not sum(lengths):
+            return 0
+
+        def repeat(key: str) -> np.ndarray:
+            return np.repeat(np.array([hydrograph[key] for hydrograph in hydrographs], dtype=object), lengths)
+
+        table = pa.table({
+            'plan_uri': pa.array(np.full(sum(lengths), plan_hdf, dtype=object), pa.string()),
+            'boundary_type': pa.array(repeat('boundary_type'), pa.string()),
+            'name': pa.array(repeat('name'), pa.string()),
+            'river': pa.array(repeat('river'), pa.string()),
+            'reach': pa.array(repeat('reach'), pa.string()),
+            'rs': pa.array(repeat('rs'), pa.string()),
+            'start_date': pa.array(repeat('start_date'), pa.timestamp('ns')),
+            'interval': pa.array(repeat('interval'), pa.string()),
+            'time': pa.array(np.concatenate([hydrograph['time'] for hydrograph in hydrographs]), pa.timestamp('ns')),
+            'value': pa.array(np.concatenate([hydrograph['value'] for hydrograph in hydrographs]), pa.float32()),
+        })
+        dst_fs, dst_path = fsspec.core.url_to_fs(dst_parquet)
+        dst_fs.makedirs(dst_path.rsplit('/', 1)[0], exist_ok=True)
+        with dst_fs.open(dst_path, 'wb') as dst_file:
+            pq.write_table(table, dst_file, compression='zstd')
+            current.bytes_written = dst_file.tell()
+    return table.num_rows
+
+
+def _export_plan_hydrographs_in_worker(plan_hdf: str, dst_parquet: str) -> tuple:
+    """Run export_plan_hydrograph_table in a worker process and return its metrics records to the parent process"""
+    metrics_util.reset_for_worker()
+    rows = export_plan_hydrograph_table(plan_hdf, dst_parquet)
+    return rows, metrics_util.stop_recording()
+
+
+@main.command(short_help="Serve commands from JSON lines on stdin.", help="""
+Keep a warm process that runs commands read as JSON lines from stdin and
+writes one JSON line per command to stdout when it finishes, so imports and
+object storage connections are reused between commands. Commands run
+concurrently on a pool of worker threads. Output of the commands themselves
+is written to stderr.
+
+\b
+Each request is a JSON object with the command name and its command line
+arguments, and an optional id that is copied to the response:
+  {"id": 1, "command": "create-plan-tmp-hdf", "args": ["<src_plan_hdf>"]}
+
+\b
+Each response has the id, a status of "ok" or "error", the error message if
+the command failed and the run time of the command in seconds:
+  {"id": 1, "status": "ok", "error": null, "seconds": 1.2}
+
+\b
+Supported commands: create-plan-tmp-hdf, set-plan-hdf-hydrograph,
+set-plan-hdf-hydrographs, set-plan-hdf-gridded-precipitation, repack-hdf,
+export-plan-hydrographs, index-hdf, extract-results, stage-plan-run
+""")
+@click.option('--workers', type=int, default=4, help="Number of commands to run at the same time. Defaults to 4.")
+def serve(workers: int = 4) -> None:
+    """Run commands read as JSON lines from stdin and write the results as JSON lines to stdout until stdin closes.
+
+    Args:
+        workers (int, optional): number of worker threads. Defaults to 4.
+    """
+    out = sys.stdout
+    out_lock = threading.Lock()
+    # bound the number of requests read ahead of the workers
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def respond(line: str) -> None:
+        try:
+            response = run_serve_request(line)
+            with out_lock:
+                out.write(json.dumps(response) + "\n")
+                out.flush()
+        finally:
+            slots.release()
+
+    # responses are written to out and everything the commands write to stdout goes to stderr
+    with redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=workers) as executor:
+        for line in iter(sys.stdin.readline, ''):
+            if line.strip():
+                slots.acquire()  # pylint: disable=consider-using-with
+                executor.submit(respond, line)
+
+
+def _process_pool(workers: Union[int, None]) -> ProcessPoolExecutor:
+    """Create a pool of worker processes configured with the options of main. Workers are spawned rather than forked,
+    because a fork copies the locks held by other threads of the parent (e.g. the worker threads of serve) into the
+    child, where they are never released."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_configure_worker, initargs=(_WORKER_OPTIONS,))
+
+
+def _configure_worker(options: Dict[str, Any]) -> None:
+    """Configure a spawned worker process with the options of main of the parent process"""
+    if options:
+        _configure(**options)
+
+
+def _create_plan_variant_in_worker(base_filepath: str, dst_plan_hdf: str, entries: List[Dict[str, str]],
+                                   keep_dates: bool, in_memory_max_bytes: int, skip_unchanged: bool,
+                                   prepare: Dict[str, Any], profile: Union[str, None] = None) -> tuple:
+    """Run create_plan_variant in a worker process and return its metrics records to the parent process"""
+    metrics_util.reset_for_worker()
+    create_plan_variant(base_filepath, dst_plan_hdf, entries, keep_dates, in_memory_max_bytes, skip_unchanged, prepare,
+                        profile)
+    return dst_plan_hdf, metrics_util.stop_recording()
+
+
+def run_serve_request(line: str) -> Dict[str, Any]:
+    """Run a command from a JSON request line (see serve).
+
+    Args:
+        line (str): JSON request
+
+    Returns:
+        Dict[str, Any]: response with 'id', 'status', 'error' and 'seconds'
+    """
+    start = time.perf_counter()
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        command = SERVE_COMMANDS.get(request.get('command'))
+        if command is None:
+            raise ValueError(
+                f"Invalid command '{request.get('command')}'. Must be one of {list(SERVE_COMMANDS)}")
+        command.main(args=[str(arg) for arg in request.get('args', [])],
+                     prog_name=request['command'], standalone_mode=False)
+        error = None
+    except Exception as exc:  # pylint: disable=broad-except
+        error = f"{type(exc).__name__}: {exc}"
+    return {'id': request_id, 'status': 'error' if error else 'ok', 'error': error,
+            'seconds': round(time.perf_counter() - start, 6)}
+
+
+SERVE_COMMANDS = {
+    'create-plan-tmp-hdf': create_plan_tmp_hdf,
+    'set-plan-hdf-hydrograph': set_plan_hdf_hydrograph,
+    'set-plan-hdf-hydrographs': set_plan_hdf_hydrographs,
+    'set-plan-hdf-gridded-precipitation': set_plan_hdf_gridded_precipitation,
+    'repack-hdf': repack_hdf,
+    'export-plan-hydrographs': export_plan_hydrographs,
+    'index-hdf': index_hdf,
+    'extract-results': extract_results,
+    'stage-plan-run': stage_plan_run,
+}
+
+
+def read_timeseries(src_hydrograph: str, input_type: str = 'DSS', start: Union['datetime', None] = None,
+                    end: Union['datetime', None] = None) -> 'Timeseries':
+    """Read a hydrograph into a Timeseries of times and values.
+
+    Args:
+        src_hydrograph (str): URI of hydrograph. DSS file should be in <URI>:<pathname> format. PARQUET file should
+        be in <URI>[:<column>] format.
+        input_type (str, optional): one of ['DSS', 'CSV', 'PARQUET']. Defaults to 'DSS'.
+        start (Union[datetime, None], optional): start of the window of PARQUET files to read, with the samples next
+        to it (see dss_util.read_parquet_timeseries). Other files are read whole. Defaults to None.
+        end (Union[datetime, None], optional): end of the window of PARQUET files to read. Defaults to None.
+
+    Raises:
+        ValueError
+
+    Returns:
+        Timeseries: timeseries data
+    """
+    from dss_util import read_csv_timeseries, read_dss_timeseries, read_parquet_timeseries
+    if input_type == 'DSS':
+        return read_dss_timeseries(src_hydrograph)
+    if input_type == 'CSV':
+        return read_csv_timeseries(src_hydrograph)
+    if input_type == 'PARQUET':
+        return read_parquet_timeseries(src_hydrograph, start=start, end=end)
+    raise ValueError(
+        f"Invalid input_type option. Must be one of {INPUT_TYPES}")
+
+
+def _read_window(plan_hdf: str, input_types: List[str],
+                 prepare: Dict[str, Any]) -> Tuple[Union['datetime', None], Union['datetime', None]]:
+    """Read the simulation window of a plan if its hydrographs are clipped to it and any of them is read from a
+    PARQUET file, so only the row groups in the window are read. Otherwise (None, None)."""
+    if not prepare.get('clip') or 'PARQUET' not in input_types:
+        return None, None
+    from hdf_util import read_plan_simulation_window
+    return read_plan_simulation_window(plan_hdf)
+
+
+def read_manifest_timeseries(entries: List[Dict[str, str]], max_workers: int = MAX_READ_WORKERS,
+                             start: Union['datetime', None] = None,
+                             end: Union['datetime', None] = None) -> Dict[str, 'Timeseries']:
+    """Read the hydrographs of manifest entries into Timeseries. Each DSS file is read once for all of its
+    pathnames and each PARQUET file is read once for all of its columns. Files are read concurrently, so the time to
+    read all of them is close to the time to read the slowest one.
+
+    Args:
+        entries (List[Dict[str, str]]): manifest entries (see read_hydrograph_manifest)
+        max_workers (int, optional): max number of files read at the same time. Defaults to MAX_READ_WORKERS.
+        start (Union[datetime, None], optional): start of the window of PARQUET files to read (see read_timeseries).
+        Defaults to None.
+        end (Union[datetime, None], optional): end of the window of PARQUET files to read. Defaults to None.
+
+    Returns:
+        Dict[str, Timeseries]: mapping of hydrograph name to timeseries data
+    """
+    from dss_util import read_dss_timeseries_many, read_parquet_timeseries_many, split_parquet_path
+    dss_pathnames: Dict[str, List[str]] = {}
+    parquet_columns: Dict[str, List[str]] = {}
+    for entry in entries:
+        if entry['input_type'] == 'DSS':
+            uri, pathname = entry['src'].rsplit(':', 1)
+            dss_pathnames.setdefault(uri, []).append(pathname)
+        elif entry['input_type'] == 'PARQUET':
+            uri, column = split_parquet_path(entry['src'])
+            parquet_columns.setdefault(uri, []).append(column)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dss_timeseries = {uri: executor.submit(read_dss_timeseries_many, uri, pathnames)
+                          for uri, pathnames in dss_pathnames.items()}
+        parquet_timeseries = {uri: executor.submit(read_parquet_timeseries_many, uri, columns, start, end,
+                                                   keep_neighbors=True)
+                              for uri, columns in parquet_columns.items()}
+        other_timeseries = {index: executor.submit(read_timeseries, entry['src'], entry['input_type'])
+                            for index, entry in enumerate(entries) if entry['input_type'] not in ('DSS', 'PARQUET')}
+        hydrographs = {}
+        for index, entry in enumerate(entries):
+            if entry['input_type'] == 'DSS':
+                uri, pathname = entry['src'].rsplit(':', 1)
+                hydrographs[entry['name']] = dss_timeseries[uri].result()[pathname]
+            elif entry['input_type'] == 'PARQUET':
+                uri, column = split_parquet_path(entry['src'])
+                hydrographs[entry['name']] = parquet_timeseries[uri].result()[column]
+            else:
+                hydrographs[entry['name']] = other_timeseries[index].result()
+    return hydrographs
+
+
+def read_hydrograph_manifest(manifest_uri: str, default_input_type: str = 'DSS',
+                             default_boundary_type: str = 'FLOW') -> List[Dict[str, str]]:
+    """Read a manifest of hydrograph updates. JSON manifests are a list of objects and CSV manifests have a header
+    row, both with the keys 'name', 'src' and optionally 'input_type' and 'boundary_type'. e.g.
+
+        [{"name": "River: White  Reach: Muncie  RS: 15696.24", "src": "s3://bucket/flows.dss:/A/B/FLOW//1HOUR/F/"}]
+
+        name,src,input_type
+        River: White  Reach: Muncie  RS: 15696.24,s3://bucket/flow.csv,CSV
+
+    Args:
+        manifest_uri (str): URI of a .json or .csv manifest file
+        default_input_type (str, optional): input type for entries without one. Defaults to 'DSS'.
+        default_boundary_type (str, optional): boundary type for entries without one. Defaults to 'FLOW'.
+
+    Raises:
+        ValueError
+
+    Returns:
+        List[Dict[str, str]]: manifest entries with keys 'name', 'src', 'input_type' and 'boundary_type' (and
+        'output' if the manifest has an 'output' key, see create_plan_ensemble)
+    """
+    from fs_util import get_string
+    text = get_string(manifest_uri)
+    if os.path.splitext(manifest_uri)[1].lower() == '.json':
+        records = json.loads(text)
     else:
-        raise ValueError(
-            "Invalid input_type option. Must be one of ['DSS', 'CSV']")
-    update_hydrograph(temp_hdf_filepath, plan_hdf_hydrograph_name,
-                      timeseries, keep_dates=keep_dates)
-    # overwrite existing file with new data
-    put_file(temp_hdf_filepath, plan_hdf)
+        records = list(csv.DictReader(io.StringIO(text)))
+    entries = []
+    for record in records:
+        if not record.get('name') or not record.get('src'):
+            raise ValueError(
+                f"Manifest entries must have a 'name' and 'src' but found {record}")
+        entry_input_type = record.get('input_type') or default_input_type
+        if entry_input_type not in INPUT_TYPES:
+            raise ValueError(
+                f"Invalid input_type '{entry_input_type}' in manifest. Must be one of {INPUT_TYPES}")
+        entry_boundary_type = (record.get('boundary_type') or default_boundary_type).upper()
+        if entry_boundary_type not in BOUNDARY_TYPES:
+            raise ValueError(
+                f"Invalid boundary_type '{entry_boundary_type}' in manifest. Must be one of {BOUNDARY_TYPES}")
+        # a pattern could match many records of the DSS file, but each entry overwrites one hydrograph
+        if entry_input_type == 'DSS' and any(char in record['src'].rsplit(':', 1)[-1] for char in '*?'):
+            raise ValueError(
+                f"DSS pathname patterns are not supported in manifests. Give one pathname per entry but found {record}")
+        entry = {'name': record['name'], 'src': record['src'], 'input_type': entry_input_type,
+                 'boundary_type': entry_boundary_type}
+        if record.get('output'):
+            entry['output'] = record['output']
+        entries.append(entry)
+    return entries
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+"""Tests for the remote file cache"""
+import os
+import shutil
+import tempfile
+import fsspec
+from cache_util import FileCache, configure_cache
+from fs_util import get_temp_file, put_file
+
+TEST_CACHE_DIR = None
+
+
+def setup_module():
+    """Create a cache directory and test data in an in-memory filesystem standing in for remote storage."""
+    global TEST_CACHE_DIR
+    TEST_CACHE_DIR = tempfile.mkdtemp()
+    memory_fs = fsspec.filesystem('memory')
+    for i in range(3):
+        memory_fs.pipe(f'/test_cache/{i}.bin', bytes([i]) * 1000)
+
+
+def teardown_module():
+    """Cleanup cache directory and test data."""
+    configure_cache(None)
+    shutil.rmtree(TEST_CACHE_DIR)
+    fsspec.filesystem('memory').rm('/test_cache', recursive=True)
+
+
+def test_cache_hits_and_eviction():
+    """Test cache hits skip downloads and least recently used files are evicted"""
+    cache = FileCache(TEST_CACHE_DIR, max_bytes=2500)
+    filepath = get_temp_file(ext=".bin")
+    assert not cache.get_file("memory://test_cache/0.bin", filepath, put_file)
+    assert not cache.get_file("memory://test_cache/1.bin", filepath, put_file)
+    assert cache.get_file("memory://test_cache/0.bin", filepath, put_file)
+    assert not cache.get_file("memory://test_cache/2.bin", filepath, put_file)
+    # 1.bin was least recently used
+    assert cache.get_file("memory://test_cache/0.bin", filepath, put_file)
+    assert not cache.get_file("memory://test_cache/1.bin", filepath, put_file)
+    with open(filepath, 'rb') as file:
+        assert file.read() == bytes([1]) * 1000
+    os.remove(filepath)
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 4
+    assert stats['entries'] == 2
+
+
+def test_get_temp_file_cache():
+    """Test get_temp_file uses the configured cache and misses when the remote file changes"""
+    cache = configure_cache(TEST_CACHE_DIR)
+    cache.clear()
+    hits = cache.stats()['hits']
+    for _ in range(2):
+        filepath = get_temp_file("memory://test_cache/2.bin")
+        os.remove(filepath)
+    assert cache.stats()['hits'] == hits + 1
+    assert cache.stats()['entries'] == 1
+    fsspec.filesystem('memory').pipe('/test_cache/2.bin', b'changed')
+    filepath = get_temp_file("memory://test_cache/2.bin")
+    with open(filepath, 'rb') as file:
+        assert file.read() == b'changed'
+    os.remove(filepath)
+    assert cache.stats()['entries'] == 2
@@ -1,26 +1,146 @@
 """Tests for reading hydrograph data"""
+import os
+import threading
 import numpy as np
-from dss_util import read_dss_timeseries, read_csv_timeseries
+import pandas as pd
+import pytest
+import metrics_util
+from dss_util import read_dss_timeseries, read_csv_timeseries, read_dss_timeseries_many, read_dss_catalog, \
+    read_parquet_timeseries, read_parquet_timeseries_many, iter_dss_grids, iter_parquet_grid
+from fs_util import get_temp_file
+from tests.test_util import delete_if_exists
+
+TEST_PARQUET_TEMP_FILE = None
+
+
+def setup_module():
+    """Create temp files for tests."""
+    global TEST_PARQUET_TEMP_FILE
+    TEST_PARQUET_TEMP_FILE = get_temp_file(ext=".parquet")
+
+
+def teardown_module():
+    """Cleanup created test files."""
+    delete_if_exists(TEST_PARQUET_TEMP_FILE)
 
 
 def test_read_dss():
     """Test reading dss file on local filesystem"""
     timeseries = read_dss_timeseries(
         "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
-    num_rows = len(timeseries.index)
+    num_rows = len(timeseries)
     assert num_rows == 7
-    assert timeseries.columns[0] == 'time'
-    assert timeseries.columns[1] == 'value'
-    assert timeseries.dtypes['time'] == np.dtype('datetime64[ns]')
-    assert timeseries.dtypes['value'] == np.dtype('float32')
+    assert timeseries.time.dtype == np.dtype('datetime64[ns]')
+    assert timeseries.value.dtype == np.dtype('float32')
+
+
+def test_read_dss_many():
+    """Test reading a list and a pattern of pathnames from one dss file"""
+    pathname = "/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/"
+    timeseries = read_dss_timeseries_many("tests/data/hydrograph.dss", [pathname])
+    assert list(timeseries.keys()) == [pathname]
+    assert len(timeseries[pathname]) == 7
+    timeseries = read_dss_timeseries_many("tests/data/hydrograph.dss", "/REGULAR/*/FLOW//1HOUR/*/")
+    assert pathname in timeseries
+
+
+def test_read_dss_catalog():
+    """Test reading the pathnames in a dss file"""
+    catalog = read_dss_catalog("tests/data/hydrograph.dss")
+    assert "/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/" in catalog
 
 
 def test_read_csv():
     """Test reading csv file on local filesystem"""
     timeseries = read_csv_timeseries("tests/data/hydrograph.csv")
-    num_rows = len(timeseries.index)
+    num_rows = len(timeseries)
     assert num_rows == 728
-    assert timeseries.columns[0] == 'time'
-    assert timeseries.columns[1] == 'value'
-    assert timeseries.dtypes['time'] == np.dtype('datetime64[ns]')
-    assert timeseries.dtypes['value'] == np.dtype('float32')
+    assert timeseries.time.dtype == np.dtype('datetime64[ns]')
+    assert timeseries.value.dtype == np.dtype('float32')
+
+
+def test_read_csv_pandas():
+    """Test pyarrow and pandas csv readers return the same data"""
+    pyarrow_timeseries = read_csv_timeseries("tests/data/hydrograph.csv")
+    pandas_timeseries = read_csv_timeseries("tests/data/hydrograph.csv", engine='pandas')
+    assert pyarrow_timeseries.equals(pandas_timeseries)
+
+
+def test_read_csv_pandas_datetime_format():
+    """Test the pandas reader used when pyarrow can't parse the times uses the datetime format"""
+    csv_filepath = get_temp_file(ext=".csv")
+    with open(csv_filepath, 'w', encoding='utf-8') as file:
+        file.write("time,value\n02/01/2020 01:00 -0500,1.5\n13/01/2020 02:00 -0500,2.5\n")
+    timeseries = read_csv_timeseries(csv_filepath, datetime_format='%d/%m/%Y %H:%M %z')
+    assert list(timeseries.time) == [np.datetime64('2020-01-02T01:00'), np.datetime64('2020-01-13T02:00')]
+    assert list(timeseries.value) == [1.5, 2.5]
+    delete_if_exists(csv_filepath)
+
+
+def test_read_parquet():
+    """Test reading selected columns of a parquet file"""
+    timeseries = read_csv_timeseries("tests/data/hydrograph.csv")
+    pd.DataFrame({'time': timeseries['time'], 'value': timeseries['value'], 'doubled': timeseries['value'] * 2}) \
+        .to_parquet(TEST_PARQUET_TEMP_FILE, row_group_size=100)
+    parquet_timeseries = read_parquet_timeseries(TEST_PARQUET_TEMP_FILE)
+    assert parquet_timeseries.equals(timeseries)
+    doubled = read_parquet_timeseries(TEST_PARQUET_TEMP_FILE + ":doubled")
+    assert doubled['value'][0] == timeseries['value'][0] * 2
+    assert doubled.time.dtype == np.dtype('datetime64[ns]')
+    assert doubled.value.dtype == np.dtype('float32')
+    columns = read_parquet_timeseries_many(TEST_PARQUET_TEMP_FILE, ['value', 'doubled'], start=timeseries['time'][100])
+    assert len(columns['doubled']) == 628
+    # columns of one file share the same times
+    assert columns['doubled'].time is columns['value'].time
+
+
+def test_iter_dss_grids_concurrent_reads():
+    """Test other threads can read dss files while a consumer of iter_dss_grids works on a batch"""
+    from pydsstools.heclib.dss.HecDss import Open
+    from pydsstools.heclib.utils import gridInfo
+    grid_filepath = get_temp_file(ext=".dss")
+    os.remove(grid_filepath)
+    grid_info = gridInfo()
+    grid_info.update([('grid_type', 'specified-time'), ('grid_crs', 'UNDEFINED'),
+                      ('grid_transform', (1.0, 0.0, 0.0, 0.0, -1.0, 0.0)), ('data_type', 'per-cum'),
+                      ('data_units', 'mm'), ('opt_dtype', np.float32)])
+    with Open(grid_filepath) as fid:
+        for hour in range(4):
+            fid.put_grid(f"/SHG/BASIN/PRECIP/01JAN2000:{hour:02d}00/01JAN2000:{hour + 1:02d}00/TEST/",
+                         np.full((3, 2), hour, dtype=np.float32), grid_info)
+    chunks = iter_dss_grids(grid_filepath, "/SHG/BASIN/PRECIP/*/*/*/", batch_rows=2)
+    times, values = next(chunks)
+    assert values.shape == (2, 6)
+    # a read of another thread finishes while the first batch is being written
+    read = threading.Event()
+    reader = threading.Thread(target=lambda: read.set() if read_dss_catalog(grid_filepath) else None)
+    reader.start()
+    assert read.wait(timeout=30)
+    reader.join()
+    times, values = next(chunks)
+    assert times[-1] == np.datetime64('2000-01-01T04:00')
+    assert values[-1, 0] == 3
+    delete_if_exists(grid_filepath)
+
+
+def test_iter_parquet_grid_stages():
+    """Test the stages of a grid generator are closed while the consumer runs, so the consumer's stages have the
+    right parent even when the consumer fails in the middle of the stream"""
+    grid_filepath = get_temp_file(ext=".parquet")
+    pd.DataFrame({'time': pd.date_range("2000-01-01", periods=4, freq="h"), 'c0': np.arange(4.0),
+                  'c1': np.arange(4.0)}).to_parquet(grid_filepath)
+    metrics_util.start_recording()
+    try:
+        with pytest.raises(ValueError):
+            for times, values in iter_parquet_grid(grid_filepath, batch_rows=2):
+                with metrics_util.stage('write_batch', rows=len(times)):
+                    if values[0, 0] == 2:
+                        raise ValueError("bad batch")
+    finally:
+        records = metrics_util.stop_recording()
+    assert [(record['stage'], record['parent']) for record in records] == [
+        ('read_parquet_grid', None), ('read_parquet_grid_batch', None), ('write_batch', None),
+        ('read_parquet_grid_batch', None), ('write_batch', None)]
+    assert records[1]['rows'] == 2
+    assert records[-1]['error'] == 'ValueError'
+    delete_if_exists(grid_filepath)
@@ -0,0 +1,131 @@
+"""Tests for filesystem helpers"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import fsspec
+import pytest
+from fs_util import get_temp_file, put_bytes, put_file, content_checksums, clone_file, RangeReader
+from tests.test_util import delete_if_exists
+
+TEST_DATA = os.urandom(3000001)
+TEST_LOCAL_TEMP_FILE = None
+
+
+def setup_module():
+    """Create test data in an in-memory filesystem standing in for remote storage."""
+    global TEST_LOCAL_TEMP_FILE
+    TEST_LOCAL_TEMP_FILE = get_temp_file(ext=".bin")
+    fsspec.filesystem('memory').pipe('/test_fs/data.bin', TEST_DATA)
+
+
+def teardown_module():
+    """Cleanup created test files."""
+    delete_if_exists(TEST_LOCAL_TEMP_FILE)
+    fsspec.filesystem('memory').rm('/test_fs', recursive=True)
+
+
+def test_get_temp_file_in_parts():
+    """Test downloading a remote file with concurrent ranged reads"""
+    filepath = get_temp_file("memory://test_fs/data.bin", part_size=1000000, max_workers=3)
+    with open(filepath, 'rb') as file:
+        assert file.read() == TEST_DATA
+    os.remove(filepath)
+
+
+def test_put_file():
+    """Test copying local to remote, remote to local and local to local"""
+    put_file("memory://test_fs/data.bin", TEST_LOCAL_TEMP_FILE)
+    put_file(TEST_LOCAL_TEMP_FILE, "memory://test_fs/copy.bin")
+    assert fsspec.filesystem('memory').cat('/test_fs/copy.bin') == TEST_DATA
+    # missing directories of local destinations are created
+    new_dir = os.path.join(tempfile.mkdtemp(), "new")
+    put_file(TEST_LOCAL_TEMP_FILE, os.path.join(new_dir, "local", "copy.bin"))
+    put_file("memory://test_fs/data.bin", os.path.join(new_dir, "remote", "copy.bin"))
+    put_file("memory://test_fs/data.bin", os.path.join(new_dir, "parts", "copy.bin"), part_size=1000000)
+    for name in ["local", "remote", "parts"]:
+        with open(os.path.join(new_dir, name, "copy.bin"), 'rb') as file:
+            assert file.read() == TEST_DATA
+    shutil.rmtree(os.path.dirname(new_dir))
+    # uploads to filesystems other than S3 and Azure are not sent in parts
+    with pytest.raises(ValueError):
+        put_file(TEST_LOCAL_TEMP_FILE, "memory://test_fs/copy.bin", part_size=1000000, max_workers=3)
+    filepath = get_temp_file(TEST_LOCAL_TEMP_FILE)
+    with open(filepath, 'rb') as file:
+        assert file.read() == TEST_DATA
+    os.remove(filepath)
+
+
+def test_range_reader():
+    """Test reading byte ranges of a remote file and counting bytes transferred"""
+    with RangeReader("memory://test_fs/data.bin", block_size=1000) as file:
+        file.seek(-10, os.SEEK_END)
+        assert file.read() == TEST_DATA[-10:]
+        file.seek(5000)
+        assert file.read(5) == TEST_DATA[5000:5005]
+        assert file.bytes_transferred == 1000 + 1001
+
+
+def test_content_checksums():
+    """Test computing the MD5 and the S3 multipart ETag in one pass"""
+    content_md5, multipart_etag, size = content_checksums(TEST_DATA, part_size=1000000)
+    assert content_md5 == hashlib.md5(TEST_DATA).hexdigest()
+    part_digests = b"".join(hashlib.md5(TEST_DATA[start:start + 1000000]).digest()
+                            for start in range(0, len(TEST_DATA), 1000000))
+    assert multipart_etag == hashlib.md5(part_digests).hexdigest() + "-4"
+    assert size == len(TEST_DATA)
+    with open(TEST_LOCAL_TEMP_FILE, 'wb') as file:
+        file.write(TEST_DATA)
+    assert content_checksums(TEST_LOCAL_TEMP_FILE, part_size=1000000) == (content_md5, multipart_etag, size)
+
+
+def test_put_skip_unchanged():
+    """Test skipping uploads when the destination has the same content"""
+    with open(TEST_LOCAL_TEMP_FILE, 'wb') as file:
+        file.write(TEST_DATA)
+    assert put_file(TEST_LOCAL_TEMP_FILE, "memory://test_fs/skip.bin", skip_unchanged=True)
+    assert not put_file(TEST_LOCAL_TEMP_FILE, "memory://test_fs/skip.bin", skip_unchanged=True)
+    assert not put_bytes(TEST_DATA, "memory://test_fs/skip.bin", skip_unchanged=True)
+    assert put_bytes(TEST_DATA[::-1], "memory://test_fs/skip.bin", skip_unchanged=True)
+    assert fsspec.filesystem('memory').cat('/test_fs/skip.bin') == TEST_DATA[::-1]
+    # the destination changed after the checksum was stored
+    fsspec.filesystem('memory').pipe('/test_fs/skip.bin', TEST_DATA)
+    assert put_bytes(TEST_DATA, "memory://test_fs/skip.bin", skip_unchanged=True)
+    copy_filepath = get_temp_file(ext=".bin")
+    assert put_file(TEST_LOCAL_TEMP_FILE, copy_filepath, skip_unchanged=True)
+    # the MD5 computed while copying is stored next to local files too
+    with open(copy_filepath + ".md5.json", 'r', encoding='utf-8') as file:
+        assert json.load(file)['md5'] == hashlib.md5(TEST_DATA).hexdigest()
+    assert not put_file(TEST_LOCAL_TEMP_FILE, copy_filepath, skip_unchanged=True)
+    # local files are compared by metadata, so the destination is not read back
+    stat = os.stat(copy_filepath)
+    with open(copy_filepath, 'r+b') as file:
+        file.write(b'\0')
+    os.utime(copy_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not put_file(TEST_LOCAL_TEMP_FILE, copy_filepath, skip_unchanged=True)
+    # a local file without a sidecar is copied
+    os.remove(copy_filepath + ".md5.json")
+    assert put_file(TEST_LOCAL_TEMP_FILE, copy_filepath, skip_unchanged=True)
+    with open(copy_filepath, 'rb') as file:
+        assert file.read() == TEST_DATA
+    os.remove(copy_filepath)
+    os.remove(copy_filepath + ".md5.json")
+
+
+def test_clone_file():
+    """Test cloning a local file by hardlink, by reflink or copy, and by copy"""
+    put_file("memory://test_fs/data.bin", TEST_LOCAL_TEMP_FILE)
+    dst_filepath = get_temp_file(ext=".bin")
+    assert clone_file(TEST_LOCAL_TEMP_FILE, dst_filepath, 'hardlink') == 'hardlink'
+    assert os.path.samefile(TEST_LOCAL_TEMP_FILE, dst_filepath)
+    assert clone_file(TEST_LOCAL_TEMP_FILE, dst_filepath, 'hardlink') == 'unchanged'
+    # a reflink or copy replaces the hardlink with a file that can be changed independently
+    assert clone_file(TEST_LOCAL_TEMP_FILE, dst_filepath) in ('reflink', 'copy')
+    assert not os.path.samefile(TEST_LOCAL_TEMP_FILE, dst_filepath)
+    # the default never keeps a hardlink
+    assert clone_file(TEST_LOCAL_TEMP_FILE, dst_filepath) in ('reflink', 'copy')
+    assert clone_file(TEST_LOCAL_TEMP_FILE, dst_filepath, 'copy') == 'copy'
+    with open(dst_filepath, 'rb') as file:
+        assert file.read() == TEST_DATA
+    os.remove(dst_filepath)
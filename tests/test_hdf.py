@@ -1,9 +1,16 @@
 """Tests for reading and writing hdf5 files"""
+import fnmatch
+import os
 from datetime import datetime
 import h5py
 import numpy as np
+import pandas as pd
+import pytest
 from tests.test_util import delete_if_exists
-from hdf_util import copy_hdf, create_hydrograph_times, format_date_string_hydrograph_attrib, copy_attrib, update_hydrograph
+from hdf_util import copy_hdf, create_hydrograph_times, format_date_string_hydrograph_attrib, copy_attrib, update_hydrograph, \
+    update_hydrographs, repack_hdf, edit_hdf, write_gridded_boundary, GRIDDED_PRECIPITATION_GROUP, \
+    read_hydrographs, read_hdf_index, index_hydrographs, index_group_sizes, INDEX_SIDECAR_EXT, extract_results, \
+    dataset_options
 from dss_util import read_dss_timeseries
 from fs_util import get_temp_file
 
@@ -11,15 +18,31 @@ TEST_COPY_HDF_TEMP_FILE1 = None
 TEST_COPY_HDF_TEMP_FILE2 = None
 TEST_COPY_ATTRIB_TEMP_FILE = None
 TEST_UPDATE_HYDROGRAPH_TEMP_FILE = None
+TEST_UPDATE_HYDROGRAPHS_TEMP_FILE = None
+TEST_REPACK_HDF_TEMP_FILE = None
+TEST_IN_MEMORY_HDF_TEMP_FILE = None
+TEST_GRIDDED_HDF_TEMP_FILE = None
+TEST_INDEX_HDF_TEMP_FILE = None
+TEST_EXTRACT_HDF_TEMP_FILE = None
+TEST_PROFILE_HDF_TEMP_FILE = None
 
 
 def setup_module():
     """Create temp files for tests."""
     global TEST_COPY_HDF_TEMP_FILE1, TEST_COPY_HDF_TEMP_FILE2, TEST_COPY_ATTRIB_TEMP_FILE, TEST_UPDATE_HYDROGRAPH_TEMP_FILE
+    global TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, TEST_REPACK_HDF_TEMP_FILE, TEST_IN_MEMORY_HDF_TEMP_FILE
+    global TEST_GRIDDED_HDF_TEMP_FILE, TEST_INDEX_HDF_TEMP_FILE, TEST_EXTRACT_HDF_TEMP_FILE, TEST_PROFILE_HDF_TEMP_FILE
     TEST_COPY_HDF_TEMP_FILE1 = get_temp_file(ext=".hdf")
     TEST_COPY_HDF_TEMP_FILE2 = get_temp_file(ext=".hdf")
     TEST_COPY_ATTRIB_TEMP_FILE = get_temp_file(ext=".hdf")
     TEST_UPDATE_HYDROGRAPH_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_UPDATE_HYDROGRAPHS_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_REPACK_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_IN_MEMORY_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_GRIDDED_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_INDEX_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_EXTRACT_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_PROFILE_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
 
 
 def teardown_module():
@@ -28,6 +51,14 @@ def teardown_module():
     delete_if_exists(TEST_COPY_HDF_TEMP_FILE2)
     delete_if_exists(TEST_COPY_ATTRIB_TEMP_FILE)
     delete_if_exists(TEST_UPDATE_HYDROGRAPH_TEMP_FILE)
+    delete_if_exists(TEST_UPDATE_HYDROGRAPHS_TEMP_FILE)
+    delete_if_exists(TEST_REPACK_HDF_TEMP_FILE)
+    delete_if_exists(TEST_IN_MEMORY_HDF_TEMP_FILE)
+    delete_if_exists(TEST_GRIDDED_HDF_TEMP_FILE)
+    delete_if_exists(TEST_INDEX_HDF_TEMP_FILE)
+    delete_if_exists(TEST_INDEX_HDF_TEMP_FILE + INDEX_SIDECAR_EXT)
+    delete_if_exists(TEST_EXTRACT_HDF_TEMP_FILE)
+    delete_if_exists(TEST_PROFILE_HDF_TEMP_FILE)
 
 
 def test_copy_hdf():
@@ -49,6 +80,15 @@ def test_copy_hdf():
         assert n_rows == 4
 
 
+def test_copy_hdf_range_read():
+    """Test copying HDF file through byte range reads without downloading removed groups"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    bytes_read = copy_hdf(src_file, TEST_COPY_HDF_TEMP_FILE1, ["Results"], range_read=True)
+    assert 0 < bytes_read <= os.path.getsize(src_file)
+    with h5py.File(TEST_COPY_HDF_TEMP_FILE1, 'r') as file:
+        assert list(file.keys()) == ["Event Conditions", "Geometry", "Plan Data"]
+
+
 def test_create_hydrograph_times():
     """Test creating hydrograph times for HDF file"""
     times = create_hydrograph_times(read_dss_timeseries(
@@ -57,6 +97,18 @@ def test_create_hydrograph_times():
     assert times.dtype == np.float32
 
 
+def test_create_hydrograph_times_units():
+    """Test creating hydrograph times in each interval unit without drift"""
+    datetime_column = pd.Series(pd.date_range("2000-01-01", periods=200000, freq="15min"))
+    days = create_hydrograph_times(datetime_column, 'Days')
+    assert days[-1] == np.float32(199999 / 96)
+    assert create_hydrograph_times(datetime_column, 'Hours')[1] == np.float32(0.25)
+    assert create_hydrograph_times(datetime_column, 'Mins')[2] == np.float32(30)
+    assert create_hydrograph_times(datetime_column, 'Seconds')[1] == np.float32(900)
+    with pytest.raises(ValueError):
+        create_hydrograph_times(datetime_column, 'Fortnights')
+
+
 def test_format_date_string():
     """Test date formating for HEC-RAS HDF"""
     date_str = format_date_string_hydrograph_attrib(datetime(2019, 4, 13))
@@ -85,3 +137,203 @@ def test_update_hydrograph():
     with h5py.File(TEST_UPDATE_HYDROGRAPH_TEMP_FILE, 'r') as temp:
         dataset = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/River: White  Reach: Muncie  RS: 15696.24"]
         assert dataset.shape == (7, 2)
+
+
+def test_update_hydrographs():
+    """Test updating many hydrographs in one pass of the hdf file"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    copy_hdf(src_file, TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, ["Results"])
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    with h5py.File(TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, 'r') as temp:
+        names = list(temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs"].keys())
+    update_hydrographs(TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, {name: timeseries for name in names})
+    with h5py.File(TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, 'r') as temp:
+        group = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs"]
+        assert "temp" not in group.keys()
+        for name in names:
+            assert group[name].shape == (7, 2)
+
+
+def test_read_hydrographs():
+    """Test reading back the hydrographs written by update_hydrographs with their attributes"""
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    with h5py.File(TEST_UPDATE_HYDROGRAPHS_TEMP_FILE, 'r') as temp:
+        hydrographs = read_hydrographs(temp)
+    assert {hydrograph['boundary_type'] for hydrograph in hydrographs} == {'FLOW'}
+    hydrograph = next(hydrograph for hydrograph in hydrographs
+                      if hydrograph['name'] == "River: White  Reach: Muncie  RS: 15696.24")
+    assert hydrograph['river'] == "White"
+    assert np.array_equal(hydrograph['time'], timeseries.time)
+    assert np.allclose(hydrograph['value'], timeseries['value'])
+
+
+def test_update_hydrograph_in_place():
+    """Test repeated hydrograph updates overwrite the dataset in place and repacking reclaims unused space"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    name = "River: White  Reach: Muncie  RS: 15696.24"
+    copy_hdf(src_file, TEST_REPACK_HDF_TEMP_FILE, ["Results"])
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    update_hydrograph(TEST_REPACK_HDF_TEMP_FILE, name, timeseries)
+    size = os.path.getsize(TEST_REPACK_HDF_TEMP_FILE)
+    for _ in range(10):
+        update_hydrograph(TEST_REPACK_HDF_TEMP_FILE, name, timeseries[:5])
+        update_hydrograph(TEST_REPACK_HDF_TEMP_FILE, name, timeseries)
+    assert os.path.getsize(TEST_REPACK_HDF_TEMP_FILE) == size
+    with h5py.File(TEST_REPACK_HDF_TEMP_FILE, 'r') as temp:
+        dataset = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + name]
+        assert dataset.shape == (7, 2)
+        assert dataset.maxshape == (None, 2)
+    size_before, size_after = repack_hdf(TEST_REPACK_HDF_TEMP_FILE)
+    assert size_before == size
+    assert size_after <= size_before
+    with h5py.File(TEST_REPACK_HDF_TEMP_FILE, 'r') as temp:
+        dataset = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + name]
+        assert dataset.shape == (7, 2)
+        assert dataset.attrs["Interval"] is not None
+
+
+@pytest.mark.parametrize("in_memory_max_bytes", [0, 2**30])
+def test_edit_hdf_in_memory(in_memory_max_bytes):
+    """Test copying and editing HDF files in memory below the size threshold and through temp files above it"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    name = "River: White  Reach: Muncie  RS: 15696.24"
+    bytes_read = copy_hdf(src_file, TEST_IN_MEMORY_HDF_TEMP_FILE, ["Results"], in_memory_max_bytes=in_memory_max_bytes)
+    assert bytes_read == os.path.getsize(src_file)
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    with edit_hdf(TEST_IN_MEMORY_HDF_TEMP_FILE, in_memory_max_bytes=in_memory_max_bytes) as edit:
+        assert edit.in_memory == bool(in_memory_max_bytes)
+        update_hydrograph(edit.file, name, timeseries)
+        size_before, size_after = edit.repack()
+        assert size_after <= size_before
+    with h5py.File(TEST_IN_MEMORY_HDF_TEMP_FILE, 'r') as temp:
+        assert "Results" not in temp.keys()
+        dataset = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + name]
+        assert dataset.shape == (7, 2)
+    with pytest.raises(RuntimeError):
+        with edit_hdf(TEST_IN_MEMORY_HDF_TEMP_FILE, in_memory_max_bytes=in_memory_max_bytes) as edit:
+            del edit.file["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + name]
+            raise RuntimeError("edit failed")
+    with h5py.File(TEST_IN_MEMORY_HDF_TEMP_FILE, 'r') as temp:
+        assert name in temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs"].keys()
+
+
+def test_write_gridded_boundary():
+    """Test streaming gridded precipitation into a plan HDF file one chunk of rows at a time"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    copy_hdf(src_file, TEST_GRIDDED_HDF_TEMP_FILE, ["Results"])
+
+    def chunks(count: int):
+        for chunk in range(count):
+            times = np.datetime64('2000-01-01T00:00') + np.arange(chunk * 10, chunk * 10 + 10) * np.timedelta64(1, 'h')
+            yield times, np.full((10, 25), chunk, dtype=np.float32)
+
+    assert write_gridded_boundary(TEST_GRIDDED_HDF_TEMP_FILE, chunks(5), chunk_rows=8) == 50
+    with h5py.File(TEST_GRIDDED_HDF_TEMP_FILE, 'r+') as temp:
+        values = temp[GRIDDED_PRECIPITATION_GROUP + "Values"]
+        assert values.shape == (50, 25)
+        assert values.chunks == (8, 25)
+        assert values[49, 0] == 4
+        values.attrs["Units"] = "mm"
+        timestamps = temp[GRIDDED_PRECIPITATION_GROUP + "Timestamp"]
+        assert timestamps[0] == b"01Jan2000 00:00:00"
+        assert timestamps[49] == b"03Jan2000 01:00:00"
+    # rewriting replaces the data and keeps attributes
+    assert write_gridded_boundary(TEST_GRIDDED_HDF_TEMP_FILE, chunks(2), profile='lzf-shuffle') == 20
+    with h5py.File(TEST_GRIDDED_HDF_TEMP_FILE, 'r') as temp:
+        assert temp[GRIDDED_PRECIPITATION_GROUP + "Values"].shape == (20, 25)
+        assert temp[GRIDDED_PRECIPITATION_GROUP + "Values"].attrs["Units"] == "mm"
+        assert temp[GRIDDED_PRECIPITATION_GROUP + "Values"].compression == 'lzf'
+    with pytest.raises(ValueError):
+        write_gridded_boundary(TEST_GRIDDED_HDF_TEMP_FILE, iter([(np.array(['2000-01-01'], dtype='datetime64[ns]'),
+                                                                  np.zeros((2, 25)))]))
+
+
+def test_dataset_options():
+    """Test the chunks and filters of write profiles"""
+    assert dataset_options('gzip1', (10, 2), np.float32) == {
+        'chunks': True, 'compression': 'gzip', 'compression_opts': 1, 'shuffle': False}
+    options = dataset_options('lzf-shuffle', (10**6, 1000), np.float32)
+    assert options['chunks'] == (262, 1000)
+    assert (options['compression'], options['shuffle']) == ('lzf', True)
+    assert dataset_options('none', (10**6, 10**6), np.float32)['chunks'] == (1, 262144)
+    assert dataset_options('gzip1-shuffle-tiles', (10**6, 1000), np.float32)['chunks'] == (512, 512)
+    assert dataset_options('gzip9-shuffle', (5,), np.float64)['chunks'] == (5,)
+    with pytest.raises(ValueError):
+        dataset_options('zstd', (10, 2), np.float32)
+
+
+def test_copy_hdf_profile():
+    """Test copying an HDF file recompresses its datasets with a write profile and keeps their data and attributes"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    copy_hdf(src_file, TEST_PROFILE_HDF_TEMP_FILE, profile='lzf-shuffle')
+    recompressed = []
+    with h5py.File(src_file, 'r') as src, h5py.File(TEST_PROFILE_HDF_TEMP_FILE, 'r') as dst:
+        def check(name, item):
+            if isinstance(item, h5py.Dataset):
+                assert np.array_equal(item[()], dst[name][()])
+                if dst[name].compression == 'lzf':
+                    assert dst[name].shuffle
+                    recompressed.append(name)
+            assert dict(item.attrs).keys() == dict(dst[name].attrs).keys()
+        src.visititems(check)
+    assert recompressed
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    name = "River: White  Reach: Muncie  RS: 15696.24"
+    update_hydrograph(TEST_PROFILE_HDF_TEMP_FILE, name, timeseries, profile='gzip4-shuffle')
+    with h5py.File(TEST_PROFILE_HDF_TEMP_FILE, 'r') as temp:
+        dataset = temp["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + name]
+        assert dataset.shape == (7, 2)
+        assert (dataset.compression, dataset.compression_opts, dataset.shuffle) == ('gzip', 4, True)
+    with pytest.raises(ValueError):
+        copy_hdf(src_file, TEST_PROFILE_HDF_TEMP_FILE, profile='zstd')
+
+
+def test_read_hdf_index():
+    """Test indexing the structure of an HDF file and reusing the index sidecar until the file changes"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    name = "River: White  Reach: Muncie  RS: 15696.24"
+    copy_hdf(src_file, TEST_INDEX_HDF_TEMP_FILE)
+    index = read_hdf_index(TEST_INDEX_HDF_TEMP_FILE, sidecar=True)
+    assert os.path.exists(TEST_INDEX_HDF_TEMP_FILE + INDEX_SIDECAR_EXT)
+    hydrograph = next(hydrograph for hydrograph in index_hydrographs(index) if hydrograph['name'] == name)
+    assert hydrograph['boundary_type'] == 'FLOW'
+    assert hydrograph['interval']
+    assert next(iter(index_group_sizes(index))) == "/Results"
+    assert read_hdf_index(TEST_INDEX_HDF_TEMP_FILE, sidecar=True) == index
+    timeseries = read_dss_timeseries(
+        "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/")
+    update_hydrograph(TEST_INDEX_HDF_TEMP_FILE, name, timeseries)
+    os.utime(TEST_INDEX_HDF_TEMP_FILE, (0, 0))
+    index = read_hdf_index(TEST_INDEX_HDF_TEMP_FILE, sidecar=True)
+    assert next(hydrograph for hydrograph in index_hydrographs(index) if hydrograph['name'] == name)['rows'] == 7
+
+
+@pytest.mark.parametrize("range_read", [False, True])
+def test_extract_results(range_read):
+    """Test extracting a Results dataset decimated in time in small blocks"""
+    src_file = "tests/data/Muncie.p04.hdf"
+    pattern = "*/Unsteady Time Series/Cross Sections/Water Surface"
+    count = extract_results(src_file, TEST_EXTRACT_HDF_TEMP_FILE, [pattern], step=2, range_read=range_read,
+                            block_bytes=1000)
+    assert count == 1
+    with h5py.File(src_file, 'r') as src, h5py.File(TEST_EXTRACT_HDF_TEMP_FILE, 'r') as dst:
+        path = next(name for name in _dataset_paths(src) if fnmatch.fnmatchcase(name, pattern))
+        time_group = path.split("/Cross Sections/")[0]
+        assert np.array_equal(dst[path][...], src[path][::2])
+        assert np.array_equal(dst[time_group + "/Time Date Stamp"][...], src[time_group + "/Time Date Stamp"][::2])
+        assert set(_dataset_paths(dst["Results"])) <= {path, time_group + "/Time", time_group + "/Time Date Stamp"}
+        assert "Geometry" in dst
+    with pytest.raises(ValueError):
+        extract_results(src_file, TEST_EXTRACT_HDF_TEMP_FILE, ["*/No Such Dataset"])
+
+
+def _dataset_paths(group: h5py.Group) -> list:
+    """List the paths of the datasets in a group"""
+    paths = []
+    group.visititems(lambda name, item: paths.append(item.name) if isinstance(item, h5py.Dataset) else None)
+    return paths
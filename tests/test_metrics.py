@@ -0,0 +1,93 @@
+"""Tests for per-stage metrics"""
+import json
+import pytest
+from click.testing import CliRunner
+import metrics_util
+from fs_util import get_temp_file
+from ras_remodeler import main
+from tests.test_util import delete_if_exists
+
+TEST_METRICS_TEMP_FILE = None
+
+
+def setup_module():
+    """Create temp files for tests."""
+    global TEST_METRICS_TEMP_FILE
+    TEST_METRICS_TEMP_FILE = get_temp_file(ext=".json")
+
+
+def teardown_module():
+    """Cleanup created test files."""
+    delete_if_exists(TEST_METRICS_TEMP_FILE)
+    delete_if_exists("tests/data/Muncie.p04.tmp.hdf")
+
+
+def test_stage_records_and_hooks():
+    """Test nested stages are recorded and passed to hooks"""
+    seen = []
+    metrics_util.add_hook(seen.append)
+    metrics_util.start_recording()
+    try:
+        with metrics_util.stage('outer', uri='a') as outer:
+            outer.bytes_read = 10
+            with metrics_util.stage('inner'):
+                pass
+        with pytest.raises(ValueError):
+            with metrics_util.stage('failing'):
+                raise ValueError()
+    finally:
+        metrics_util.remove_hook(seen.append)
+        records = metrics_util.stop_recording()
+    assert records == seen
+    assert [(record['stage'], record['parent']) for record in records] == [
+        ('inner', 'outer'), ('outer', None), ('failing', None)]
+    assert records[1]['bytes_read'] == 10
+    assert records[1]['uri'] == 'a'
+    assert records[2]['error'] == 'ValueError'
+
+
+def test_interleaved_stages():
+    """Test closing a stage that is not the innermost one keeps the parents of the other stages"""
+    metrics_util.start_recording()
+    try:
+        first = metrics_util.stage('first')
+        first.__enter__()  # pylint: disable=unnecessary-dunder-call
+        second = metrics_util.stage('second')
+        second.__enter__()  # pylint: disable=unnecessary-dunder-call
+        first.__exit__(None, None, None)
+        with metrics_util.stage('third'):
+            pass
+        second.__exit__(None, None, None)
+        with metrics_util.stage('fourth'):
+            pass
+    finally:
+        records = metrics_util.stop_recording()
+    assert [(record['stage'], record['parent']) for record in records] == [
+        ('first', None), ('third', 'second'), ('second', 'first'), ('fourth', None)]
+
+
+def test_stage_peak_rss():
+    """Test the peak RSS of a stage is measured while it runs, so a small stage after a large one has a small peak"""
+    metrics_util.start_recording()
+    try:
+        with metrics_util.stage('large'):
+            data = b'x' * 200 * 2**20
+            del data
+        with metrics_util.stage('small'):
+            pass
+    finally:
+        records = metrics_util.stop_recording()
+    large, small = records
+    assert large['peak_rss_mb'] - small['peak_rss_mb'] > 150
+
+
+def test_metrics_option():
+    """Test writing metrics of a command to JSON"""
+    runner = CliRunner()
+    result = runner.invoke(main, ["--metrics", TEST_METRICS_TEMP_FILE, "create-plan-tmp-hdf",
+                                  "tests/data/Muncie.p04.hdf"])
+    assert result.exit_code == 0
+    with open(TEST_METRICS_TEMP_FILE, 'r', encoding='utf-8') as metrics_file:
+        stages = [record['stage'] for record in json.load(metrics_file)['stages']]
+    assert 'copy_hdf' in stages
+    assert 'put_file' in stages
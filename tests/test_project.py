@@ -0,0 +1,110 @@
+"""Tests for staging the files of HEC-RAS plan runs"""
+import os
+import shutil
+import tempfile
+import fsspec
+import h5py
+import numpy as np
+import pytest
+from project_util import find_plan_files, parse_plan_uri, stage_plan_run
+
+TEST_PROJECT_DIR = None
+TEST_RUN_DIR = None
+PROJECT_FILES = {
+    "Muncie.prj": "Proj Title=Muncie\nCurrent Plan=p04\nGeom File=g01\nUnsteady File=u01\nPlan File=p04\n",
+    "Muncie.p04": "Plan Title=Unsteady Multi 9-SA run\nGeom File=g01\nFlow File=u01\n",
+    "Muncie.b04": "b04",
+    "Muncie.c04": "c04",
+    "Muncie.g01": "g01",
+    "Muncie.g01.hdf": "g01 hdf",
+    "Muncie.u01": "u01",
+    "Muncie.g02": "other geometry",
+    "Muncie.b01": "other plan",
+    "Terrain/Terrain.tif": "terrain",
+}
+
+
+def setup_module():
+    """Create a project directory with a plan HDF file that has Results."""
+    global TEST_PROJECT_DIR, TEST_RUN_DIR
+    TEST_PROJECT_DIR = tempfile.mkdtemp()
+    TEST_RUN_DIR = tempfile.mkdtemp()
+    for name, text in PROJECT_FILES.items():
+        os.makedirs(os.path.dirname(os.path.join(TEST_PROJECT_DIR, name)), exist_ok=True)
+        with open(os.path.join(TEST_PROJECT_DIR, name), 'w', encoding='utf-8') as file:
+            file.write(text)
+    with h5py.File(os.path.join(TEST_PROJECT_DIR, "Muncie.p04.hdf"), 'w') as file:
+        file.create_dataset("Geometry/Cross Sections/Attributes", data=np.arange(100))
+        file.create_dataset("Results/Unsteady/Output/Flow", data=np.zeros((100, 100)))
+
+
+def teardown_module():
+    """Cleanup the project and run directories."""
+    shutil.rmtree(TEST_PROJECT_DIR)
+    shutil.rmtree(TEST_RUN_DIR)
+    fsspec.filesystem('memory').rm('/test_project', recursive=True)
+
+
+def test_parse_plan_uri():
+    """Test the plan of project and plan URIs"""
+    assert parse_plan_uri("s3://bucket/model/Muncie.p04.tmp.hdf") == ("s3://bucket/model", "Muncie", "04")
+    assert parse_plan_uri("Muncie.v2.p12") == (".", "Muncie.v2", "12")
+    assert parse_plan_uri(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"))[1:] == ("Muncie", "04")
+    assert parse_plan_uri(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"), plan="p01")[2] == "01"
+    with pytest.raises(ValueError):
+        parse_plan_uri("Muncie.g01")
+
+
+def test_find_plan_files():
+    """Test the files of a plan run are the project, plan, geometry and flow files of the plan"""
+    plan_hdf, files = find_plan_files(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"), include=["Terrain/*"])
+    assert plan_hdf == os.path.join(TEST_PROJECT_DIR, "Muncie.p04.hdf")
+    assert sorted(files) == ["Muncie.b04", "Muncie.c04", "Muncie.g01", "Muncie.g01.hdf", "Muncie.p04", "Muncie.prj",
+                             "Muncie.u01", "Terrain/Terrain.tif"]
+    with pytest.raises(FileNotFoundError):
+        find_plan_files(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"), plan="p01")
+
+
+def test_stage_plan_run():
+    """Test staging a plan run to many run directories links the inputs and copies the plan HDF without Results"""
+    run_dirs = [os.path.join(TEST_RUN_DIR, f"run{i}") for i in range(3)]
+    counts = stage_plan_run(os.path.join(TEST_PROJECT_DIR, "Muncie.p04.hdf"), run_dirs, include=["Terrain/*"],
+                            link='hardlink')
+    assert counts['hardlink'] == 3 * 8
+    assert counts['reflink'] + counts['copy'] == 3
+    for run_dir in run_dirs:
+        assert os.path.samefile(os.path.join(run_dir, "Terrain/Terrain.tif"),
+                                os.path.join(TEST_PROJECT_DIR, "Terrain/Terrain.tif"))
+        with h5py.File(os.path.join(run_dir, "Muncie.p04.tmp.hdf"), 'r') as file:
+            assert "Results" not in file
+            assert file["Geometry/Cross Sections/Attributes"].shape == (100,)
+    # staging again keeps the links and replaces the plan HDF file
+    counts = stage_plan_run(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"), run_dirs[:1], link='hardlink')
+    assert counts['unchanged'] == 7
+
+
+def test_stage_plan_run_default_link():
+    """Test staged inputs are not shared with the source by default, so a run that rewrites them in place does not
+    change the project"""
+    run_dir = os.path.join(TEST_RUN_DIR, "default")
+    counts = stage_plan_run(os.path.join(TEST_PROJECT_DIR, "Muncie.prj"), [run_dir])
+    assert counts['hardlink'] == 0
+    assert not os.path.samefile(os.path.join(run_dir, "Muncie.c04"), os.path.join(TEST_PROJECT_DIR, "Muncie.c04"))
+    with open(os.path.join(run_dir, "Muncie.c04"), 'r+', encoding='utf-8') as file:
+        file.write("new")
+    with open(os.path.join(TEST_PROJECT_DIR, "Muncie.c04"), 'r', encoding='utf-8') as file:
+        assert file.read() == "c04"
+
+
+def test_stage_remote_plan_run():
+    """Test staging a plan run from remote storage"""
+    memory = fsspec.filesystem('memory')
+    for name in ["Muncie.p04", "Muncie.b04", "Muncie.g01", "Muncie.p04.hdf"]:
+        memory.put_file(os.path.join(TEST_PROJECT_DIR, name), f"/test_project/{name}")
+    run_dir = os.path.join(TEST_RUN_DIR, "remote")
+    counts = stage_plan_run("memory://test_project/Muncie.p04", [run_dir])
+    assert counts['hardlink'] == 0
+    assert counts['reflink'] + counts['copy'] == 4
+    assert sorted(os.listdir(run_dir)) == ["Muncie.b04", "Muncie.g01", "Muncie.p04", "Muncie.p04.tmp.hdf"]
+    with open(os.path.join(run_dir, "Muncie.b04"), 'r', encoding='utf-8') as file:
+        assert file.read() == "b04"
@@ -1,10 +1,35 @@
 """Integration tests for ras remodeler"""
 import os
+import json
+import shutil
+import tempfile
 from click.testing import CliRunner
 import h5py
-from ras_remodeler import create_plan_tmp_hdf, set_plan_hdf_hydrograph
+import numpy as np
+import pandas as pd
+import pytest
+import metrics_util
+from ras_remodeler import create_plan_tmp_hdf, set_plan_hdf_hydrograph, set_plan_hdf_hydrographs, \
+    read_hydrograph_manifest, read_manifest_timeseries, create_plan_ensemble, serve, export_plan_hydrographs, \
+    plan_partitions
+from fs_util import get_temp_file, put_string
+from hdf_util import copy_hdf
 from tests.test_util import delete_if_exists
 
+TEST_MANIFEST_TEMP_FILE = None
+TEST_BATCH_HDF_TEMP_FILE = None
+TEST_ENSEMBLE_TEMP_DIR = None
+TEST_EXPORT_TEMP_DIR = None
+
+
+def setup_module():
+    """Create temp files for tests."""
+    global TEST_MANIFEST_TEMP_FILE, TEST_BATCH_HDF_TEMP_FILE, TEST_ENSEMBLE_TEMP_DIR, TEST_EXPORT_TEMP_DIR
+    TEST_MANIFEST_TEMP_FILE = get_temp_file(ext=".json")
+    TEST_BATCH_HDF_TEMP_FILE = get_temp_file(ext=".hdf")
+    TEST_ENSEMBLE_TEMP_DIR = tempfile.mkdtemp()
+    TEST_EXPORT_TEMP_DIR = tempfile.mkdtemp()
+
 
 def teardown_module():
     """Cleanup created test files."""
@@ -13,7 +38,10 @@ def teardown_module():
     delete_if_exists("bco")
     delete_if_exists("tests/data/Muncie.bco04")
     delete_if_exists("Muncie.dss")
-
+    delete_if_exists(TEST_MANIFEST_TEMP_FILE)
+    delete_if_exists(TEST_BATCH_HDF_TEMP_FILE)
+    shutil.rmtree(TEST_ENSEMBLE_TEMP_DIR, ignore_errors=True)
+    shutil.rmtree(TEST_EXPORT_TEMP_DIR, ignore_errors=True)
 
 
 def test_create_plan_tmp_hdf():
@@ -47,3 +75,151 @@ def test_set_plan_hdf_hydrograph():
     # check that results were created
     with h5py.File(hdf_filepath, 'r') as file:
         assert "Results" in file.keys()
+
+
+def test_read_hydrograph_manifest():
+    """Test reading a JSON manifest of hydrograph updates"""
+    put_string(json.dumps([
+        {"name": "River: White  Reach: Muncie  RS: 15696.24", "src": "tests/data/hydrograph2.csv", "input_type": "CSV"},
+        {"name": "other", "src": "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/"}
+    ]), TEST_MANIFEST_TEMP_FILE)
+    entries = read_hydrograph_manifest(TEST_MANIFEST_TEMP_FILE)
+    assert len(entries) == 2
+    assert entries[0]['input_type'] == 'CSV'
+    assert entries[1]['input_type'] == 'DSS'
+    # each entry overwrites one hydrograph, so DSS pathname patterns are rejected
+    put_string(json.dumps([{"name": "other", "src": "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//*/Ex1/"}]),
+               TEST_MANIFEST_TEMP_FILE)
+    with pytest.raises(ValueError, match="pattern"):
+        read_hydrograph_manifest(TEST_MANIFEST_TEMP_FILE)
+
+
+def test_read_manifest_timeseries():
+    """Test reading the hydrographs of manifest entries concurrently"""
+    entries = [{"name": "a", "src": "tests/data/hydrograph2.csv", "input_type": "CSV"},
+               {"name": "b", "src": "tests/data/hydrograph.dss:/REGULAR/TIMESERIES/FLOW//1HOUR/Ex1/",
+                "input_type": "DSS"},
+               {"name": "c", "src": "tests/data/hydrograph2.csv", "input_type": "CSV"}]
+    hydrographs = read_manifest_timeseries(entries, max_workers=3)
+    assert list(hydrographs) == ["a", "b", "c"]
+    assert len(hydrographs["b"]) == 7
+    assert hydrographs["a"].equals(hydrographs["c"])
+
+
+def test_set_plan_hdf_hydrographs():
+    """Test updating hydrographs of HDF file from a manifest"""
+    hydrograph_name = "River: White  Reach: Muncie  RS: 15696.24"
+    copy_hdf("tests/data/Muncie.p04.hdf", TEST_BATCH_HDF_TEMP_FILE, ["Results"])
+    put_string(json.dumps([{"name": hydrograph_name, "src": "tests/data/hydrograph2.csv"}]), TEST_MANIFEST_TEMP_FILE)
+    runner = CliRunner()
+    result = runner.invoke(set_plan_hdf_hydrographs, [
+        TEST_BATCH_HDF_TEMP_FILE, TEST_MANIFEST_TEMP_FILE, "--keep_dates", "--input_type", "CSV"])
+    assert result.exit_code == 0
+    with h5py.File(TEST_BATCH_HDF_TEMP_FILE, 'r') as file:
+        dataset = file["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + hydrograph_name]
+        assert dataset[16][1] == 22000
+
+
+def test_set_plan_hdf_hydrograph_clip_parquet():
+    """Test only the row groups of a PARQUET hydrograph in the simulation window, and the samples next to it, are
+    read when hydrographs are clipped"""
+    hydrograph_name = "River: White  Reach: Muncie  RS: 15696.24"
+    parquet_filepath = get_temp_file(ext=".parquet")
+    # hourly values from 12 days before to 12 days after the 2000-01-01 to 2000-01-10 simulation window
+    times = pd.date_range("1999-12-20 00:20", "2000-01-22", freq="3600s")
+    pd.DataFrame({'time': times, 'value': np.arange(len(times), dtype='float32')}) \
+        .to_parquet(parquet_filepath, row_group_size=24)
+    copy_hdf("tests/data/Muncie.p04.hdf", TEST_BATCH_HDF_TEMP_FILE, ["Results"])
+    metrics_util.start_recording()
+    try:
+        result = CliRunner().invoke(set_plan_hdf_hydrograph, [
+            TEST_BATCH_HDF_TEMP_FILE, hydrograph_name, parquet_filepath, "--input_type", "PARQUET", "--clip",
+            "--resample", "30min"])
+    finally:
+        records = metrics_util.stop_recording()
+    delete_if_exists(parquet_filepath)
+    assert result.exit_code == 0
+    read_parquet = [record for record in records if record['stage'] == 'read_parquet']
+    # 9 days in the window and the days before and after it out of 33 days
+    assert read_parquet[0]['row_groups'] == 11
+    assert read_parquet[0]['rows'] == 9 * 24 + 2
+    with h5py.File(TEST_BATCH_HDF_TEMP_FILE, 'r') as file:
+        dataset = file["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + hydrograph_name]
+        assert dataset.shape[0] == 9 * 48 + 1
+        # values at the window edges are interpolated from the samples just outside of it
+        assert dataset[0][1] == pytest.approx(12 * 24 - 1 / 3)
+        assert dataset[-1][1] == pytest.approx(21 * 24 - 1 / 3)
+
+
+def test_create_plan_ensemble():
+    """Test creating plan variants from a base plan in a process pool"""
+    hydrograph_name = "River: White  Reach: Muncie  RS: 15696.24"
+    put_string(json.dumps([
+        {"output": f"Muncie{i}.p04.hdf", "name": hydrograph_name, "src": "tests/data/hydrograph2.csv"} for i in range(3)
+    ]), TEST_MANIFEST_TEMP_FILE)
+    runner = CliRunner()
+    result = runner.invoke(create_plan_ensemble, [
+        "tests/data/Muncie.p04.hdf", TEST_MANIFEST_TEMP_FILE, TEST_ENSEMBLE_TEMP_DIR, "--input_type", "CSV",
+        "--workers", "2"])
+    assert result.exit_code == 0
+    assert "variants/sec" in result.output
+    for i in range(3):
+        with h5py.File(os.path.join(TEST_ENSEMBLE_TEMP_DIR, f"Muncie{i}.p04.hdf"), 'r') as file:
+            assert "Results" not in file.keys()
+            dataset = file["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + hydrograph_name]
+            assert dataset[16][1] == 22000
+
+
+def test_serve():
+    """Test running commands from JSON lines"""
+    hydrograph_name = "River: White  Reach: Muncie  RS: 15696.24"
+    copy_hdf("tests/data/Muncie.p04.hdf", TEST_BATCH_HDF_TEMP_FILE, ["Results"])
+    export_dir = tempfile.mkdtemp()
+    requests = [
+        {"id": 1, "command": "set-plan-hdf-hydrograph",
+         "args": [TEST_BATCH_HDF_TEMP_FILE, hydrograph_name, "tests/data/hydrograph2.csv", "--input_type", "CSV"]},
+        {"id": 2, "command": "delete-everything", "args": []},
+        # worker processes of the threaded server are spawned
+        {"id": 3, "command": "export-plan-hydrographs",
+         "args": ["tests/data/Muncie.p04.hdf", export_dir, "--workers", "2"]},
+    ]
+    runner = CliRunner()
+    result = runner.invoke(serve, ["--workers", "2"], input="\n".join(json.dumps(request) for request in requests))
+    assert result.exit_code == 0
+    responses = {response['id']: response for response in map(json.loads, result.stdout.splitlines())}
+    assert responses[1]['status'] == 'ok'
+    assert responses[2]['status'] == 'error'
+    assert responses[3]['status'] == 'ok'
+    assert os.listdir(export_dir) == ["plan=Muncie.p04"]
+    shutil.rmtree(export_dir)
+    with h5py.File(TEST_BATCH_HDF_TEMP_FILE, 'r') as file:
+        dataset = file["/Event Conditions/Unsteady/Boundary Conditions/Flow Hydrographs/" + hydrograph_name]
+        assert dataset[16][1] == 22000
+
+
+def test_plan_partitions():
+    """Test partition names are plan filenames, made unique with a hash of the URI when filenames repeat"""
+    partitions = plan_partitions(["s3://bucket/a/model.p01.hdf", "s3://bucket/b/model.p01.hdf", "model.p02.hdf"])
+    assert partitions[2] == "model.p02"
+    assert partitions[0].startswith("model.p01-")
+    assert len(set(partitions)) == 3
+
+
+def test_export_plan_hydrographs():
+    """Test exporting the hydrographs of many plans to a Parquet dataset partitioned by plan"""
+    import pandas as pd
+    hydrograph_name = "River: White  Reach: Muncie  RS: 15696.24"
+    copy_hdf("tests/data/Muncie.p04.hdf", TEST_BATCH_HDF_TEMP_FILE, ["Results"])
+    runner = CliRunner()
+    result = runner.invoke(set_plan_hdf_hydrograph, [
+        TEST_BATCH_HDF_TEMP_FILE, hydrograph_name, "tests/data/hydrograph2.csv", "--input_type", "CSV"])
+    assert result.exit_code == 0
+    result = runner.invoke(export_plan_hydrographs, [
+        "tests/data/Muncie.p0[4].hdf", TEST_BATCH_HDF_TEMP_FILE, TEST_EXPORT_TEMP_DIR, "--workers", "2"])
+    assert result.exit_code == 0
+    assert "plans/sec" in result.output
+    table = pd.read_parquet(TEST_EXPORT_TEMP_DIR)
+    assert set(table['plan_uri']) == {os.path.abspath("tests/data/Muncie.p04.hdf"), TEST_BATCH_HDF_TEMP_FILE}
+    updated = table[(table['plan_uri'] == TEST_BATCH_HDF_TEMP_FILE) & (table['name'] == hydrograph_name)]
+    assert updated['value'].iloc[16] == 22000
+    assert set(updated['river']) == {"White"}
@@ -0,0 +1,52 @@
+"""Startup time regression tests for the CLI"""
+import subprocess
+import sys
+import time
+import pytest
+from tests.test_util import delete_if_exists
+
+HEAVY_MODULES = ['pandas', 'h5py', 'pyarrow', 'pydsstools', 'fsspec']
+# generous budget per cold start so the tests only catch regressions like importing pandas on startup
+STARTUP_BUDGET_SECONDS = 1.0
+COMMANDS = ['create-plan-tmp-hdf', 'set-plan-hdf-hydrograph', 'set-plan-hdf-hydrographs', 'create-plan-ensemble',
+            'set-plan-hdf-gridded-precipitation', 'repack-hdf', 'export-plan-hydrographs', 'index-hdf',
+            'extract-results', 'stage-plan-run', 'list-dss-pathnames', 'serve', 'cache-info']
+
+
+def teardown_module():
+    """Cleanup created test files."""
+    delete_if_exists("tests/data/Muncie.p04.tmp.hdf")
+
+
+def imported_modules(code: str) -> list:
+    """Run python code in a new interpreter and return the heavy modules it imported."""
+    check = f"import sys\n{code}\nprint(','.join(m for m in {HEAVY_MODULES} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", check], check=True, capture_output=True, text=True).stdout
+    return [module for module in output.strip().split(',') if module]
+
+
+def test_import_is_light():
+    """Test importing the CLI does not import heavy dependencies"""
+    assert imported_modules("import ras_remodeler") == []
+
+
+def test_create_plan_tmp_hdf_imports():
+    """Test create-plan-tmp-hdf does not import pandas or hydrograph readers"""
+    modules = imported_modules(
+        "import ras_remodeler\n"
+        "ras_remodeler.main.main(['create-plan-tmp-hdf', 'tests/data/Muncie.p04.hdf'], standalone_mode=False)")
+    assert 'h5py' in modules
+    assert 'pandas' not in modules
+    assert 'pydsstools' not in modules
+    assert 'pyarrow' not in modules
+
+
+@pytest.mark.parametrize("command", [None] + COMMANDS)
+def test_cold_start_time(command):
+    """Benchmark cold start of each subcommand (run with -s to print times)"""
+    args = [sys.executable, "ras_remodeler.py"] + ([command] if command else []) + ["--help"]
+    start = time.perf_counter()
+    subprocess.run(args, check=True, capture_output=True)
+    elapsed = time.perf_counter() - start
+    print(f"{command or 'ras_remodeler.py'} --help: {elapsed:.3f} s")
+    assert elapsed < STARTUP_BUDGET_SECONDS
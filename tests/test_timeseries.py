@@ -0,0 +1,97 @@
+"""Tests for preparing hydrographs"""
+import numpy as np
+import pandas as pd
+import pytest
+from timeseries_util import Timeseries, prepare_hydrograph, prepare_hydrographs
+from hdf_util import parse_ras_datetime, parse_ras_datetimes
+
+TIMES = pd.to_datetime(["2000-01-01 00:00", "2000-01-01 01:00", "2000-01-01 02:00", "2000-01-01 06:00",
+                        "2000-01-01 06:30"])
+TIMESERIES = pd.DataFrame({"time": TIMES, "value": [1.0, 2.0, np.nan, 6.0, 6.5]})
+
+
+def test_timeseries():
+    """Test the timeseries container uses arrays without copying and converts to and from dataframes"""
+    times = TIMES.to_numpy(dtype="datetime64[ns]")
+    values = np.arange(5, dtype=np.float32)
+    timeseries = Timeseries(times, values)
+    assert timeseries.time is times and timeseries.value is values
+    assert len(timeseries[1:3]) == 2
+    assert np.shares_memory(timeseries[1:3].value, values)
+    assert timeseries["time"] is times
+    with pytest.raises(KeyError):
+        timeseries["filled"]  # pylint: disable=pointless-statement
+    with pytest.raises(ValueError):
+        Timeseries(times, values[:4])
+    assert Timeseries.from_frame(timeseries.to_frame()).equals(timeseries)
+    assert Timeseries.from_frame(TIMESERIES.assign(time=TIMES.tz_localize("US/Eastern"))).equals(
+        Timeseries.from_frame(TIMESERIES))
+
+
+def test_prepare_hydrograph_resample():
+    """Test resampling to a regular interval and filling gaps"""
+    result = prepare_hydrograph(TIMESERIES, "1h")
+    assert list(result["time"]) == list(pd.date_range("2000-01-01", periods=7, freq=pd.Timedelta(hours=1)))
+    np.testing.assert_allclose(result["value"], [1, 2, 2.8, 3.6, 4.4, 5.2, 6], rtol=1e-6)
+    assert list(result["filled"]) == [False, False, True, True, True, True, False]
+    result = prepare_hydrograph(TIMESERIES, "1h", fill="ffill")
+    np.testing.assert_allclose(result["value"], [1, 2, 2, 2, 2, 2, 6])
+    with pytest.raises(ValueError):
+        prepare_hydrograph(TIMESERIES, "1h", fill="error")
+    # a max gap longer than the missing values is not a gap
+    assert not prepare_hydrograph(TIMESERIES, "1h", fill="error", max_gap="5h")["filled"].any()
+
+
+def test_prepare_hydrograph_clip():
+    """Test clipping to a simulation window"""
+    result = prepare_hydrograph(TIMESERIES, start=pd.Timestamp("2000-01-01 01:00"),
+                                end=pd.Timestamp("2000-01-01 06:00"))
+    assert list(result["time"]) == list(TIMES[1:4])
+    result = prepare_hydrograph(TIMESERIES, "1h", start=pd.Timestamp("1999-12-31 23:00"),
+                                end=pd.Timestamp("2000-01-01 02:00"))
+    assert len(result) == 4
+    assert list(result["filled"]) == [True, False, False, True]
+
+
+def test_prepare_hydrograph_validate():
+    """Test validating increasing times and non-negative flows, and that stage hydrographs can be negative"""
+    with pytest.raises(ValueError):
+        prepare_hydrograph(TIMESERIES.iloc[::-1])
+    assert len(prepare_hydrograph(TIMESERIES.iloc[::-1], validate=False)) == 5
+    with pytest.raises(ValueError, match="'b'"):
+        prepare_hydrographs({"a": TIMESERIES, "b": TIMESERIES.assign(value=-TIMESERIES["value"])})
+    negative = TIMESERIES.assign(value=-TIMESERIES["value"])
+    with pytest.raises(ValueError):
+        prepare_hydrograph(negative, boundary_type="LATERAL")
+    assert prepare_hydrograph(negative, boundary_type="STAGE")["value"][0] == -1
+    prepared = prepare_hydrographs({"stage": negative}, boundary_types={"stage": "STAGE"}, validate=True)
+    assert (prepared["stage"]["value"] <= 0).all()
+
+
+def test_prepare_hydrograph_large():
+    """Test preparing a million row irregular hydrograph"""
+    steps = np.random.default_rng(0).integers(1, 900, 1000000)
+    timeseries = pd.DataFrame({"time": pd.Timestamp("2000-01-01") + pd.to_timedelta(np.cumsum(steps), unit="s"),
+                               "value": np.ones(len(steps))})
+    result = prepare_hydrograph(timeseries, "15min")
+    assert (result["value"] == 1).all()
+    assert not result["filled"].any()
+
+
+def test_parse_ras_datetime():
+    """Test parsing HEC-RAS date strings"""
+    assert parse_ras_datetime("13Apr2019 0000") == pd.Timestamp("2019-04-13")
+    assert parse_ras_datetime("13APR2019 24:00:00") == pd.Timestamp("2019-04-14")
+    assert parse_ras_datetime("01Jan2000 12:30:15") == pd.Timestamp("2000-01-01 12:30:15")
+
+
+def test_parse_ras_datetimes():
+    """Test parsing arrays of HEC-RAS date strings gives the same datetimes as parsing each string"""
+    texts = np.array([b"13Apr2019 0000", b"13APR2019 24:00:00", b"01Jan2000 12:30:15", b"29FEB2020 23:59"])
+    expected = [np.datetime64(parse_ras_datetime(text.decode()), 's') for text in texts]
+    assert list(parse_ras_datetimes(texts)) == expected
+    assert list(parse_ras_datetimes(texts.astype(str))) == expected
+    assert parse_ras_datetimes(np.array([], dtype='S19')).dtype == np.dtype('datetime64[s]')
+    for text in [b"30FEB2020 0000", b"13XYZ2019 0000", b"13APR2019 00"]:
+        with pytest.raises(ValueError):
+            parse_ras_datetimes(np.array([text]))
@@ -0,0 +1,97 @@
+"""Tests for the scratch workspace"""
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import pytest
+from fs_util import get_temp_file, temp_file
+from workspace_util import WORKSPACE_PREFIX, Workspace, configure_workspace, remove_stale_workspaces, _hostname
+
+TEST_SCRATCH_DIR = None
+
+
+def setup_module():
+    """Create fast and fallback scratch roots."""
+    global TEST_SCRATCH_DIR
+    TEST_SCRATCH_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    """Reset the workspace and cleanup the scratch roots."""
+    configure_workspace()
+    shutil.rmtree(TEST_SCRATCH_DIR)
+
+
+def _write(filepath: str, size: int) -> None:
+    with open(filepath, 'wb') as file:
+        file.write(b'0' * size)
+
+
+def test_workspace_budget():
+    """Test files that do not fit in the budget of the fast root are created under the fallback root"""
+    fast, slow = os.path.join(TEST_SCRATCH_DIR, "fast"), os.path.join(TEST_SCRATCH_DIR, "slow")
+    with Workspace([(fast, 1000), (slow, None)]) as workspace:
+        first = workspace.temp_path(size=600)
+        assert first.startswith(workspace.dirs[0])
+        # the first file is reserved before it is written
+        assert workspace.temp_path(size=600).startswith(workspace.dirs[1])
+        _write(first, 600)
+        workspace.release(first)
+        second = workspace.temp_path(size=300)
+        assert second.startswith(workspace.dirs[0])
+        workspace.remove(first)
+        workspace.remove(second)
+        assert workspace.temp_path(size=1000).startswith(workspace.dirs[0])
+        assert workspace.temp_path(size=1001).startswith(workspace.dirs[1])
+        assert [usage['max_bytes'] for usage in workspace.usage()] == [1000, None]
+    assert not os.path.exists(workspace.dirs[0]) and not os.path.exists(workspace.dirs[1])
+
+
+def test_temp_file_cleanup():
+    """Test temp files are removed when the context exits with an exception and when a copy fails"""
+    workspace = configure_workspace(os.path.join(TEST_SCRATCH_DIR, "fast"), 10**6,
+                                    os.path.join(TEST_SCRATCH_DIR, "slow"))
+    src_filepath = os.path.join(TEST_SCRATCH_DIR, "src.bin")
+    _write(src_filepath, 1000)
+    with pytest.raises(RuntimeError):
+        with temp_file(src_filepath) as filepath:
+            assert os.path.getsize(filepath) == 1000
+            raise RuntimeError()
+    assert not os.path.exists(filepath)
+    with pytest.raises(FileNotFoundError):
+        get_temp_file(os.path.join(TEST_SCRATCH_DIR, "missing.bin"))
+    assert os.listdir(workspace.dirs[0]) == []
+    # the same configuration keeps the workspace and its temp files
+    filepath = get_temp_file(src_filepath)
+    assert configure_workspace(os.path.join(TEST_SCRATCH_DIR, "fast"), 10**6,
+                               os.path.join(TEST_SCRATCH_DIR, "slow")) is workspace
+    assert os.path.exists(filepath)
+
+
+def test_remove_stale_workspaces():
+    """Test workspaces of processes that are not running are removed"""
+    process = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True,
+                             check=True, text=True)
+    stale = os.path.join(TEST_SCRATCH_DIR, f"{WORKSPACE_PREFIX}{_hostname()}-{process.stdout.strip()}-00000000")
+    running = os.path.join(TEST_SCRATCH_DIR, f"{WORKSPACE_PREFIX}{_hostname()}-{os.getpid()}-00000000")
+    os.makedirs(stale)
+    os.makedirs(running)
+    assert remove_stale_workspaces(TEST_SCRATCH_DIR) == [stale]
+    assert os.path.exists(running)
+    shutil.rmtree(running)
+
+
+def test_workspace_removed_on_sigterm():
+    """Test the workspace is removed when the process is terminated"""
+    root = os.path.join(TEST_SCRATCH_DIR, "signal")
+    script = ("import sys, time; from workspace_util import configure_workspace; "
+              f"workspace = configure_workspace({root!r}); open(workspace.temp_path(), 'w').close(); "
+              "print(workspace.dirs[0], flush=True); time.sleep(60)")
+    with subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True) as process:
+        workspace_dir = process.stdout.readline().strip()
+        assert os.listdir(workspace_dir)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == -signal.SIGTERM
+    assert not os.path.exists(workspace_dir)
@@ -0,0 +1,257 @@
+"""
+Timeseries container and preparation of hydrographs before they are written to a plan HDF file.
+Hydrographs are read into Timeseries objects holding NumPy arrays of times and values, which are passed from the readers
+to the HDF writer without building pandas dataframes. Hydrographs are resampled to a regular interval, gaps are filled
+and flagged, the series is clipped to the simulation window of the plan and the result is validated. All steps work on
+NumPy arrays of int64 nanoseconds so they stay fast on series with millions of rows.
+"""
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Tuple, Union
+import numpy as np
+from metrics_util import stage
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas is only imported to parse intervals and to convert dataframes so hdf_util can use Timeseries without loading
+# it (see tests/test_startup.py).
+# pylint: disable=import-outside-toplevel
+
+FILL_METHODS = ['interpolate', 'ffill', 'error']
+# boundary types (see hdf_util.HYDROGRAPH_GROUPS) whose values must not be negative. Stage elevations can be.
+NON_NEGATIVE_BOUNDARY_TYPES = ['FLOW', 'LATERAL']
+TIME_DTYPE = np.dtype('datetime64[ns]')
+VALUE_DTYPE = np.dtype(np.float32)
+
+
+class Timeseries:
+    """Times and values of a hydrograph. Times are datetime64[ns] and values are float32, and arrays that already have
+    those dtypes are used without copying. Columns can also be read by name like a dataframe, e.g. ts['time'], and
+    slicing or indexing with an array returns a new Timeseries.
+
+    Args:
+        time (np.ndarray): times
+        value (np.ndarray): values
+        filled (Union[np.ndarray, None], optional): flags of values filled in gaps by prepare_hydrograph. Defaults to
+        None.
+    """
+    __slots__ = ['time', 'value', 'filled']
+
+    def __init__(self, time: Any, value: Any, filled: Union[np.ndarray, None] = None):
+        self.time = _as_dtype(time, TIME_DTYPE)
+        self.value = _as_dtype(value, VALUE_DTYPE)
+        self.filled = filled
+        if self.time.shape != self.value.shape or self.time.ndim != 1:
+            raise ValueError(f"Timeseries times and values must be 1D arrays of the same length but found shapes "
+                             f"{self.time.shape} and {self.value.shape}")
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, key: Any) -> Union[np.ndarray, 'Timeseries']:
+        if isinstance(key, str):
+            if key not in self.__slots__ or (key == 'filled' and self.filled is None):
+                raise KeyError(key)
+            return getattr(self, key)
+        return Timeseries(self.time[key], self.value[key], self.filled[key] if self.filled is not None else None)
+
+    def __repr__(self) -> str:
+        return f"Timeseries({len(self)} rows, {self.time[0] if len(self) else None} to " \
+               f"{self.time[-1] if len(self) else None})"
+
+    def equals(self, other: 'Timeseries') -> bool:
+        """Check if another timeseries has the same times and values"""
+        return np.array_equal(self.time, other.time) and np.array_equal(self.value, other.value, equal_nan=True)
+
+    @classmethod
+    def from_frame(cls, frame: 'pd.DataFrame') -> 'Timeseries':
+        """Create a timeseries from a dataframe with 'time' and 'value' columns. Times with a time zone are kept as
+        local times."""
+        times = frame['time']
+        if getattr(getattr(times, 'dt', None), 'tz', None) is not None:
+            times = times.dt.tz_localize(None)
+        return cls(times.to_numpy(dtype='datetime64[ns]'), frame['value'].to_numpy(dtype=np.float32))
+
+    def to_frame(self) -> 'pd.DataFrame':
+        """Get a dataframe with 'time' and 'value' columns (and 'filled' if set)"""
+        import pandas as pd
+        columns = {'time': self.time, 'value': self.value}
+        if self.filled is not None:
+            columns['filled'] = self.filled
+        return pd.DataFrame(columns)
+
+
+def as_timeseries(timeseries: Union[Timeseries, 'pd.DataFrame']) -> Timeseries:
+    """Get a Timeseries from a Timeseries or a dataframe with 'time' and 'value' columns"""
+    return timeseries if isinstance(timeseries, Timeseries) else Timeseries.from_frame(timeseries)
+
+
+def prepare_hydrograph(timeseries: Union[Timeseries, 'pd.DataFrame'],
+                       interval: Union[str, 'pd.Timedelta', None] = None,
+                       fill: str = 'interpolate',
+                       max_gap: Union[str, 'pd.Timedelta', None] = None,
+                       start: Union[datetime, None] = None,
+                       end: Union[datetime, None] = None,
+                       validate: bool = True,
+                       boundary_type: str = 'FLOW') -> Timeseries:
+    """Resample, gap fill, clip and validate a hydrograph. Rows with missing (NaN) values are dropped before
+    resampling, so they are filled like any other gap.
+
+    Args:
+        timeseries (Union[Timeseries, pd.DataFrame]): hydrograph
+        interval (Union[str, pd.Timedelta, None], optional): interval to resample to (e.g. '1h' or '15min'). Defaults
+        to None, which keeps the times of the hydrograph.
+        fill (str, optional): how values in gaps are filled. One of FILL_METHODS: 'interpolate' (linear
+        interpolation), 'ffill' (last value before the gap) or 'error' (raise a ValueError). Defaults to
+        'interpolate'.
+        max_gap (Union[str, pd.Timedelta, None], optional): longest time between two values that is not a gap.
+        Defaults to None, which uses the larger of interval and the median time between values.
+        start (Union[datetime, None], optional): drop times before start and start the resampled times at start.
+        Defaults to None.
+        end (Union[datetime, None], optional): drop times after end. Defaults to None.
+        validate (bool, optional): raise a ValueError if times are not increasing, or if values are negative for
+        boundary types in NON_NEGATIVE_BOUNDARY_TYPES. Defaults to True.
+        boundary_type (str, optional): boundary type of the hydrograph: 'FLOW', 'STAGE' or 'LATERAL'. Defaults to
+        'FLOW'.
+
+    Raises:
+        ValueError
+
+    Returns:
+        Timeseries: prepared hydrograph with 'filled' flags that are True for values that were filled in a gap or
+        outside the times of the source hydrograph.
+    """
+    if fill not in FILL_METHODS:
+        raise ValueError(f"Invalid fill method. Must be one of {FILL_METHODS} but found {fill}")
+    with stage('prepare_hydrograph', rows=len(timeseries)) as current:
+        times, values = _to_arrays(as_timeseries(timeseries))
+        if validate:
+            _check_increasing(times)
+        else:
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        known = ~np.isnan(values)
+        known_times, known_values = times[known], values[known]
+        if len(known_times) == 0:
+            raise ValueError("Hydrograph has no values")
+        step = _to_nanoseconds(interval) if interval is not None else None
+        if step is not None and step <= 0:
+            raise ValueError(f"Resample interval must be positive but found {interval}")
+        first = int(np.datetime64(start, 'ns').astype(np.int64)) if start is not None else None
+        last = int(np.datetime64(end, 'ns').astype(np.int64)) if end is not None else None
+        if step is not None:
+            grid_start = first if first is not None else times[0]
+            grid_end = last if last is not None else times[-1]
+            grid = np.arange(grid_start, grid_end + 1, step, dtype=np.int64)
+        else:
+            in_window = np.ones(len(times), dtype=bool)
+            if first is not None:
+                in_window &= times >= first
+            if last is not None:
+                in_window &= times <= last
+            grid = times[in_window]
+        gap = _max_gap(known_times, step, max_gap)
+        grid_values, filled = _fill(known_times, known_values, grid, gap, fill)
+        if validate and boundary_type in NON_NEGATIVE_BOUNDARY_TYPES:
+            _check_non_negative(grid, grid_values)
+        current.labels['rows_out'] = len(grid)
+        current.labels['filled'] = int(filled.sum())
+    return Timeseries(grid.astype('datetime64[ns]'), grid_values.astype(np.float32), filled)
+
+
+def prepare_hydrographs(hydrographs: Dict[str, Union[Timeseries, 'pd.DataFrame']],
+                        boundary_types: Union[Dict[str, str], None] = None, **options) -> Dict[str, Timeseries]:
+    """Prepare a batch of hydrographs with the same options (see prepare_hydrograph).
+
+    Args:
+        hydrographs (Dict[str, Union[Timeseries, pd.DataFrame]]): mapping of hydrograph name to timeseries data
+        boundary_types (Union[Dict[str, str], None], optional): mapping of hydrograph name to boundary type.
+        Hydrographs without one are 'FLOW'. Defaults to None.
+        **options: options of prepare_hydrograph
+
+    Raises:
+        ValueError: if a hydrograph is invalid. The message names the hydrograph.
+
+    Returns:
+        Dict[str, Timeseries]: mapping of hydrograph name to prepared timeseries data
+    """
+    with stage('prepare_hydrographs', hydrographs=len(hydrographs)):
+        prepared = {}
+        for name, timeseries in hydrographs.items():
+            try:
+                prepared[name] = prepare_hydrograph(timeseries, boundary_type=(boundary_types or {}).get(
+                    name, 'FLOW'), **options)
+            except ValueError as exc:
+                raise ValueError(f"Hydrograph '{name}': {exc}") from exc
+    return prepared
+
+
+def _as_dtype(array: Any, dtype: np.dtype) -> np.ndarray:
+    """Convert to an array of dtype, using arrays that already have the dtype without copying (np.asarray copies
+    datetime64 arrays)"""
+    if isinstance(array, np.ndarray) and array.dtype == dtype:
+        return array
+    return np.asarray(array, dtype=dtype)
+
+
+def _to_arrays(timeseries: Timeseries) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the times of a hydrograph as int64 nanoseconds and the values as float64"""
+    return timeseries.time.view(np.int64), timeseries.value.astype(np.float64)
+
+
+def _to_nanoseconds(interval: Union[str, 'pd.Timedelta']) -> int:
+    """Parse an interval (e.g. '1h' or '15min') to nanoseconds"""
+    import pandas as pd
+    return pd.Timedelta(interval).value
+
+
+def _format_time(nanoseconds: int) -> str:
+    """Format int64 nanoseconds as a time e.g. 2000-01-01 06:00:00"""
+    return str(np.datetime64(int(nanoseconds), 'ns').astype('datetime64[s]')).replace('T', ' ')
+
+
+def _max_gap(known_times: np.ndarray, step: Union[int, None], max_gap: Union[str, 'pd.Timedelta', None]) -> int:
+    """Longest time in nanoseconds between two values that is not a gap"""
+    if max_gap is not None:
+        return _to_nanoseconds(max_gap)
+    median_step = int(np.median(np.diff(known_times))) if len(known_times) > 1 else 0
+    return max(step or 0, median_step)
+
+
+def _fill(known_times: np.ndarray, known_values: np.ndarray, grid: np.ndarray, max_gap: int,
+          fill: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Get values at the grid times from the known values and flag the grid times that are in gaps"""
+    # index of the first known time after each grid time
+    after = np.searchsorted(known_times, grid, side='right')
+    before = np.clip(after - 1, 0, len(known_times) - 1)
+    exact = known_times[before] == grid
+    outside = (after == 0) | ((after == len(known_times)) & ~exact)
+    span = known_times[np.clip(after, 0, len(known_times) - 1)] - known_times[before]
+    filled = outside | (~exact & (span > max_gap))
+    if fill == 'error' and filled.any():
+        raise ValueError(f"Hydrograph has {int(filled.sum())} times in gaps, first at "
+                         f"{_format_time(grid[np.argmax(filled)])}")
+    interpolated = np.interp(grid, known_times, known_values)
+    if fill == 'ffill':
+        values = np.where(filled, known_values[before], interpolated)
+    else:
+        values = interpolated
+    return values, filled
+
+
+def _check_increasing(times: np.ndarray) -> None:
+    """Raise a ValueError if times are not strictly increasing"""
+    not_increasing = np.diff(times) <= 0
+    if not_increasing.any():
+        index = int(np.argmax(not_increasing)) + 1
+        raise ValueError(f"Hydrograph times must be strictly increasing but found {_format_time(times[index])} after "
+                         f"{_format_time(times[index - 1])}")
+
+
+def _check_non_negative(times: np.ndarray, values: np.ndarray) -> None:
+    """Raise a ValueError if any value is negative"""
+    negative = values < 0
+    if negative.any():
+        index = int(np.argmax(negative))
+        raise ValueError(f"Hydrograph has {int(negative.sum())} negative values, first at "
+                         f"{_format_time(times[index])} ({values[index]})")
@@ -0,0 +1,265 @@
+"""
+Scratch workspace for the temp files of a process.
+Temp files are created in a directory per process under one or more scratch roots. The first root can be fast storage
+(e.g. /dev/shm) with a size budget. Files that would take it over budget, or that do not fit in its free space, are
+created under the next root instead. The workspace directories are removed when the process exits, including on
+SIGTERM and SIGHUP, and directories left by processes that were killed are removed when a workspace is configured.
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Union
+import atexit
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import uuid
+
+# prefix of the workspace directories created under each scratch root
+WORKSPACE_PREFIX = "ras_remodeler-"
+CLEANUP_SIGNALS = [signal.SIGTERM, signal.SIGHUP]
+
+
+class Workspace:
+    """Directories for the temp files of a process, one under each scratch root.
+
+    Args:
+        roots (List[Tuple[str, Union[int, None]]]): scratch roots in order of preference and their size budgets in
+        bytes (None for no budget). Roots are created if they do not exist.
+    """
+
+    def __init__(self, roots: List[Tuple[str, Union[int, None]]]):
+        if not roots:
+            raise ValueError("Workspace needs at least one scratch root")
+        self.roots = roots
+        self.pid = os.getpid()
+        name = f"{WORKSPACE_PREFIX}{_hostname()}-{self.pid}-{uuid.uuid4().hex[:8]}"
+        self.dirs = [os.path.join(root, name) for root, _ in roots]
+        self._reserved: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'Workspace':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
+
+    def temp_path(self, ext: str = "", size: Union[int, None] = None) -> str:
+        """Get a new temp filepath. No file is created. The file is placed under the first scratch root with room for
+        size bytes in its budget and free space, or under the last root if none has room. Files of unknown size are
+        placed under the first root that is under its budget. size bytes are reserved for the file until it is
+        released or removed, so files created at the same time do not all take the same room.
+
+        Args:
+            ext (str, optional): extension of the file (e.g. .hdf). Defaults to "".
+            size (Union[int, None], optional): expected size of the file in bytes. Defaults to None.
+
+        Returns:
+            str: temp filepath
+        """
+        with self._lock:
+            directory = self.dirs[-1]
+            for (_, max_bytes), candidate in zip(self.roots, self.dirs):
+                os.makedirs(candidate, exist_ok=True)
+                if _has_room(candidate, max_bytes, size or 0, self._reserved):
+                    directory = candidate
+                    break
+            os.makedirs(directory, exist_ok=True)
+            temp_filepath = os.path.join(directory, str(uuid.uuid4())) + ext
+            if size:
+                self._reserved[temp_filepath] = size
+        return temp_filepath
+
+    @contextmanager
+    def temp_file(self, ext: str = "", size: Union[int, None] = None) -> Iterator[str]:
+        """Get a new temp filepath (see temp_path) that is removed when the context exits, with or without an
+        exception."""
+        temp_filepath = self.temp_path(ext, size)
+        try:
+            yield temp_filepath
+        finally:
+            self.remove(temp_filepath)
+
+    def release(self, temp_filepath: str) -> None:
+        """Release the reserved space of a temp file once it is written, after which its size on disk is counted."""
+        with self._lock:
+            self._reserved.pop(temp_filepath, None)
+
+    def remove(self, temp_filepath: str) -> None:
+        """Remove a temp file if it exists and release its reserved space."""
+        self.release(temp_filepath)
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+    def usage(self) -> List[Dict[str, Union[str, int, None]]]:
+        """Get the bytes used and the budget of the workspace directory under each scratch root."""
+        return [{'dir': directory, 'bytes': _dir_size(directory), 'max_bytes': max_bytes}
+                for (_, max_bytes), directory in zip(self.roots, self.dirs)]
+
+    def cleanup(self) -> None:
+        """Remove the workspace directories and all temp files in them. Only the process that created the workspace
+        removes them, so forked worker processes leave the directories of their parent in place."""
+        if os.getpid() != self.pid:
+            return
+        with self._lock:
+            self._reserved.clear()
+        for directory in self.dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _has_room(directory: str, max_bytes: Union[int, None], size: int, reserved: Dict[str, int]) -> bool:
+    """Check if a file of size bytes fits in the budget and free space of a workspace directory"""
+    if shutil.disk_usage(directory).free < size:
+        return False
+    if max_bytes is None:
+        return True
+    used = _dir_size(directory, reserved)
+    return used + size <= max_bytes if size else used < max_bytes
+
+
+def _dir_size(directory: str, reserved: Union[Dict[str, int], None] = None) -> int:
+    """Bytes used by the files in a directory, counting reserved files at least at their reserved size"""
+    reserved = reserved or {}
+    used = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            size = entry.stat().st_size if entry.is_file() else _dir_size(entry.path)
+        except FileNotFoundError:
+            continue
+        used += max(size, reserved.get(entry.path, 0))
+    # reserved files that do not exist yet
+    used += sum(size for path, size in reserved.items()
+                if os.path.dirname(path) == directory and not os.path.exists(path))
+    return used
+
+
+def _hostname() -> str:
+    """Host name without characters that are not safe in a directory name"""
+    return "".join(char if char.isalnum() or char in '.-_' else '_' for char in socket.gethostname())
+
+
+def remove_stale_workspaces(root: str) -> List[str]:
+    """Remove the workspace directories under a scratch root that were left by processes on this host that are no
+    longer running (e.g. killed with SIGKILL or out of memory).
+
+    Args:
+        root (str): scratch root
+
+    Returns:
+        List[str]: removed directories
+    """
+    prefix = f"{WORKSPACE_PREFIX}{_hostname()}-"
+    removed = []
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return removed
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        # <prefix><pid>-<id>, other hosts with this host name as a prefix have more parts
+        parts = name[len(prefix):].split('-')
+        if len(parts) == 2 and parts[0].isdigit() and not _is_running(int(parts[0])):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed.append(os.path.join(root, name))
+    return removed
+
+
+def _is_running(pid: int) -> bool:
+    """Check if a process with the pid is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_WORKSPACE: Union[Workspace, None] = None
+# all workspaces configured in this process, removed at exit since their temp files may still be in use until then
+_WORKSPACES: List[Workspace] = []
+_PREVIOUS_HANDLERS: Dict[int, object] = {}
+_ATEXIT_REGISTERED = False
+
+
+def configure_workspace(scratch_dir: Union[str, None] = None, max_bytes: Union[int, None] = None,
+                        fallback_dir: Union[str, None] = None) -> Workspace:
+    """Set the workspace used by fs_util.get_temp_file and fs_util.temp_file. If the workspace has the same scratch
+    roots and budget as the current one, the current one is kept. Otherwise temp files already in the current one stay
+    until the process exits.
+
+    Args:
+        scratch_dir (Union[str, None], optional): preferred scratch root (e.g. /dev/shm). Defaults to None (only use
+        fallback_dir).
+        max_bytes (Union[int, None], optional): size budget of the workspace under scratch_dir. Defaults to None (no
+        budget, limited by the free space of scratch_dir).
+        fallback_dir (Union[str, None], optional): scratch root for files that do not fit under scratch_dir. Defaults
+        to None (the system temp directory).
+
+    Returns:
+        Workspace: the configured workspace
+    """
+    global _WORKSPACE  # pylint: disable=global-statement
+    roots: List[Tuple[str, Union[int, None]]] = []
+    if scratch_dir:
+        roots.append((scratch_dir, max_bytes))
+    fallback_dir = fallback_dir or tempfile.gettempdir()
+    if not roots or os.path.abspath(fallback_dir) != os.path.abspath(scratch_dir):
+        roots.append((fallback_dir, None))
+    if _WORKSPACE is not None and _WORKSPACE.roots == roots and _WORKSPACE.pid == os.getpid():
+        return _WORKSPACE
+    for root, _ in roots:
+        os.makedirs(root, exist_ok=True)
+        remove_stale_workspaces(root)
+    _WORKSPACE = Workspace(roots)
+    _WORKSPACES.append(_WORKSPACE)
+    _register_cleanup()
+    return _WORKSPACE
+
+
+def get_workspace() -> Workspace:
+    """Get the configured workspace, or a workspace in the system temp directory if none is configured."""
+    if _WORKSPACE is None:
+        return configure_workspace()
+    return _WORKSPACE
+
+
+def _cleanup() -> None:
+    """Remove the workspaces configured in this process"""
+    for workspace in _WORKSPACES:
+        workspace.cleanup()
+
+
+def _handle_signal(signum: int, frame: object) -> None:
+    """Remove the workspaces, then handle the signal as before the workspace was configured"""
+    _cleanup()
+    previous = _PREVIOUS_HANDLERS.get(signum, signal.SIG_DFL)
+    if callable(previous):
+        previous(signum, frame)
+        return
+    if previous == signal.SIG_IGN:
+        return
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def _register_cleanup() -> None:
+    """Remove the workspaces at exit and on CLEANUP_SIGNALS. KeyboardInterrupt (SIGINT) exits through atexit."""
+    global _ATEXIT_REGISTERED  # pylint: disable=global-statement
+    if not _ATEXIT_REGISTERED:
+        atexit.register(_cleanup)
+        _ATEXIT_REGISTERED = True
+    # signal handlers can only be set in the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for signum in CLEANUP_SIGNALS:
+        if signum in _PREVIOUS_HANDLERS:
+            continue
+        _PREVIOUS_HANDLERS[signum] = signal.getsignal(signum)
+        signal.signal(signum, _handle_signal)